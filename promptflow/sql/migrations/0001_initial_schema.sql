@@ -14,6 +14,10 @@ CREATE TABLE IF NOT EXISTS graphs (
   created TIMESTAMP NOT NULL DEFAULT current_timestamp,
   image bytea
 );
+
+-- bumped on every save, so workers can tell if a cached flowchart is stale
+ALTER TABLE graphs ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 1;
+
 -- Nodes
 CREATE TABLE IF NOT EXISTS nodes (
   id SERIAL PRIMARY KEY NOT NULL,
@@ -89,6 +93,16 @@ CREATE TABLE IF NOT EXISTS job_outputs (
 
 INSERT INTO job_output_types (type) VALUES ('JSON'), ('TEXT'), ('URL') ON CONFLICT (type) DO UPDATE SET type = EXCLUDED.type;
 
+-- latest resumable point of a job, overwritten after every node
+CREATE TABLE IF NOT EXISTS job_checkpoints (
+   job_id bigint PRIMARY KEY REFERENCES jobs(id) ON DELETE CASCADE ON UPDATE CASCADE NOT NULL,
+   phase TEXT NOT NULL,
+   node TEXT,
+   state jsonb NOT NULL,
+   queue jsonb NOT NULL,
+   created timestamp NOT NULL DEFAULT current_timestamp
+);
+
 CREATE OR REPLACE VIEW jobs_view AS
   SELECT 
     j.id,
@@ -227,6 +241,8 @@ BEGIN
 
   IF g_id IS NULL THEN
     INSERT INTO graphs ("label", "uid") VALUES (v_label, v_uid) RETURNING id INTO g_id;
+  ELSE
+    UPDATE graphs SET version = version + 1 WHERE id = g_id;
   END IF;
 
   DELETE FROM nodes n WHERE n.graph_id = g_id;
@@ -317,5 +333,6 @@ INSERT INTO node_types (name) VALUES
      ('JSONImageFile'),
      ('SaveImageNode'),
      ('StartNode'),
-     ('UserInputNode')
+     ('UserInputNode'),
+     ('JoinNode')
 ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name;
\ No newline at end of file
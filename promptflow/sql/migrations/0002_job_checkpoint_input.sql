@@ -0,0 +1,2 @@
+-- set while a job is suspended until the user posts input
+ALTER TABLE job_checkpoints ADD COLUMN IF NOT EXISTS awaiting_input BOOLEAN NOT NULL DEFAULT FALSE;
@@ -0,0 +1,78 @@
+-- keep each job's latest status on the job itself, so reading it doesn't
+-- scan the job's status history
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS current_status TEXT REFERENCES job_statuses(status) ON UPDATE CASCADE;
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS updated timestamp;
+
+CREATE INDEX IF NOT EXISTS idx_job_status_job_id_created ON job_status(job_id, created DESC) INCLUDE (status_id);
+CREATE INDEX IF NOT EXISTS idx_job_metadata_job_id ON job_metadata(job_id);
+CREATE INDEX IF NOT EXISTS idx_job_logs_job_id_created ON job_logs(job_id, created);
+CREATE INDEX IF NOT EXISTS idx_job_outputs_job_id ON job_outputs(job_id) INCLUDE (output_type);
+CREATE INDEX IF NOT EXISTS idx_jobs_graph_uid_id ON jobs(graph_uid, id DESC);
+CREATE INDEX IF NOT EXISTS idx_jobs_current_status_id ON jobs(current_status, id DESC);
+
+UPDATE jobs j SET
+  current_status = latest.status,
+  updated = latest.created
+FROM (
+  SELECT DISTINCT ON (js.job_id)
+    js.job_id,
+    jss.status,
+    js.created
+  FROM
+    job_status js
+  JOIN job_statuses jss ON
+    jss.id = js.status_id
+  ORDER BY
+    js.job_id,
+    js.created DESC
+) AS latest
+WHERE latest.job_id = j.id;
+
+CREATE OR REPLACE VIEW jobs_view AS
+  SELECT
+    j.id,
+    j.current_status status,
+    j.created,
+    j.updated,
+    jm.metadata,
+    j.graph_id,
+    j.graph_uid
+  FROM
+    jobs j
+  LEFT JOIN job_metadata jm ON jm.job_id = j.id
+  WHERE
+    j.current_status IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION update_job_status (inp jsonb) RETURNS TABLE (id integer, status TEXT, created timestamp, updated timestamp, metadata jsonb, graph_id integer, graph_uid TEXT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  s TEXT := inp->>'status';
+  s_id integer;
+  job_id integer := inp->>'jobId';
+BEGIN
+  IF s IS NULL THEN RAISE EXCEPTION 'Status is required'; END IF;
+  IF job_id IS NULL THEN RAISE EXCEPTION 'Job ID is required'; END IF;
+  SELECT js.id INTO s_id FROM job_statuses js WHERE js.status=s;
+  IF s_id IS NULL THEN RAISE EXCEPTION 'Invalid status'; END IF;
+
+  INSERT INTO job_status (status_id, job_id) VALUES (s_id, job_id);
+  UPDATE jobs j SET current_status = s, updated = current_timestamp WHERE j.id = job_id;
+
+  RETURN query SELECT jv.id, jv.status, jv.created, jv.updated, jv.metadata, jv.graph_id, jv.graph_uid FROM jobs_view jv WHERE jv.id=job_id;
+END $$;
+
+CREATE OR REPLACE FUNCTION create_job(inp jsonb) RETURNS TABLE (id integer, status TEXT, created timestamp, updated timestamp, metadata jsonb, graph_id integer, graph_uid TEXT) LANGUAGE plpgsql
+AS $$
+DECLARE
+  job_id integer;
+  graph_id integer := inp->>'graphId';
+  graph_uid TEXT;
+BEGIN
+  IF graph_id IS NULL THEN RAISE EXCEPTION 'Graph ID is required'; END IF;
+  SELECT g.uid INTO graph_uid FROM graphs g WHERE g.id = graph_id;
+  INSERT INTO jobs (graph_id, graph_uid, current_status, updated) VALUES (graph_id, graph_uid, 'PENDING', current_timestamp) RETURNING jobs.id INTO job_id;
+  INSERT INTO job_metadata (metadata, job_id) VALUES (inp, job_id);
+  INSERT INTO job_status (status_id, job_id) SELECT s.id, job_id FROM job_statuses s WHERE s.status='PENDING';
+  RETURN query SELECT jv.id, jv.status, jv.created, jv.updated, jv.metadata, jv.graph_id, jv.graph_uid FROM jobs_view jv WHERE jv.id=job_id;
+END $$;
@@ -0,0 +1,4 @@
+-- ids give job logs a stable order to page through
+ALTER TABLE job_logs ADD COLUMN IF NOT EXISTS id bigserial PRIMARY KEY;
+CREATE INDEX IF NOT EXISTS idx_job_logs_job_id_id ON job_logs(job_id, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_updated ON jobs(updated);
@@ -0,0 +1,39 @@
+CREATE INDEX IF NOT EXISTS idx_branches_graph_id_node ON branches(graph_id, node);
+
+-- a whole flowchart as one document, so it loads in a single round trip
+-- without repeating each node once per outgoing branch
+CREATE OR REPLACE FUNCTION graph_document(TEXT) RETURNS jsonb LANGUAGE sql STABLE
+AS $$
+  SELECT jsonb_build_object(
+    'id', g.id,
+    'uid', g.uid,
+    'label', g."label",
+    'created', g.created,
+    'version', g.version,
+    'nodes', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object(
+        'uid', n.uid,
+        'label', n."label",
+        'node_type', nt."name",
+        'node_type_id', n.node_type_id,
+        'metadata', n.metadata
+      ) ORDER BY n.id)
+      FROM nodes n
+      JOIN node_types nt ON nt.id = n.node_type_id
+      WHERE n.graph_id = g.id
+    ), '[]'::jsonb),
+    'branches', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object(
+        'id', b.id,
+        'prev', b.node,
+        'next', b.next_node,
+        'label', b."label",
+        'conditional', b.conditional
+      ) ORDER BY b.id)
+      FROM branches b
+      WHERE b.graph_id = g.id
+    ), '[]'::jsonb)
+  )
+  FROM graphs g
+  WHERE g.uid = $1;
+$$;
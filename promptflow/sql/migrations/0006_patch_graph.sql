@@ -0,0 +1,128 @@
+CREATE INDEX IF NOT EXISTS idx_branches_graph_id_uid ON branches(graph_id, uid);
+
+-- apply node and branch changes to a graph, touching only the rows named
+-- in the patch, and return the graph's new version
+CREATE OR REPLACE FUNCTION patch_graph(p_input JSONB) RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_uid TEXT := p_input ->> 'uid';
+  v_expected integer := (p_input ->> 'version') :: integer;
+  g_id integer;
+  g_version integer;
+BEGIN
+  IF v_uid IS NULL THEN RAISE EXCEPTION 'UID is required for patch'; END IF;
+
+  SELECT g.id, g.version INTO g_id, g_version FROM graphs g WHERE g."uid" = v_uid FOR UPDATE;
+  IF g_id IS NULL THEN
+    RAISE EXCEPTION 'Graph % not found', v_uid USING ERRCODE = 'no_data_found';
+  END IF;
+  IF v_expected IS NOT NULL AND v_expected <> g_version THEN
+    RAISE EXCEPTION 'Graph % is at version %, not %', v_uid, g_version, v_expected
+      USING ERRCODE = 'serialization_failure';
+  END IF;
+
+  IF p_input ? 'label' THEN
+    UPDATE graphs SET "label" = p_input ->> 'label' WHERE id = g_id;
+  END IF;
+
+  DELETE FROM branches b
+  WHERE b.graph_id = g_id
+    AND b."uid" IN (SELECT jsonb_array_elements_text(COALESCE(p_input -> 'deleted_branches', '[]'::jsonb)));
+
+  -- branches of a deleted node are deleted with it
+  DELETE FROM nodes n
+  WHERE n.graph_id = g_id
+    AND n."uid" IN (SELECT jsonb_array_elements_text(COALESCE(p_input -> 'deleted_nodes', '[]'::jsonb)));
+
+  INSERT INTO nodes (
+    "uid",
+    "node_type_id",
+    "graph_id",
+    "label",
+    "metadata"
+  )
+  SELECT
+    j ->> 'uid',
+    (SELECT id FROM node_types WHERE "name" = (j ->> 'node_type')),
+    g_id,
+    j ->> 'label',
+    COALESCE(j -> 'metadata', '{}'::jsonb)
+  FROM
+    jsonb_array_elements(COALESCE(p_input -> 'nodes', '[]'::jsonb)) j
+  ON CONFLICT (graph_id, "uid") DO UPDATE SET
+    "node_type_id" = EXCLUDED."node_type_id",
+    "label" = EXCLUDED."label",
+    "metadata" = EXCLUDED."metadata";
+
+  UPDATE branches b SET
+    "conditional" = COALESCE(j ->> 'conditional', ''),
+    "label" = j ->> 'label',
+    "node" = j ->> 'prev',
+    "next_node" = j ->> 'next'
+  FROM
+    jsonb_array_elements(COALESCE(p_input -> 'branches', '[]'::jsonb)) j
+  WHERE b.graph_id = g_id AND b."uid" = j ->> 'uid';
+
+  INSERT INTO branches (
+    "conditional",
+    "label",
+    "uid",
+    "graph_id",
+    "node",
+    "next_node"
+  )
+  SELECT
+    COALESCE(j ->> 'conditional', ''),
+    j ->> 'label',
+    j ->> 'uid',
+    g_id,
+    j ->> 'prev',
+    j ->> 'next'
+  FROM
+    jsonb_array_elements(COALESCE(p_input -> 'branches', '[]'::jsonb)) j
+  WHERE NOT EXISTS (
+    SELECT 1 FROM branches b WHERE b.graph_id = g_id AND b."uid" = j ->> 'uid'
+  );
+
+  UPDATE graphs SET version = version + 1 WHERE id = g_id RETURNING version INTO g_version;
+  RETURN g_version;
+END $$;
+
+-- connectors are identified by the branch uid, the same key patches use
+CREATE OR REPLACE FUNCTION graph_document(TEXT) RETURNS jsonb LANGUAGE sql STABLE
+AS $$
+  SELECT jsonb_build_object(
+    'id', g.id,
+    'uid', g.uid,
+    'label', g."label",
+    'created', g.created,
+    'version', g.version,
+    'nodes', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object(
+        'uid', n.uid,
+        'label', n."label",
+        'node_type', nt."name",
+        'node_type_id', n.node_type_id,
+        'metadata', n.metadata
+      ) ORDER BY n.id)
+      FROM nodes n
+      JOIN node_types nt ON nt.id = n.node_type_id
+      WHERE n.graph_id = g.id
+    ), '[]'::jsonb),
+    'branches', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object(
+        'id', b.id,
+        'uid', b.uid,
+        'prev', b.node,
+        'next', b.next_node,
+        'label', b."label",
+        'conditional', b.conditional
+      ) ORDER BY b.id)
+      FROM branches b
+      WHERE b.graph_id = g.id
+    ), '[]'::jsonb)
+  )
+  FROM graphs g
+  WHERE g.uid = $1;
+$$;
@@ -0,0 +1,18 @@
+-- versions come from one sequence, so a graph that is deleted and created
+-- again never reuses a version that clients or caches have already seen
+CREATE SEQUENCE IF NOT EXISTS graph_versions;
+SELECT setval('graph_versions', GREATEST((SELECT MAX(version) FROM graphs), 1));
+ALTER TABLE graphs ALTER COLUMN version SET DEFAULT nextval('graph_versions');
+
+CREATE OR REPLACE FUNCTION next_graph_version() RETURNS trigger LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF NEW.version IS DISTINCT FROM OLD.version THEN
+    NEW.version := nextval('graph_versions');
+  END IF;
+  RETURN NEW;
+END $$;
+
+DROP TRIGGER IF EXISTS graphs_next_version ON graphs;
+CREATE TRIGGER graphs_next_version BEFORE UPDATE OF version ON graphs
+  FOR EACH ROW EXECUTE FUNCTION next_graph_version();
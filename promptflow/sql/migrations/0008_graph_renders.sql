@@ -0,0 +1,5 @@
+-- the version a stored image and layout were made from, so they are only
+-- reused while the graph is unchanged
+ALTER TABLE graphs ADD COLUMN IF NOT EXISTS image_version integer;
+ALTER TABLE graphs ADD COLUMN IF NOT EXISTS layout jsonb;
+ALTER TABLE graphs ADD COLUMN IF NOT EXISTS layout_version integer;
@@ -0,0 +1,4 @@
+-- input posted for the node a suspended job waits on; kept with the
+-- checkpoint until that node has run, so a retried task hands it to the
+-- same node and never to a later one
+ALTER TABLE job_checkpoints ADD COLUMN IF NOT EXISTS node_input TEXT;
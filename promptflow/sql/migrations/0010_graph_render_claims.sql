@@ -0,0 +1,5 @@
+-- the version a png render was last queued for, and when, so only one API
+-- process queues it; a claim left by a render that died is taken over once
+-- it is old enough
+ALTER TABLE graphs ADD COLUMN IF NOT EXISTS render_version integer;
+ALTER TABLE graphs ADD COLUMN IF NOT EXISTS render_queued timestamp;
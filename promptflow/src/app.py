@@ -17,32 +17,54 @@ import dotenv
 
 dotenv.load_dotenv()
 
-import io
+import functools
 import json
 import logging
 import os
 import traceback
-import zipfile
-from typing import Any, List, Optional
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TypeVar,
+)
+
+import anyio
+from celery.result import AsyncResult
 
-from fastapi import FastAPI, File, HTTPException, Response, UploadFile
+from fastapi import FastAPI, File, Header, HTTPException, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel  # pylint: disable=no-name-in-module
+from starlette.background import BackgroundTask
 
 from promptflow.src.celery_app import celery_app
-from promptflow.src.flowchart import Flowchart, FlowchartJson
+from promptflow.src.connection_pool import pool_max_connections
+from promptflow.src.cost import CostEstimate, estimate_cost
+from promptflow.src.exporters import chunked
+from promptflow.src.flowchart import Flowchart, FlowchartJson, FlowchartPatch
+from promptflow.src.flowchart_archive import (
+    FlowchartArchiveError,
+    embeddings_dir,
+    iter_flowchart_archive,
+    read_flowchart_archive,
+)
+from promptflow.src.flowchart_cache import ExportCache
 from promptflow.src.node_map import node_map
-from promptflow.src.nodes.embedding_node import EmbeddingsIngestNode
 from promptflow.src.postgres_interface import (
+    RESUMABLE_STATUSES,
     DatabaseConfig,
+    FlowchartVersionConflict,
     GraphNamesAndIds,
     JobLog,
     JobResult,
     JobView,
     PostgresInterface,
 )
-from promptflow.src.state import State
 from promptflow.src.tasks import render_flowchart, run_flowchart
 
 
@@ -70,22 +92,74 @@ app.add_middleware(
 )
 promptflow = PromptFlowApp()
 
-interface = PostgresInterface(
-    DatabaseConfig(
-        host=os.getenv("POSTGRES_HOST", "172.21.0.2"),
-        database=os.getenv("POSTGRES_DB", "postgres"),
-        user=os.getenv("POSTGRES_USER", "postgres"),
-        password=os.getenv("POSTGRES_PASSWORD", "postgres"),
-        port=int(os.getenv("POSTGRES_PORT", 5432)),
+interface = PostgresInterface(DatabaseConfig.from_env())
+
+T = TypeVar("T")
+_db_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+async def run_db(func: Callable[..., T], *args: Any) -> T:
+    """
+    Run a blocking database call on a worker thread. Only as many calls run
+    at once as the pool has connections (POSTGRES_POOL_MAX); the rest wait
+    without a thread.
+    """
+    global _db_limiter
+    if _db_limiter is None:
+        _db_limiter = anyio.CapacityLimiter(pool_max_connections())
+    return await anyio.to_thread.run_sync(
+        functools.partial(func, *args), limiter=_db_limiter
     )
-)
+
+
+_stream_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+async def stream_db(rows: Iterator[T]) -> AsyncIterator[T]:
+    """
+    Iterate a blocking database stream on worker threads. A stream holds
+    one of run_db's connections until it ends, and at most
+    POSTGRES_STREAM_MAX streams (half the pool by default) run at once, so
+    slow clients can't take every connection. The stream is closed as soon
+    as the client goes away, which returns its connection.
+    """
+    global _db_limiter, _stream_limiter
+    if _db_limiter is None:
+        _db_limiter = anyio.CapacityLimiter(pool_max_connections())
+    if _stream_limiter is None:
+        default = max(pool_max_connections() // 2, 1)
+        _stream_limiter = anyio.CapacityLimiter(
+            int(os.getenv("POSTGRES_STREAM_MAX", default))
+        )
+    # the stream may be read and closed from different tasks
+    borrower = object()
+    await _stream_limiter.acquire_on_behalf_of(borrower)
+    try:
+        await _db_limiter.acquire_on_behalf_of(borrower)
+    except BaseException:
+        _stream_limiter.release_on_behalf_of(borrower)
+        raise
+    try:
+        done = object()
+        while True:
+            row = await anyio.to_thread.run_sync(next, rows, done)
+            if row is done:
+                break
+            yield row
+    finally:
+        with anyio.CancelScope(shield=True):
+            close = getattr(rows, "close", None)
+            if close is not None:
+                await anyio.to_thread.run_sync(close)
+            _db_limiter.release_on_behalf_of(borrower)
+            _stream_limiter.release_on_behalf_of(borrower)
 
 
 @app.get("/flowcharts")
-def get_flowcharts() -> List[GraphNamesAndIds]:
+async def get_flowcharts() -> List[GraphNamesAndIds]:
     """Get all flowcharts."""
     promptflow.logger.info("Getting flowcharts")
-    flowcharts = interface.get_all_flowchart_ids_and_names()
+    flowcharts = await run_db(interface.get_all_flowchart_ids_and_names)
     return flowcharts
 
 
@@ -123,20 +197,95 @@ def upsert_flowchart_json(
     return flowchart.serialize()
 
 
+export_cache = ExportCache(int(os.getenv("EXPORT_CACHE_SIZE", 256)))
+# larger exports are streamed to the client without keeping a copy
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", 1024 * 1024))
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header names the given ETag
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def cache_export(
+    flowchart_id: str, kind: str, version: int, chunks: Iterable[str]
+) -> Iterator[bytes]:
+    """
+    Encode the chunks of an export as they are streamed, and keep the export
+    in the cache once it is complete, unless it outgrew EXPORT_CACHE_MAX_BYTES
+    """
+    kept: Optional[list[bytes]] = []
+    size = 0
+    for chunk in chunks:
+        data = chunk.encode()
+        if kept is not None:
+            size += len(data)
+            if size <= EXPORT_CACHE_MAX_BYTES:
+                kept.append(data)
+            else:
+                kept = None
+        yield data
+    if kept is not None:
+        export_cache.put(flowchart_id, kind, version, b"".join(kept))
+
+
+def export_response(
+    flowchart_id: str,
+    kind: str,
+    media_type: str,
+    render: Callable[[Flowchart], Iterable[str]],
+    if_none_match: Optional[str],
+) -> Response:
+    """
+    Respond with an export of a flowchart, tagged with the flowchart's
+    version. Unchanged flowcharts cost one version lookup: the client's copy
+    is confirmed with a 304, or the export made for that version is reused.
+    New exports are streamed in chunks while they are written.
+    """
+    version = interface.get_flowchart_version(flowchart_id)
+    etag = f'"{version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    body = export_cache.get(flowchart_id, kind, version)
+    if body is not None:
+        return Response(body, media_type=media_type, headers=headers)
+    document = interface.get_flowchart_document(flowchart_id)
+    flowchart = interface.build_flowchart_from_document(document)
+    headers["ETag"] = f'"{document.version}"'
+    return StreamingResponse(
+        cache_export(flowchart_id, kind, document.version, chunked(render(flowchart))),
+        media_type=media_type,
+        headers=headers,
+    )
+
+
 @app.get("/flowcharts/{flowchart_id}")
-def get_flowchart(flowchart_id: str) -> FlowchartJson | ErrorResponse:
+async def get_flowchart(
+    flowchart_id: str, if_none_match: Optional[str] = Header(None)
+) -> FlowchartJson | ErrorResponse:
     """Get a flowchart by id."""
     promptflow.logger.info("Getting flowchart")
     try:
-        flowchart = Flowchart.get_flowchart_by_uid(flowchart_id, interface)
+        return await run_db(
+            export_response,
+            flowchart_id,
+            "json",
+            "application/json",
+            lambda flowchart: [flowchart.serialize().json()],
+            if_none_match,
+        )
     except ValueError:
-        interface.conn.rollback()
         return ErrorResponse(
             message="Flowchart not found",
             error=traceback.format_exc(),
             data={"flowchart_id": flowchart_id},
         )
-    return flowchart.serialize()
 
 
 class FlowchartUpdate(BaseModel):
@@ -146,6 +295,34 @@ class FlowchartUpdate(BaseModel):
     flowchart_id: str
 
 
+class FlowchartPatchResponse(BaseModel):
+    """A flowchart patch that was applied"""
+
+    message: str
+    flowchart_id: str
+    version: int
+
+
+@app.patch("/flowcharts/{flowchart_id}")
+def patch_flowchart(
+    flowchart_id: str, patch: FlowchartPatch
+) -> FlowchartPatchResponse:
+    """
+    Insert, replace or delete some nodes and branches of a flowchart,
+    without saving the rest of it again
+    """
+    promptflow.logger.info("Patching flowchart")
+    try:
+        version = interface.patch_flowchart(flowchart_id, patch)
+    except FlowchartVersionConflict as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return FlowchartPatchResponse(
+        message="Flowchart patched", flowchart_id=flowchart_id, version=version
+    )
+
+
 @app.delete("/flowcharts/{flowchart_id}")
 def delete_flowchart(flowchart_id: str) -> FlowchartUpdate | ErrorResponse:
     """Delete a flowchart by id."""
@@ -153,7 +330,6 @@ def delete_flowchart(flowchart_id: str) -> FlowchartUpdate | ErrorResponse:
     try:
         interface.delete_flowchart(flowchart_id)
     except ValueError:
-        interface.conn.rollback()
         return ErrorResponse(
             message="Flowchart not found",
             error=traceback.format_exc(),
@@ -191,9 +367,26 @@ class UserInputResponse(BaseModel):
     input: str
 
 
+def resume_suspended_job(job_id: str, node_input: str) -> bool:
+    """
+    Queue the continuation of a job that was suspended waiting for input.
+    Returns False if the job isn't suspended, e.g. because it is blocked
+    waiting for input inside a parallel branch.
+    """
+    if not job_id.isdigit() or not interface.claim_job_input(int(job_id), node_input):
+        return False
+    job = interface.get_job_view(int(job_id))
+    run_flowchart.apply_async(
+        (job.graph_uid, interface.config.dict()), {"job_id": job.job_id}
+    )
+    return True
+
+
 @app.post("/jobs/{task_id}/input")
 def post_input(task_id: str, user_input: UserInput) -> UserInputResponse:
-    """Post input to a running flowchart execution."""
+    """Post input to a flowchart execution waiting for it."""
+    if resume_suspended_job(task_id, user_input.input):
+        return UserInputResponse(message="Input received", input=user_input.input)
     redis_url = os.getenv("REDIS_URL")
     if not redis_url:
         raise HTTPException(status_code=500, detail="Redis URL not found")
@@ -210,31 +403,103 @@ class FileInputResponse(BaseModel):
 
 @app.post("/jobs/{task_id}/file_input")
 def post_file_input(task_id: str, file: UploadFile = File(...)) -> FileInputResponse:
-    """Post input to a running flowchart execution."""
-    redis_url = os.getenv("REDIS_URL")
-    if not redis_url:
-        raise HTTPException(status_code=500, detail="Redis URL not found")
-    red = redis.StrictRedis.from_url(redis_url)
-    red.publish(f"{task_id}/input", file.file.read())
+    """Post input to a flowchart execution waiting for it."""
+    content = file.file.read()
+    if not resume_suspended_job(task_id, content.decode(errors="replace")):
+        redis_url = os.getenv("REDIS_URL")
+        if not redis_url:
+            raise HTTPException(status_code=500, detail="Redis URL not found")
+        red = redis.StrictRedis.from_url(redis_url)
+        red.publish(f"{task_id}/input", content)
     if not file.filename:
         raise HTTPException(status_code=500, detail="File name not found")
     return FileInputResponse(file=file.filename)
 
 
 @app.get("/jobs/{job_id}/output")
-def get_output(job_id: int) -> JobResult:
+async def get_output(job_id: int) -> JobResult:
     """Get output from a running flowchart execution."""
-    return interface.get_job_output(job_id)
+    return await run_db(interface.get_job_output, job_id)
+
+
+class RenderPendingResponse(BaseModel):
+    """A png render that has been queued"""
+
+    message: str
+    flowchart_id: str
+    version: int
+
+
+# seconds after which a queued render that hasn't finished is queued again
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", 300))
+
+
+def render_task_id(flowchart_id: str, version: int) -> str:
+    """
+    Id of the task rendering a version of a flowchart, so every process can
+    look the render up
+    """
+    return f"render-{flowchart_id}-{version}"
+
+
+def render_error(task_id: str) -> Optional[str]:
+    """
+    The error of a render task that failed, or None if it hasn't. The
+    failure is forgotten once it has been read.
+    """
+    render = AsyncResult(task_id, app=celery_app)
+    if not render.failed():
+        return None
+    error = str(render.result)
+    render.forget()
+    return error
 
 
 @app.get("/flowcharts/{flowchart_id}/png")
-def render_flowchart_png(flowchart_id: str) -> StreamingResponse:
-    """Render a flowchart as a png."""
-    png_image = render_flowchart.apply_async(
-        (flowchart_id, interface.config.dict())
-    ).get()
-    interface.store_b64_image(png_image, flowchart_id)
-    return StreamingResponse(io.BytesIO(png_image), media_type="image/png")
+async def render_flowchart_png(
+    flowchart_id: str, if_none_match: Optional[str] = Header(None)
+) -> Response:
+    """
+    Get a png of a flowchart. The stored image is returned while it matches
+    the flowchart's version. Otherwise a render is queued and a 202 tells the
+    client to poll the same location until the image is ready.
+    """
+    try:
+        version, png_image = await run_db(interface.get_flowchart_image, flowchart_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail="Flowchart not found") from exc
+    etag = f'"{version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if png_image is not None:
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(png_image, media_type="image/png", headers=headers)
+
+    task_id = render_task_id(flowchart_id, version)
+    error = await anyio.to_thread.run_sync(render_error, task_id)
+    if error is not None:
+        # the next request queues the render again
+        await run_db(interface.release_flowchart_render, flowchart_id, version)
+        raise HTTPException(status_code=500, detail=f"Render failed: {error}")
+    # only one process queues each version, however many clients poll
+    if await run_db(
+        interface.claim_flowchart_render, flowchart_id, version, RENDER_TIMEOUT
+    ):
+        render_flowchart.apply_async(
+            (flowchart_id, interface.config.dict()), task_id=task_id
+        )
+    return JSONResponse(
+        RenderPendingResponse(
+            message="Rendering", flowchart_id=flowchart_id, version=version
+        ).dict(),
+        status_code=202,
+        headers={
+            "Location": app.url_path_for(
+                "render_flowchart_png", flowchart_id=flowchart_id
+            ),
+            "Retry-After": "1",
+        },
+    )
 
 
 class FlowchartJSResponse(BaseModel):
@@ -244,56 +509,197 @@ class FlowchartJSResponse(BaseModel):
     color_map: dict[str, str]
 
 
+def iter_flowchart_js_response(flowchart: Flowchart) -> Iterator[str]:
+    """
+    Write a FlowchartJSResponse as JSON while the flowchart.js text is
+    being written, instead of building the text first
+    """
+    yield '{"flowchart_js": "'
+    for line in flowchart.iter_flowchart_js():
+        yield json.dumps(line)[1:-1]
+    yield '", "color_map": {'
+    for index, (uid, color) in enumerate(flowchart.get_color_map().items()):
+        yield f"{', ' if index else ''}{json.dumps(uid)}: {json.dumps(color)}"
+    yield "}}"
+
+
 @app.get("/flowcharts/{flowchart_id}/flowchartjs")
-def get_flowchart_js(flowchart_id: str) -> FlowchartJSResponse:
+async def get_flowchart_js(
+    flowchart_id: str, if_none_match: Optional[str] = Header(None)
+) -> FlowchartJSResponse:
     """
     Returns a flowchart.js representation of the flowchart
     """
-    flowchart = Flowchart.get_flowchart_by_uid(flowchart_id, interface)
-    fc_js = flowchart.to_flowchart_js()
-    color_map = flowchart.get_color_map()
-    return FlowchartJSResponse(flowchart_js=fc_js, color_map=color_map)
+    try:
+        return await run_db(
+            export_response,
+            flowchart_id,
+            "flowchartjs",
+            "application/json",
+            iter_flowchart_js_response,
+            if_none_match,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail="Flowchart not found") from exc
 
 
 @app.get("/flowcharts/{flowchart_id}/mermaid", response_class=PlainTextResponse)
-def get_flowchart_mermaid(flowchart_id: str) -> str:
+async def get_flowchart_mermaid(
+    flowchart_id: str, if_none_match: Optional[str] = Header(None)
+) -> str:
     """
     Returns a mermaid representation of the flowchart
     """
-    flowchart = Flowchart.get_flowchart_by_uid(flowchart_id, interface)
-    return flowchart.to_mermaid()
+    try:
+        return await run_db(
+            export_response,
+            flowchart_id,
+            "mermaid",
+            "text/plain; charset=utf-8",
+            lambda flowchart: flowchart.iter_mermaid(),
+            if_none_match,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail="Flowchart not found") from exc
+
+
+@app.get("/flowcharts/{flowchart_id}/graphml", response_class=Response)
+async def get_flowchart_graphml(
+    flowchart_id: str, if_none_match: Optional[str] = Header(None)
+) -> Response:
+    """
+    Returns a GraphML representation of the flowchart
+    """
+    try:
+        return await run_db(
+            export_response,
+            flowchart_id,
+            "graphml",
+            "application/graphml+xml",
+            lambda flowchart: flowchart.iter_graph_ml(),
+            if_none_match,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail="Flowchart not found") from exc
+
+
+@app.get("/flowcharts/{flowchart_id}/dot", response_class=Response)
+async def get_flowchart_dot(
+    flowchart_id: str, if_none_match: Optional[str] = Header(None)
+) -> Response:
+    """
+    Returns a Graphviz DOT representation of the flowchart
+    """
+    try:
+        return await run_db(
+            export_response,
+            flowchart_id,
+            "dot",
+            "text/vnd.graphviz; charset=utf-8",
+            lambda flowchart: flowchart.iter_dot(),
+            if_none_match,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail="Flowchart not found") from exc
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def wants_ndjson(accept: Optional[str]) -> bool:
+    """
+    Whether the client asked for newline-delimited JSON
+    """
+    return accept is not None and NDJSON_MEDIA_TYPE in accept
+
+
+def ndjson_response(models: Iterator[BaseModel]) -> StreamingResponse:
+    """
+    Stream models as newline-delimited JSON, one per line, as they are read
+    """
+    rows = stream_db(models)
+    # the background task runs even if the client disconnects
+    return StreamingResponse(
+        (model.json() + "\n" async for model in rows),
+        media_type=NDJSON_MEDIA_TYPE,
+        background=BackgroundTask(rows.aclose),
+    )
 
 
 @app.get("/jobs")
-def get_all_jobs(
+async def get_all_jobs(
     graph_uid: Optional[str] = None,
     status: Optional[str] = None,
     limit: Optional[int] = None,
+    after_id: Optional[int] = None,
+    since: Optional[datetime.datetime] = None,
+    accept: Optional[str] = Header(None),
 ) -> List[JobView]:
     """
-    Get all running jobs
+    Get all jobs, newest first. Pass the id of the last job received as
+    after_id to get the next page, or since to get jobs updated after a time.
+    With Accept: application/x-ndjson the jobs are streamed one per line.
     """
-    return interface.get_all_jobs(graph_uid, status, limit)
+    if wants_ndjson(accept):
+        return ndjson_response(
+            interface.iter_all_jobs(graph_uid, status, limit, after_id, since)
+        )
+    return await run_db(
+        interface.get_all_jobs, graph_uid, status, limit, after_id, since
+    )
 
 
 @app.get("/jobs/{job_id}")
-def get_job_by_id(job_id) -> JobView:
+async def get_job_by_id(job_id: int) -> JobView:
     """Get a specific job by id"""
     try:
-        return interface.get_job_view(job_id)
+        return await run_db(interface.get_job_view, job_id)
     except ValueError as exc:
         raise HTTPException(status_code=404, detail="Job not found") from exc
 
 
 @app.get("/jobs/{job_id}/logs")
-def get_job_logs(job_id) -> List[JobLog]:
+async def get_job_logs(
+    job_id: int,
+    after_id: Optional[int] = None,
+    since: Optional[datetime.datetime] = None,
+    limit: Optional[int] = None,
+    accept: Optional[str] = Header(None),
+) -> List[JobLog]:
+    """
+    Get the logs of a specific job, oldest first. Pass the id of the last
+    log received as after_id to tail the job.
+    With Accept: application/x-ndjson the logs are streamed one per line.
+    """
+    try:
+        if wants_ndjson(accept):
+            return ndjson_response(
+                interface.iter_job_logs(job_id, after_id, since, limit)
+            )
+        return await run_db(interface.get_job_logs, job_id, after_id, since, limit)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail="Job not found") from exc
+
+
+@app.post("/jobs/{job_id}/resume")
+def resume_job(job_id: int) -> RunSuccessResponse:
     """
-    Get all logs for a specific job
+    Resume a failed or suspended job from its last checkpoint, or from the
+    start if it never got past its first node. Jobs that are pending,
+    running or done can't be resumed, so a job never runs twice at once.
     """
     try:
-        return interface.get_job_logs(job_id)
+        job = interface.get_job_view(job_id)
     except ValueError as exc:
         raise HTTPException(status_code=404, detail="Job not found") from exc
+    if not interface.claim_job(job_id, RESUMABLE_STATUSES):
+        raise HTTPException(
+            status_code=409, detail=f"Job is {job.job_status}, it can't be resumed"
+        )
+    task = run_flowchart.apply_async(
+        (job.graph_uid, interface.config.dict()), {"job_id": job_id}
+    )
+    return RunSuccessResponse(message="Job execution resumed", task_id=str(task.id))
 
 
 class FlowchartUpdateResponse(BaseModel):
@@ -333,7 +739,7 @@ def clear_flowchart(flowchart_id: str) -> FlowchartUpdateResponse:
     )
 
 
-class CostResponse(BaseModel):
+class CostResponse(CostEstimate):
     """A response for a flowchart cost"""
 
     flowchart_id: str
@@ -341,72 +747,158 @@ class CostResponse(BaseModel):
 
 
 @app.get("/flowcharts/{flowchart_id}/cost")
-def cost_flowchart(flowchart_id: str) -> CostResponse:
-    """Get the approx cost to run the flowchart"""
+async def cost_flowchart(
+    flowchart_id: str, if_none_match: Optional[str] = Header(None)
+) -> CostResponse:
+    """
+    Get the approx cost to run the flowchart: the cheapest, expected and most
+    expensive run, and what each node adds. cost is the most expensive run.
+    """
     promptflow.logger.info("Getting cost of flowchart")
-    flowchart = Flowchart.get_flowchart_by_uid(flowchart_id, interface)
-    state = State()
-    cost = flowchart.cost(state)
-    return CostResponse(flowchart_id=flowchart_id, cost=cost)
+
+    def render(flowchart: Flowchart) -> list[str]:
+        estimate = estimate_cost(flowchart)
+        return [
+            CostResponse(
+                flowchart_id=flowchart_id, cost=estimate.max_cost, **estimate.dict()
+            ).json()
+        ]
+
+    try:
+        return await run_db(
+            export_response,
+            flowchart_id,
+            "cost",
+            "application/json",
+            render,
+            if_none_match,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail="Flowchart not found") from exc
+
+
+def zip_response(chunks: Iterator[bytes], name: str) -> StreamingResponse:
+    """
+    Stream a zip archive to the client as a download
+    """
+    filename = "".join(c for c in name if c.isalnum() or c in " ._-") or "flowcharts"
+    return StreamingResponse(
+        chunks,
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.zip"'},
+    )
 
 
 @app.post("/flowcharts/{flowchart_id}/save_as", response_class=Response)
 def save_as(flowchart_id: str) -> Response:
     """
-    Serialize the flowchart and save it to a file
+    Serialize the flowchart and its embedding files as a zip archive
     """
-    flowchart = Flowchart.get_flowchart_by_uid(flowchart_id, interface)
-    filename = flowchart.name
-    if filename:
-        with zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED) as archive:
-            archive.writestr(
-                "flowchart.json", json.dumps(flowchart.serialize(), indent=4)
+    try:
+        flowchart = Flowchart.get_flowchart_by_uid(flowchart_id, interface)
+    except ValueError:
+        promptflow.logger.info("Flowchart %s not found", flowchart_id)
+        return Response(status_code=404)
+    return zip_response(iter_flowchart_archive([flowchart]), flowchart.name)
+
+
+class FlowchartExportRequest(BaseModel):
+    """Flowcharts to export, or every flowchart if no uids are given"""
+
+    uids: Optional[List[str]] = None
+
+
+@app.post("/flowcharts/export", response_class=Response)
+def export_flowcharts(request: Optional[FlowchartExportRequest] = None) -> Response:
+    """
+    Export several flowcharts and their embedding files as one zip archive.
+    Flowcharts are loaded one at a time while the archive is streamed.
+    """
+    if request is not None and request.uids:
+        uids = request.uids
+        missing = []
+        for uid in uids:
+            try:
+                interface.get_flowchart_version(uid)
+            except ValueError:
+                missing.append(uid)
+        if missing:
+            raise HTTPException(
+                status_code=404, detail=f"Flowcharts not found: {', '.join(missing)}"
             )
-            # if there's an embedding ingest node, save the embedding
-            for node in flowchart.nodes:
-                if isinstance(node, EmbeddingsIngestNode):
-                    # write the embedding to the archive
-                    archive.write(node.filename, arcname=node.filename)
-                    archive.write(node.label_file, arcname=node.label_file)
-            promptflow.logger.info("Saved flowchart to %s", filename)
-        with open(filename, "rb") as f:
-            return Response(content=f.read(), media_type="application/zip")
     else:
-        promptflow.logger.info("No file selected to save to")
-        return Response(status_code=404)
+        uids = [graph.uid for graph in interface.get_all_flowchart_ids_and_names()]
+    flowcharts = (Flowchart.get_flowchart_by_uid(uid, interface) for uid in uids)
+    return zip_response(iter_flowchart_archive(flowcharts), "flowcharts")
+
+
+def read_flowcharts(file: UploadFile) -> list[Flowchart]:
+    """
+    Deserialize the flowcharts in an uploaded archive, reading it from the
+    upload and copying embedding files into EMBEDDINGS_DIR
+    """
+    return [
+        Flowchart.deserialize(interface, data)
+        for data in read_flowchart_archive(file.file, embeddings_dir())
+    ]
 
 
 @app.post("/flowcharts/load_from")
 def load_from(file: UploadFile = File(...)) -> FlowchartJson | ErrorResponse:
     """
-    Read a json file and deserialize as a flowchart
-    """
-    if file.filename:
-        with zipfile.ZipFile(file.filename, "r") as archive:
-            with archive.open("flowchart.json") as loadfile:
-                data = json.load(loadfile)
-                # load the embedding if there is one
-                for node in data["nodes"]:
-                    if node["node_type"] == "EmbeddingsIngestNode":
-                        # load the embedding
-                        embed_file = archive.extract(node["filename"], path=os.getcwd())
-                        node["filename"] = embed_file
-                        # load the labels
-                        label_file = archive.extract(
-                            node["label_file"], path=os.getcwd()
-                        )
-                        node["label_file"] = label_file
-                flowchart = Flowchart.deserialize(interface, data)
-                interface.save_flowchart(flowchart)
-                return flowchart.serialize()
-    else:
+    Read a flowchart archive and deserialize the flowchart in it
+    """
+    if not file.filename:
         promptflow.logger.info("No file selected to load from")
-        # return {"message": "No file selected to load from"}
         return ErrorResponse(
             message="No file selected to load from",
             error="No file selected to load from",
             data={},
         )
+    try:
+        flowcharts = read_flowcharts(file)
+        if len(flowcharts) != 1:
+            raise FlowchartArchiveError(
+                f"Archive holds {len(flowcharts)} flowcharts, use /flowcharts/import"
+            )
+        interface.save_flowchart(flowcharts[0])
+    except (ValueError, KeyError):
+        return ErrorResponse(
+            message="Invalid flowchart archive",
+            error=traceback.format_exc(),
+            data={"filename": file.filename},
+        )
+    return flowcharts[0].serialize()
+
+
+class FlowchartImportResponse(BaseModel):
+    """Flowcharts that were imported from an archive"""
+
+    message: str
+    flowchart_ids: List[str]
+
+
+@app.post("/flowcharts/import")
+def import_flowcharts(
+    file: UploadFile = File(...),
+) -> FlowchartImportResponse | ErrorResponse:
+    """
+    Import every flowchart in an archive. Either all of them are saved or,
+    if one is invalid, none are.
+    """
+    try:
+        flowcharts = read_flowcharts(file)
+        interface.save_flowcharts(flowcharts)
+    except (ValueError, KeyError):
+        return ErrorResponse(
+            message="Invalid flowchart archive",
+            error=traceback.format_exc(),
+            data={"filename": file.filename},
+        )
+    return FlowchartImportResponse(
+        message="Flowcharts imported",
+        flowchart_ids=[flowchart.uid for flowchart in flowcharts],
+    )
 
 
 class NodeTypeInfoResponse(BaseModel):
@@ -479,7 +971,7 @@ def update_node_options(
     flowchart = Flowchart.get_flowchart_by_uid(flowchart_id, interface)
     node = flowchart.find_node(node_id)
     node.update(data)
-    interface.save_flowchart(flowchart)
+    interface.patch_flowchart(flowchart_id, FlowchartPatch(nodes=[node.serialize()]))
     return NodeUpdateResponse(message="Node options updated", node=node.serialize())
 
 
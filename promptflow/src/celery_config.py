@@ -16,3 +16,9 @@ result_serializer = "json"
 accept_content = ["json"]
 timezone = "UTC"
 enable_utc = True
+
+# Jobs share one event loop per worker process (see job_loop.py), so
+# CELERY_WORKER_POOL=threads lets each process run many I/O bound jobs at once
+worker_pool = os.getenv("CELERY_WORKER_POOL", "prefork")
+if os.getenv("CELERY_WORKER_CONCURRENCY"):
+    worker_concurrency = int(os.environ["CELERY_WORKER_CONCURRENCY"])
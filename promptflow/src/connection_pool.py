@@ -0,0 +1,201 @@
+"""
+Process-wide pool of Postgres connections, shared by every interface
+created in the same process.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+if TYPE_CHECKING:
+    from promptflow.src.postgres_interface import DatabaseConfig
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """
+    Connection that remembers which statements it has prepared
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: set[str] = set()
+
+    def rollback(self) -> None:
+        # a statement prepared in a failed transaction is looked up again
+        self.prepared.clear()
+        super().rollback()
+
+
+class _RetainingPool(ThreadedConnectionPool):
+    """
+    psycopg2 closes connections above minconn as soon as they are returned,
+    so a busy pool would reconnect on almost every checkout. This keeps up
+    to maxconn idle connections open while only opening minconn up front.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.minconn = maxconn
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of connections to one database.
+    Callers block while every connection is checked out, and connections
+    that have been idle for a while are pinged before they are handed out.
+    """
+
+    def __init__(
+        self,
+        config: DatabaseConfig,
+        minconn: int = 1,
+        maxconn: int = 10,
+        check_interval: float = 30.0,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.pid = os.getpid()
+        self.maxconn = maxconn
+        self.check_interval = check_interval
+        self.schema_initialized = False
+        # node types never change once the schema is set up
+        self.node_type_ids: dict[str, int] = {}
+        self._pool = _RetainingPool(
+            minconn,
+            maxconn,
+            host=config.host,
+            database=config.database,
+            user=config.user,
+            password=config.password,
+            port=config.port,
+            connection_factory=PooledConnection,
+        )
+        self._available = threading.BoundedSemaphore(maxconn)
+        self._last_used: dict[int, float] = {}
+
+    def _is_healthy(self, conn: psycopg2.extensions.connection) -> bool:
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        # connections the pool has just opened don't need checking
+        if last_used is None or time.monotonic() - last_used < self.check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self) -> psycopg2.extensions.connection:
+        """
+        Check out a healthy connection, waiting for one if all are in use
+        """
+        self._available.acquire()
+        try:
+            # a broken connection is replaced; give up once the pool has cycled
+            for _ in range(self.maxconn + 1):
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                self.logger.warning("Discarding broken database connection")
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+            raise psycopg2.OperationalError("No healthy database connection")
+        except Exception:
+            self._available.release()
+            raise
+
+    def putconn(self, conn: psycopg2.extensions.connection) -> None:
+        """
+        Return a connection to the pool, discarding it if it is broken
+        """
+        try:
+            if not conn.closed:
+                status = conn.info.transaction_status
+                if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            self._last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn, close=bool(conn.closed))
+        except psycopg2.Error:
+            self._last_used.pop(id(conn), None)
+            self._pool.putconn(conn, close=True)
+        finally:
+            self._available.release()
+
+    @contextmanager
+    def connection(self) -> Iterator[psycopg2.extensions.connection]:
+        """
+        Check out a connection for the duration of a block. The transaction
+        is committed if the block succeeds and rolled back if it raises.
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.putconn(conn)
+
+    def closeall(self) -> None:
+        """
+        Close every connection in the pool
+        """
+        self._pool.closeall()
+        self._last_used.clear()
+
+
+def pool_max_connections() -> int:
+    """
+    How many connections a pool opens at most, set by POSTGRES_POOL_MAX.
+    Anything else that bounds concurrent database calls should use it too.
+    """
+    return int(os.getenv("POSTGRES_POOL_MAX", 10))
+
+
+_pools: dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(config: DatabaseConfig) -> ConnectionPool:
+    """
+    Return this process's pool for config, creating it on first use.
+    Pools inherited from a parent process are never reused, since
+    connections can't be shared across a fork.
+    Sized by POSTGRES_POOL_MIN and POSTGRES_POOL_MAX, with idle connections
+    checked after POSTGRES_POOL_CHECK_INTERVAL seconds.
+    """
+    key = (config.host, config.port, config.database, config.user)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            pool = ConnectionPool(
+                config,
+                minconn=int(os.getenv("POSTGRES_POOL_MIN", 1)),
+                maxconn=pool_max_connections(),
+                check_interval=float(os.getenv("POSTGRES_POOL_CHECK_INTERVAL", 30)),
+            )
+            _pools[key] = pool
+        return pool
+
+
+def close_connection_pools() -> None:
+    """
+    Close every pool created by this process
+    """
+    with _pools_lock:
+        for pool in _pools.values():
+            if pool.pid == os.getpid():
+                pool.closeall()
+        _pools.clear()
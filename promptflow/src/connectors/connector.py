@@ -2,12 +2,22 @@
 This module contains the Connector class, which represents a connection
 between two nodes in the flowchart.
 """
+import builtins
+import datetime
 import logging
-from typing import Optional
+import os
+import threading
+import time
+from functools import lru_cache
+from types import CodeType
+from typing import Any, Callable, Optional
+
+import networkx as nx
 
 from promptflow.src.mermaid_converter import MermaidConnectorShape
 from promptflow.src.nodes.node_base import NodeBase
 from promptflow.src.serializable import Serializable
+from promptflow.src.state import State
 from promptflow.src.text_data import TextData
 
 DEFAULT_COND_TEMPLATE = """def main(state):
@@ -16,6 +26,54 @@ DEFAULT_COND_TEMPLATE = """def main(state):
 
 DEFAULT_COND_NAME = "Untitled.py"
 
+# names available to condition code besides the builtins
+CONDITION_GLOBALS = {
+    "datetime": datetime,
+    "logging": logging,
+    "nx": nx,
+    "os": os,
+    "threading": threading,
+    "time": time,
+    "State": State,
+}
+
+
+class ConditionError(Exception):
+    """
+    Raised when a connector's condition fails to compile or run.
+    """
+
+    def __init__(self, connector: "Connector", error: Exception):
+        super().__init__(
+            f"Error evaluating condition {connector.label} on connector "
+            f"{connector.uid} ({connector.prev.label} -> {connector.next.label}): "
+            f"{error}"
+        )
+        self.connector = connector
+        self.error = error
+
+
+@lru_cache(maxsize=1024)
+def compile_condition(text: str) -> CodeType:
+    """
+    Compile condition source once.
+    Results are cached by the condition text.
+    """
+    return compile(text, "<condition>", "exec")
+
+
+def load_condition(text: str) -> Callable[[State], Any]:
+    """
+    Run the compiled condition in a fresh namespace and return its main
+    function, so globals set by a condition are never shared between
+    evaluations, connectors or jobs.
+    """
+    namespace: dict[str, Any] = {"__builtins__": builtins} | CONDITION_GLOBALS
+    exec(compile_condition(text), namespace)
+    if "main" not in namespace:
+        raise NameError("Condition must have a main() function")
+    return namespace["main"]
+
 
 class Connector(Serializable):
     """
@@ -62,6 +120,14 @@ class Connector(Serializable):
     def label(self) -> str:
         return self.condition.label
 
+    @property
+    def unconditional(self) -> bool:
+        """
+        True if the condition always passes, so a run always follows it
+        """
+        text = self.condition.text.strip()
+        return not text or text == DEFAULT_COND_TEMPLATE.strip()
+
     @classmethod
     def deserialize(cls, prev: NodeBase, next: NodeBase, condition: TextData, uid: str):
         return cls(prev, next, condition, uid)
@@ -84,6 +150,20 @@ class Connector(Serializable):
             self.prev.flowchart.connectors.remove(self)
         self.prev.output_connectors.remove(self)
         self.next.input_connectors.remove(self)
+        self.flowchart.invalidate_plan()
+
+    def evaluate(self, state: State) -> bool:
+        """
+        Run the condition against the state. An empty condition is always true.
+        Raises ConditionError if the condition cannot be compiled or run.
+        """
+        text = self.condition.text.strip()
+        if not text:
+            return True
+        try:
+            return load_condition(text)(state)
+        except Exception as cond_err:
+            raise ConditionError(self, cond_err) from cond_err
 
     def select(self, *args):
         """
@@ -0,0 +1,158 @@
+"""
+Estimates what running a flowchart costs, following the paths a run can take
+through its execution plan instead of adding up every node
+"""
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING, List, Optional
+
+from pydantic import BaseModel  # pylint: disable=no-name-in-module
+
+from promptflow.src.state import State
+
+if TYPE_CHECKING:
+    from promptflow.src.connectors.connector import Connector
+    from promptflow.src.flowchart import Flowchart
+    from promptflow.src.nodes.node_base import NodeBase
+
+# chance that a connector with a condition is followed
+CONDITION_PROBABILITY = 0.5
+# passes over a cyclic graph before the run probabilities are taken as settled
+MAX_PROBABILITY_PASSES = 100
+
+
+class NodeCost(BaseModel):
+    """The cost of one node, and the chance that a run reaches it"""
+
+    uid: str
+    label: str
+    cost: float
+    probability: float
+    always_runs: bool
+    error: Optional[str] = None
+
+
+class CostEstimate(BaseModel):
+    """
+    Cost of a run of a flowchart. The cheapest run only follows connectors
+    without conditions, the most expensive one follows every connector, and
+    the expected cost weighs each node by the chance that it runs. Loops are
+    counted as running once.
+    """
+
+    min_cost: float
+    expected_cost: float
+    max_cost: float
+    cyclic: bool
+    nodes: List[NodeCost]
+    unreachable: List[str]
+
+
+def connector_probability(connector: Connector) -> float:
+    """
+    Chance that a run which reaches the connector follows it
+    """
+    return 1.0 if connector.unconditional else CONDITION_PROBABILITY
+
+
+def node_cost(node: NodeBase, state: State) -> tuple[float, Optional[str]]:
+    """
+    Cost of a node, or 0 and the error if the node can't estimate it
+    """
+    try:
+        return float(node.cost(state)), None
+    except Exception as exc:  # pylint: disable=broad-except
+        logging.getLogger(__name__).warning(f"No cost for {node.label}: {exc}")
+        return 0.0, str(exc)
+
+
+def run_probabilities(flowchart: Flowchart) -> dict[NodeBase, float]:
+    """
+    Chance that a run reaches each node, taking conditional connectors to be
+    followed independently with CONDITION_PROBABILITY
+    """
+    plan = flowchart.plan
+    order = [node for node in plan.topological_order if node in plan.distances]
+    probability = dict.fromkeys(order, 0.0)
+    probability[plan.start_node] = 1.0
+    # nodes come after their predecessors, so one pass settles a graph without loops
+    passes = MAX_PROBABILITY_PASSES if plan.is_cyclic else 1
+    for _ in range(passes):
+        changed = False
+        for node in order:
+            if node is plan.start_node:
+                continue
+            missed = 1.0
+            for connector in node.input_connectors:
+                followed = probability.get(connector.prev, 0.0)
+                missed *= 1.0 - followed * connector_probability(connector)
+            if abs(1.0 - missed - probability[node]) > 1e-9:
+                probability[node] = 1.0 - missed
+                changed = True
+        if not changed:
+            break
+    return probability
+
+
+def always_run(flowchart: Flowchart) -> set[NodeBase]:
+    """
+    Nodes reached through connectors without conditions, so every run has them
+    """
+    plan = flowchart.plan
+    reached = {plan.start_node}
+    frontier = [plan.start_node]
+    while frontier:
+        node = frontier.pop()
+        for connector in plan.output_connectors[node]:
+            if connector.unconditional and connector.next not in reached:
+                reached.add(connector.next)
+                frontier.append(connector.next)
+    return reached
+
+
+def estimate_cost(flowchart: Flowchart, state: Optional[State] = None) -> CostEstimate:
+    """
+    Estimate the cost of running a flowchart from its start node. Each node
+    is costed once, with the state left by the node it is first reached from,
+    so prompts set earlier on a path are counted by the models after them.
+    """
+    plan = flowchart.plan
+    if plan.start_node is None:
+        raise ValueError("No start node found")
+    probability = run_probabilities(flowchart)
+    always = always_run(flowchart)
+
+    states: dict[NodeBase, State] = {}
+    nodes: list[NodeCost] = []
+    for node in plan.topological_order:
+        if node not in plan.distances:
+            continue
+        parent = next(
+            (c.prev for c in node.input_connectors if c.prev in states), None
+        )
+        if parent is not None:
+            node_state = states[parent].copy()
+        else:
+            node_state = state.copy() if state is not None else State()
+        cost, error = node_cost(node, node_state)
+        states[node] = node_state
+        nodes.append(
+            NodeCost(
+                uid=node.uid,
+                label=node.label,
+                cost=cost,
+                probability=probability[node],
+                always_runs=node in always,
+                error=error,
+            )
+        )
+
+    return CostEstimate(
+        min_cost=sum(node.cost for node in nodes if node.always_runs),
+        expected_cost=sum(node.cost * node.probability for node in nodes),
+        max_cost=sum(node.cost for node in nodes),
+        cyclic=plan.is_cyclic,
+        nodes=nodes,
+        unreachable=[node.uid for node in plan.unreachable],
+    )
@@ -0,0 +1,153 @@
+"""
+Streaming writers for the text exports of a flowchart. Each writer yields
+its export a line at a time, so large flowcharts can be sent while they are
+being written instead of being built up as one string.
+"""
+from typing import TYPE_CHECKING, Iterable, Iterator
+from xml.sax.saxutils import escape
+
+if TYPE_CHECKING:
+    from promptflow.src.flowchart import Flowchart
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def chunked(lines: Iterable[str], size: int = EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Join lines into chunks of about size characters, so a streamed export
+    isn't sent one line at a time
+    """
+    chunk: list[str] = []
+    length = 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield "".join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield "".join(chunk)
+
+
+class FlowchartJSConverter:
+    """Handles converting a flowchart to flowchart.js syntax"""
+
+    SYMBOLS = ["=>", "->", ":>", "|", "@>", ":$"]
+
+    def __init__(self, flowchart: "Flowchart"):
+        self.flowchart = flowchart
+
+    def strip_symbols(self, text: str) -> str:
+        """flowchart.js has no escapes, so its operators are removed from text"""
+        for seq in self.SYMBOLS:
+            text = text.replace(seq, "")
+        # every statement is one line
+        return text.replace("\r", " ").replace("\n", " ")
+
+    def sanitize_identifier(self, identifier: str) -> str:
+        return self.strip_symbols(identifier.replace(" ", "_").replace("'", ""))
+
+    def sanitize_label(self, label: str) -> str:
+        return self.strip_symbols(label.replace("'", ""))
+
+    def iter_flowchart_js(self) -> Iterator[str]:
+        """Yields the flowchart in flowchart.js syntax, a line at a time"""
+        for node in self.flowchart.nodes:
+            uid = self.sanitize_identifier(node.uid)
+            label = self.sanitize_label(node.label)
+            yield f"{uid}=>{node.js_shape.value}: {label}|{node.uid}\n"
+        for connector in self.flowchart.plan.sorted_connectors:
+            prev_uid = self.sanitize_identifier(connector.prev.uid)
+            next_uid = self.sanitize_identifier(connector.next.uid)
+            yield f"{prev_uid}->{next_uid}\n"
+
+
+class GraphMLConverter:
+    """Handles converting a flowchart to GraphML"""
+
+    def __init__(self, flowchart: "Flowchart"):
+        self.flowchart = flowchart
+
+    def quote(self, text: str) -> str:
+        """Quote text as an XML attribute value"""
+        return '"' + escape(text, {'"': "&quot;"}) + '"'
+
+    def iter_graph_ml(self) -> Iterator[str]:
+        """Yields the flowchart as a GraphML document, an element at a time"""
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+        yield '  <key id="label" for="all" attr.name="label" attr.type="string"/>\n'
+        yield (
+            '  <key id="node_type" for="node" attr.name="node_type"'
+            ' attr.type="string"/>\n'
+        )
+        yield f'  <graph id={self.quote(self.flowchart.uid)} edgedefault="directed">\n'
+        for node in self.flowchart.nodes:
+            yield (
+                f"    <node id={self.quote(node.uid)}>"
+                f'<data key="label">{escape(node.label)}</data>'
+                f'<data key="node_type">{node.__class__.__name__}</data>'
+                "</node>\n"
+            )
+        for connector in self.flowchart.connectors:
+            edge = (
+                f"    <edge id={self.quote(connector.uid)}"
+                f" source={self.quote(connector.prev.uid)}"
+                f" target={self.quote(connector.next.uid)}"
+            )
+            if connector.condition_label:
+                yield (
+                    f'{edge}><data key="label">{escape(connector.condition_label)}'
+                    "</data></edge>\n"
+                )
+            else:
+                yield f"{edge}/>\n"
+        yield "  </graph>\n"
+        yield "</graphml>\n"
+
+
+class DotConverter:
+    """Handles converting a flowchart to Graphviz DOT"""
+
+    # DOT shapes closest to the matplotlib markers nodes are drawn with
+    SHAPES = {
+        "s": "box",
+        "o": "ellipse",
+        "^": "triangle",
+        ">": "rarrow",
+        "v": "invtriangle",
+        "<": "larrow",
+        "d": "diamond",
+        "p": "pentagon",
+        "h": "hexagon",
+        "8": "octagon",
+    }
+
+    def __init__(self, flowchart: "Flowchart"):
+        self.flowchart = flowchart
+
+    def quote(self, text: str) -> str:
+        """Quote text as a DOT string"""
+        text = text.replace("\\", "\\\\").replace('"', '\\"')
+        return '"' + text.replace("\r", "").replace("\n", "\\n") + '"'
+
+    def iter_dot(self) -> Iterator[str]:
+        """Yields the flowchart as a DOT digraph, a statement at a time"""
+        yield f"digraph {self.quote(self.flowchart.name)} {{\n"
+        yield "\tnode [style=filled];\n"
+        for node in self.flowchart.nodes:
+            shape = self.SHAPES.get(node.nx_shape.value, "box")
+            yield (
+                f"\t{self.quote(node.uid)} [label={self.quote(node.label)},"
+                f" shape={shape}, fillcolor={self.quote(node.color)}];\n"
+            )
+        for connector in self.flowchart.connectors:
+            prev_uid = self.quote(connector.prev.uid)
+            next_uid = self.quote(connector.next.uid)
+            edge = f"\t{prev_uid} -> {next_uid}"
+            if connector.condition_label:
+                yield f"{edge} [label={self.quote(connector.condition_label)}];\n"
+            else:
+                yield f"{edge};\n"
+        yield "}\n"
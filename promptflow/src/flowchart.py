@@ -3,13 +3,14 @@ This module contains the Flowchart class, which manages the nodes and connectors
 """
 from __future__ import annotations
 
+import asyncio
 import datetime
+import functools
 import logging
 import os
-import threading
 import time
-from queue import Queue
-from typing import TYPE_CHECKING, Any, Callable, List, Optional
+from concurrent.futures import Executor, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, Callable, Iterator, List, Optional
 
 import networkx as nx
 import redis
@@ -18,13 +19,28 @@ from pydantic import BaseModel  # pylint: disable=no-name-in-module
 from promptflow.src.connectors.connector import (
     DEFAULT_COND_NAME,
     DEFAULT_COND_TEMPLATE,
+    ConditionError,
     Connector,
 )
 from promptflow.src.connectors.partial_connector import PartialConnector
+from promptflow.src.cost import estimate_cost
+from promptflow.src.exporters import (
+    DotConverter,
+    FlowchartJSConverter,
+    GraphMLConverter,
+)
 from promptflow.src.mermaid_converter import MermaidConverter
+from promptflow.src.node_cache import (
+    NodeCache,
+    NodeCacheStats,
+    get_node_cache,
+    node_cache_key,
+)
 from promptflow.src.node_map import node_map
+from promptflow.src.nodes.join_node import JoinNode
 from promptflow.src.nodes.node_base import NodeBase
 from promptflow.src.nodes.start_node import InitNode, StartNode
+from promptflow.src.scheduler import ExecutionPlan, ExecutionQueue
 
 if TYPE_CHECKING:
     from promptflow.src.postgres_interface import DBInterface
@@ -33,6 +49,35 @@ from promptflow.src.state import State
 from promptflow.src.text_data import TextData
 
 
+# called after each node with the node, the state and the remaining work
+CheckpointFunction = Callable[[NodeBase, State, ExecutionQueue], None]
+
+
+def input_status(before_result: dict[str, Any]) -> str:
+    """
+    Job status for a node waiting on the input its before() asked for
+    """
+    if "input" in before_result:
+        return "INPUT_REQUIRED"
+    if "filename" in before_result:
+        return "FILE_INPUT_REQUIRED"
+    raise ValueError(f"Unknown before result: {before_result}")
+
+
+class InputRequired(Exception):
+    """
+    Raised to suspend a run when a node needs input from the user.
+    The node is put back at the head of the queue, so the run can be
+    resumed from the queue once the input has been posted.
+    """
+
+    def __init__(self, node: NodeBase, before_result: dict[str, Any]):
+        super().__init__(f"Node {node.label} requires input")
+        self.node = node
+        self.status = input_status(before_result)
+        self.queue: Optional[ExecutionQueue] = None
+
+
 class FlowchartJson(BaseModel):
     """A flowchart json file"""
 
@@ -43,6 +88,21 @@ class FlowchartJson(BaseModel):
     created: Optional[str] = None
 
 
+class FlowchartPatch(BaseModel):
+    """
+    Changes to a saved flowchart. Nodes and branches are inserted or
+    replaced by uid, and the deleted ones are given by uid. With a version,
+    the patch is only applied if the flowchart is still at that version.
+    """
+
+    label: Optional[str] = None
+    version: Optional[int] = None
+    nodes: list[dict] = []
+    deleted_nodes: list[str] = []
+    branches: list[dict] = []
+    deleted_branches: list[str] = []
+
+
 class Flowchart:
     """
     Holds the nodes and connectors of a flowchart.
@@ -72,6 +132,8 @@ class Flowchart:
         self.graph = nx.DiGraph()
         self.nodes: list[NodeBase] = []
         self.connectors: list[Connector] = []
+        self._nodes_by_uid: dict[str, NodeBase] = {}
+        self._plan: Optional[ExecutionPlan] = None
         self.text_data_registry: dict[str, TextData] = {}
         self.logger = logging.getLogger(__name__)
 
@@ -80,6 +142,31 @@ class Flowchart:
 
         self.is_dirty = False
         self.is_running = False
+        # suspend with InputRequired instead of blocking until input arrives
+        self.suspend_on_input = False
+        # input posted for nodes of a resumed run, by node uid
+        self.pending_inputs: dict[str, Any] = {}
+
+        # resolved when a cacheable node first runs, so flowcharts that are
+        # only exported or validated don't depend on NODE_CACHE
+        self._node_cache: Optional[NodeCache] = None
+        self._node_cache_resolved = False
+        self.cache_stats = NodeCacheStats()
+
+    @property
+    def node_cache(self) -> Optional[NodeCache]:
+        """
+        The node cache configured by NODE_CACHE, looked up on first use
+        """
+        if not self._node_cache_resolved:
+            self._node_cache = get_node_cache()
+            self._node_cache_resolved = True
+        return self._node_cache
+
+    @node_cache.setter
+    def node_cache(self, node_cache: Optional[NodeCache]) -> None:
+        self._node_cache = node_cache
+        self._node_cache_resolved = True
 
     @classmethod
     def get_flowchart_by_uid(cls, uid, interface: DBInterface):
@@ -116,6 +203,7 @@ class Flowchart:
                 uid=connector_data["uid"],
             )
             flowchart.add_connector(connector)
+        flowchart.compile()
         flowchart.is_dirty = False
         return flowchart
 
@@ -131,51 +219,70 @@ class Flowchart:
         self.logger.info("Selected element changed to %s", elem.label if elem else None)
         self._selected_element = elem
 
+    @property
+    def plan(self) -> ExecutionPlan:
+        """
+        Execution plan for the current graph, rebuilt on first use after a change
+        """
+        if self._plan is None:
+            self._plan = ExecutionPlan(self)
+        return self._plan
+
+    def compile(self) -> ExecutionPlan:
+        """
+        Build the execution plan now instead of on first use
+        """
+        return self.plan
+
+    def invalidate_plan(self) -> None:
+        """
+        Drop the execution plan after the graph has been changed
+        """
+        self._plan = None
+
     @property
     def start_node(self) -> StartNode:
         """
         Find and return the node with the class StartNode
         """
-        start_nodes = [node for node in self.nodes if isinstance(node, StartNode)]
-        if len(start_nodes) == 0:
+        start_node = self.plan.start_node
+        if start_node is None:
             raise ValueError("No start node found")
-
-        if len(start_nodes) == 1:
-            return start_nodes[0]
-
-        # sort by number of input connectors
-        start_nodes.sort(key=lambda node: len(node.input_connectors))
-        return start_nodes[0]
+        return start_node
 
     @property
     def init_node(self) -> Optional[InitNode]:
         """
         Find and returns the single-run InitNode
         """
-        try:
-            return [node for node in self.nodes if isinstance(node, InitNode)][0]
-        except IndexError:
-            return None
+        return self.plan.init_node
 
     def find_node(self, node_id: str) -> NodeBase:
         """
         Given a node id, find and return the node
         """
-        for node in self.nodes:
-            if node.uid == node_id:
-                return node
-        raise ValueError(f"No node with uid {node_id} found")
+        try:
+            return self._nodes_by_uid[node_id]
+        except KeyError as exc:
+            raise ValueError(f"No node with uid {node_id} found") from exc
+
+    def has_node(self, node_id: str) -> bool:
+        """
+        True if a node with the given uid is in the flowchart
+        """
+        return node_id in self._nodes_by_uid
 
     def add_node(self, node: NodeBase) -> NodeBase:
         """
         Safely insert a node into the flowchart
         """
-        while node in self.nodes:
-            self.logger.debug("Duplicate node found, adding (copy) to label...")
-            node.label += " (copy)"
+        if node.uid in self._nodes_by_uid:
+            raise ValueError(f"Duplicate node with uid {node.uid}")
         # todo handle offset
         self.nodes.append(node)
+        self._nodes_by_uid[node.uid] = node
         self.graph.add_node(node)
+        self.invalidate_plan()
         self.selected_element = node
         self.is_dirty = True
         return node
@@ -188,6 +295,7 @@ class Flowchart:
         self.logger.debug(f"Adding connector {connector}")
         self.connectors.append(connector)
         self.graph.add_edge(connector.prev, connector.next)
+        self.invalidate_plan()
         self.selected_element = connector
         self.is_dirty = True
         return connector
@@ -198,6 +306,8 @@ class Flowchart:
         state: State,
         interface: DBInterface,
         logging_function: Callable[[str], None],
+        queue: Optional[ExecutionQueue] = None,
+        checkpoint_function: Optional[CheckpointFunction] = None,
     ) -> Optional[State]:
         """
         Initialize the flowchart
@@ -207,143 +317,610 @@ class Flowchart:
         if not init_node or init_node.run_once:
             self.logger.info("Flowchart already initialized")
             return state
-        queue: Queue[NodeBase] = Queue()
-        queue.put(init_node)
+        if queue is None:
+            queue = ExecutionQueue([init_node])
         return self.run(
-            job_id, state, interface, queue, logging_function=logging_function
+            job_id,
+            state,
+            interface,
+            queue,
+            logging_function=logging_function,
+            checkpoint_function=checkpoint_function,
         )
 
+    async def ainitialize(
+        self,
+        job_id: int,
+        state: State,
+        interface: DBInterface,
+        logging_function: Callable[[str], None],
+        queue: Optional[ExecutionQueue] = None,
+        checkpoint_function: Optional[CheckpointFunction] = None,
+    ) -> Optional[State]:
+        """
+        Async version of initialize
+        """
+        self.is_running = True
+        init_node: Optional[InitNode] = self.init_node
+        if not init_node or init_node.run_once:
+            self.logger.info("Flowchart already initialized")
+            return state
+        if queue is None:
+            queue = ExecutionQueue([init_node])
+        return await self.arun(
+            job_id,
+            state,
+            interface,
+            queue,
+            logging_function=logging_function,
+            checkpoint_function=checkpoint_function,
+        )
+
+    def prepare_queue(self, queue: Optional[ExecutionQueue]) -> ExecutionQueue:
+        """
+        Return the queue to run, starting from the start node if needed.
+        A queue restored from a checkpoint is run as it is.
+        """
+        if queue is None:
+            queue = ExecutionQueue([self.start_node])
+        elif queue.done() and not self.is_running:
+            queue.put(self.start_node)
+        self.is_running = True
+        return queue
+
     def run(
         self,
         job_id: int,
         state: Optional[State],
         interface: DBInterface,
-        queue: Optional[Queue[NodeBase]] = None,
+        queue: Optional[ExecutionQueue] = None,
         logging_function: Callable[[str], None] = lambda x: None,
+        max_workers: int = 1,
+        checkpoint_function: Optional[CheckpointFunction] = None,
     ) -> Optional[State]:
         """
-        Given a state, run the flowchart and update the state
+        Given a state, run the flowchart and update the state.
+        With max_workers > 1, sibling branches run concurrently on forked
+        states and are merged back together at a JoinNode. Branches at every
+        level share one pool, so at most max_workers of them run at once.
         """
         self.logger.info("Running flowchart")
-        if not queue:
-            queue = Queue()
-            queue.put(self.start_node)
-            self.is_running = True
-        if queue.empty() and not self.is_running:
-            queue.put(self.start_node)
-            self.is_running = True
+        queue = self.prepare_queue(queue)
         state = state or State()
+        # the thread that forks runs a branch too, so the pool needs one less
+        with ThreadPoolExecutor(
+            max_workers=max(max_workers - 1, 1), thread_name_prefix="branch"
+        ) as executor:
+            self.run_queue(
+                queue,
+                state,
+                job_id,
+                interface,
+                logging_function,
+                max_workers,
+                checkpoint_function=checkpoint_function,
+                executor=executor,
+            )
+        self.logger.info("Flowchart stopped")
+        self.is_running = False
+        return state
 
-        if not queue.empty():
-            if not self.is_running:
-                self.logger.info("Flowchart stopped")
-                self.is_running = False
-                return state
-            cur_node: NodeBase = queue.get()
-            self.logger.info(f"Running node {cur_node.label}")
-            before_result = cur_node.before(state)
-            if before_result:
-                redis_url = os.environ.get("REDIS_URL")
-                if not redis_url:
-                    raise ValueError("REDIS_URL not set")
-                red = redis.StrictRedis.from_url(redis_url)
-                if "input" in before_result:
-                    self.logger.info(f"Node {cur_node.label} requires user input")
-                    interface.update_job_status(job_id, "INPUT_REQUIRED")
-
-                elif "filename" in before_result:
-                    self.logger.info(f"Node {cur_node.label} requires filename input")
-                    interface.update_job_status(job_id, "FILE_INPUT_REQUIRED")
-
-                else:
-                    raise ValueError(f"Unknown before result: {before_result}")
-
-                # wait for input
-                sub = red.pubsub()
-                sub.subscribe(f"{job_id}/input")
-                input_received = False
-                while not input_received:
-                    for msg in sub.listen():
-                        self.logger.info(f"Received message: {msg}")
-                        if msg and msg["type"] == "message":
-                            data = msg.get("data")
-                            if data:
-                                before_result["input"] = data.decode()
-                                input_received = True
-                                break
+    async def arun(
+        self,
+        job_id: int,
+        state: Optional[State],
+        interface: DBInterface,
+        queue: Optional[ExecutionQueue] = None,
+        logging_function: Callable[[str], None] = lambda x: None,
+        max_workers: int = 1,
+        checkpoint_function: Optional[CheckpointFunction] = None,
+    ) -> Optional[State]:
+        """
+        Async version of run. Nodes with a native arun_subclass are awaited
+        on the event loop, the rest are run in a thread executor.
+        """
+        self.logger.info("Running flowchart")
+        queue = self.prepare_queue(queue)
+        state = state or State()
+        await self.arun_queue(
+            queue,
+            state,
+            job_id,
+            interface,
+            logging_function,
+            max_workers,
+            checkpoint_function=checkpoint_function,
+        )
+        self.logger.info("Flowchart stopped")
+        self.is_running = False
+        return state
 
-            try:
-                thread = threading.Thread(
-                    target=cur_node.run_node,
-                    args=(before_result, state),
-                    daemon=True,
+    def run_queue(
+        self,
+        queue: ExecutionQueue,
+        state: State,
+        job_id: int,
+        interface: DBInterface,
+        logging_function: Callable[[str], None],
+        max_workers: int = 1,
+        arrivals: Optional[list[NodeBase]] = None,
+        checkpoint_function: Optional[CheckpointFunction] = None,
+        executor: Optional[Executor] = None,
+    ) -> bool:
+        """
+        Run nodes until the queue is drained.
+        When arrivals is given, the queue belongs to a parallel branch and any
+        JoinNode it reaches is recorded there instead of being run.
+        With suspend_on_input set, a node that needs input raises InputRequired
+        (outside of parallel branches, which always wait for it).
+        checkpoint_function is called with the state and the remaining work
+        after every node, so an interrupted run can be resumed from there.
+        Forked branches run on executor, which run provides.
+        Returns False if the flowchart was stopped externally.
+        """
+        while True:
+            if not queue.empty():
+                if not self.is_running:
+                    return False
+                cur_node: NodeBase = queue.get()
+                try:
+                    output = self.execute_node(
+                        cur_node,
+                        job_id,
+                        state,
+                        interface,
+                        logging_function,
+                        suspend=arrivals is None,
+                    )
+                except InputRequired as suspended:
+                    queue.requeue(cur_node)
+                    suspended.queue = queue
+                    raise
+                targets = self.schedule_successors(
+                    cur_node, output, state, queue, max_workers, arrivals
                 )
-                thread.start()
-                while thread.is_alive():
-                    pass
-                thread.join()
-                output = state.result
-                logging_function(f"Node {cur_node.label} output: {str(output)}")
-            except Exception as node_err:
-                self.logger.error(
-                    f"Error running node {cur_node.label}: {node_err}", exc_info=True
+                if targets:
+                    if executor is None:
+                        raise ValueError("Forking branches requires an executor")
+                    self.fork(
+                        executor,
+                        targets,
+                        state,
+                        queue,
+                        job_id,
+                        interface,
+                        logging_function,
+                        max_workers,
+                        arrivals,
+                    )
+                if checkpoint_function:
+                    checkpoint_function(cur_node, state, queue)
+            elif not self.advance(queue, state, logging_function, arrivals):
+                return True
+
+    async def arun_queue(
+        self,
+        queue: ExecutionQueue,
+        state: State,
+        job_id: int,
+        interface: DBInterface,
+        logging_function: Callable[[str], None],
+        max_workers: int = 1,
+        arrivals: Optional[list[NodeBase]] = None,
+        checkpoint_function: Optional[CheckpointFunction] = None,
+    ) -> bool:
+        """
+        Async version of run_queue
+        """
+        while True:
+            if not queue.empty():
+                if not self.is_running:
+                    return False
+                cur_node: NodeBase = queue.get()
+                try:
+                    output = await self.aexecute_node(
+                        cur_node,
+                        job_id,
+                        state,
+                        interface,
+                        logging_function,
+                        suspend=arrivals is None,
+                    )
+                except InputRequired as suspended:
+                    queue.requeue(cur_node)
+                    suspended.queue = queue
+                    raise
+                targets = self.schedule_successors(
+                    cur_node, output, state, queue, max_workers, arrivals
                 )
-                raise node_err
-            self.logger.info(f"Node {cur_node.label} output: {output}")
+                if targets:
+                    await self.afork(
+                        targets,
+                        state,
+                        queue,
+                        job_id,
+                        interface,
+                        logging_function,
+                        max_workers,
+                        arrivals,
+                    )
+                if checkpoint_function:
+                    checkpoint_function(cur_node, state, queue)
+            elif not self.advance(queue, state, logging_function, arrivals):
+                return True
+
+    def schedule_successors(
+        self,
+        cur_node: NodeBase,
+        output: Optional[str],
+        state: State,
+        queue: ExecutionQueue,
+        max_workers: int,
+        arrivals: Optional[list[NodeBase]] = None,
+    ) -> list[NodeBase]:
+        """
+        Decide what runs after a node has finished.
+        Returns the successors that have to be forked into parallel branches.
+        """
+        if output is None:
+            self.logger.info(
+                f"Node {cur_node.label} output is None, stopping execution"
+            )
+            return []
+
+        if state.exception:
+            self.logger.info(
+                f"Node {cur_node.label} raised exception, stopping execution"
+            )
+            return []
 
-            if output is None:
-                self.logger.info(
-                    f"Node {cur_node.label} output is None, stopping execution"
+        if max_workers > 1:
+            targets = self.evaluate_connectors(cur_node, state)
+            if len(targets) > 1:
+                return targets
+            for target in targets:
+                self.enqueue(queue, target, arrivals)
+            return []
+
+        queue.push_frame(cur_node)
+        return []
+
+    def advance(
+        self,
+        queue: ExecutionQueue,
+        state: State,
+        logging_function: Callable[[str], None],
+        arrivals: Optional[list[NodeBase]] = None,
+    ) -> bool:
+        """
+        Evaluate the next pending connector, queueing its node if the
+        condition is true. Returns False when no connectors are left.
+        """
+        connector = queue.next_connector()
+        if connector is None:
+            return False
+        try:
+            cond = self.evaluate_condition(connector, state)
+        except ConditionError as cond_err:
+            # log complete error traceback
+            self.logger.error(str(cond_err), exc_info=True)
+            logging_function(str(cond_err))
+            queue.pop_frame()
+            return True
+        if cond:
+            self.enqueue(queue, connector.next, arrivals)
+        return True
+
+    def evaluate_condition(self, connector: Connector, state: State) -> bool:
+        """
+        Evaluate a connector's condition against the state.
+        An empty condition is always true.
+        """
+        cond = connector.evaluate(state)
+        self.logger.info(f"Condition {connector.condition} evaluated to {cond}")
+        return cond
+
+    def evaluate_connectors(self, node: NodeBase, state: State) -> list[NodeBase]:
+        """
+        Return the successors of a node whose connector conditions are true,
+        in connector order. Stops at the first condition that raises.
+        """
+        targets: list[NodeBase] = []
+        for connector in self.plan.output_connectors[node]:
+            try:
+                cond = self.evaluate_condition(connector, state)
+            except ConditionError as cond_err:
+                self.logger.error(str(cond_err), exc_info=True)
+                break
+            if cond and connector.next not in targets:
+                targets.append(connector.next)
+        return targets
+
+    def enqueue(
+        self,
+        queue: ExecutionQueue,
+        node: NodeBase,
+        arrivals: Optional[list[NodeBase]] = None,
+    ) -> None:
+        """
+        Add a node to the queue, or record it as reached if it is the
+        JoinNode a parallel branch is running towards.
+        """
+        if arrivals is not None and isinstance(node, JoinNode):
+            if node not in arrivals:
+                arrivals.append(node)
+            self.logger.info(f"Branch reached join node {node.label}")
+        elif queue.put(node):
+            self.logger.info(f"Added node {node.label} to queue")
+
+    def fork(
+        self,
+        executor: Executor,
+        targets: list[NodeBase],
+        state: State,
+        queue: ExecutionQueue,
+        job_id: int,
+        interface: DBInterface,
+        logging_function: Callable[[str], None],
+        max_workers: int,
+        arrivals: Optional[list[NodeBase]] = None,
+    ) -> None:
+        """
+        Run each target as its own branch on a copy of the state, wait for all
+        of them, then merge the branch states back in target order and queue
+        the join nodes they reached.
+        The calling thread runs the first branch, and any branch the executor
+        hasn't started by the time it is waited for, so nested forks never
+        wait on a pool they are blocking.
+        """
+        self.logger.info(f"Forking {len(targets)} parallel branches")
+        branch_states = [state.copy() for _ in targets]
+        branch_arrivals: list[list[NodeBase]] = [[] for _ in targets]
+        branches = [
+            functools.partial(
+                self.run_queue,
+                ExecutionQueue([target]),
+                branch_state,
+                job_id,
+                interface,
+                logging_function,
+                max_workers,
+                branch_arrival,
+                executor=executor,
+            )
+            for target, branch_state, branch_arrival in zip(
+                targets, branch_states, branch_arrivals
+            )
+        ]
+        futures = [executor.submit(branch) for branch in branches[1:]]
+        try:
+            branches[0]()
+            for branch, future in zip(branches[1:], futures):
+                if future.cancel():
+                    branch()
+                else:
+                    future.result()
+        finally:
+            # a failed branch fails the run, once the others have stopped
+            for future in futures:
+                future.cancel()
+            wait([future for future in futures if not future.cancelled()])
+        state.merge(branch_states)
+        for branch_arrival in branch_arrivals:
+            for join_node in branch_arrival:
+                self.enqueue(queue, join_node, arrivals)
+
+    async def afork(
+        self,
+        targets: list[NodeBase],
+        state: State,
+        queue: ExecutionQueue,
+        job_id: int,
+        interface: DBInterface,
+        logging_function: Callable[[str], None],
+        max_workers: int,
+        arrivals: Optional[list[NodeBase]] = None,
+    ) -> None:
+        """
+        Async version of fork, with at most max_workers branches running at once
+        """
+        self.logger.info(f"Forking {len(targets)} parallel branches")
+        branch_states = [state.copy() for _ in targets]
+        branch_arrivals: list[list[NodeBase]] = [[] for _ in targets]
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def run_branch(
+            target: NodeBase, branch_state: State, branch_arrival: list[NodeBase]
+        ) -> bool:
+            async with semaphore:
+                return await self.arun_queue(
+                    ExecutionQueue([target]),
+                    branch_state,
+                    job_id,
+                    interface,
+                    logging_function,
+                    max_workers,
+                    branch_arrival,
                 )
-                return state
 
-            if state.exception:
-                self.logger.info(
-                    f"Node {cur_node.label} raised exception, stopping execution"
+        await asyncio.gather(
+            *[
+                run_branch(target, branch_state, branch_arrival)
+                for target, branch_state, branch_arrival in zip(
+                    targets, branch_states, branch_arrivals
                 )
-                return state
-
-            for connector in cur_node.output_connectors:
-                if connector.condition.text.strip():
-                    # evaluate condition and only add node2 to queue if condition is true
-                    exec(
-                        connector.condition.text.strip(),
-                        dict(globals()),
-                        state.snapshot,
-                    )
-                    try:
-                        cond = state.snapshot["main"](state)  # type: ignore
-                    except Exception as node_err:
-                        # log complete error traceback
-                        self.logger.error(
-                            f"Error evaluating condition: {node_err}",
-                            exc_info=True,
-                        )
+            ]
+        )
+        state.merge(branch_states)
+        for branch_arrival in branch_arrivals:
+            for join_node in branch_arrival:
+                self.enqueue(queue, join_node, arrivals)
+
+    def wait_for_input(
+        self,
+        cur_node: NodeBase,
+        before_result: dict[str, Any],
+        job_id: int,
+        interface: DBInterface,
+    ) -> dict[str, Any]:
+        """
+        Block until the user posts the input or file a node asked for
+        """
+        redis_url = os.environ.get("REDIS_URL")
+        if not redis_url:
+            raise ValueError("REDIS_URL not set")
+        red = redis.StrictRedis.from_url(redis_url)
+        status = input_status(before_result)
+        self.logger.info(f"Node {cur_node.label} waiting for input ({status})")
+        interface.update_job_status(job_id, status)
+
+        # wait for input
+        sub = red.pubsub()
+        sub.subscribe(f"{job_id}/input")
+        input_received = False
+        while not input_received:
+            for msg in sub.listen():
+                self.logger.info(f"Received message: {msg}")
+                if msg and msg["type"] == "message":
+                    data = msg.get("data")
+                    if data:
+                        before_result["input"] = data.decode()
+                        input_received = True
                         break
-                    self.logger.info(
-                        f"Condition {connector.condition} evaluated to {cond}"
-                    )
-                else:
-                    cond = True
-                if cond:
-                    # if connector.node2 not in queue:
-                    if queue.queue.count(connector.next) == 0:
-                        queue.put(connector.next)
-                        self.run(
-                            job_id,
-                            state,
-                            interface,
-                            queue,
-                            logging_function=logging_function,
-                        )
-                    self.logger.info(f"Added node {connector.next.label} to queue")
-
-        if queue.empty():
-            self.logger.info("Flowchart stopped")
-            self.is_running = False
-            return state
+        return before_result
+
+    def take_input(
+        self, cur_node: NodeBase, before_result: dict[str, Any], suspend: bool
+    ) -> bool:
+        """
+        Fill in input posted for a node of a resumed run. Returns False if
+        there is none and the caller has to wait for it, or raises
+        InputRequired if the run should be suspended instead.
+        """
+        if cur_node.uid in self.pending_inputs:
+            before_result["input"] = self.pending_inputs.pop(cur_node.uid)
+            return True
+        if suspend and self.suspend_on_input:
+            raise InputRequired(cur_node, before_result)
+        return False
+
+    def execute_node(
+        self,
+        cur_node: NodeBase,
+        job_id: int,
+        state: State,
+        interface: DBInterface,
+        logging_function: Callable[[str], None],
+        suspend: bool = False,
+    ) -> Optional[str]:
+        """
+        Run a single node on the calling thread.
+        Gets user input first if the node asks for it.
+        """
+        self.logger.info(f"Running node {cur_node.label}")
+        before_result = cur_node.before(state)
+        if before_result and not self.take_input(cur_node, before_result, suspend):
+            before_result = self.wait_for_input(
+                cur_node, before_result, job_id, interface
+            )
 
-        raise RuntimeError("Flowchart stopped unexpectedly")
+        key = self.cache_key(cur_node, state)
+        try:
+            if not self.load_cached(cur_node, key, state):
+                cur_node.run_node(before_result, state)
+                self.store_cached(key, state)
+            output = state.result
+            logging_function(f"Node {cur_node.label} output: {str(output)}")
+        except Exception as node_err:
+            self.logger.error(
+                f"Error running node {cur_node.label}: {node_err}", exc_info=True
+            )
+            raise node_err
+        self.logger.info(f"Node {cur_node.label} output: {output}")
+        return output
+
+    async def aexecute_node(
+        self,
+        cur_node: NodeBase,
+        job_id: int,
+        state: State,
+        interface: DBInterface,
+        logging_function: Callable[[str], None],
+        suspend: bool = False,
+    ) -> Optional[str]:
+        """
+        Async version of execute_node. Waiting for user input happens
+        in a thread executor.
+        """
+        self.logger.info(f"Running node {cur_node.label}")
+        before_result = cur_node.before(state)
+        if before_result and not self.take_input(cur_node, before_result, suspend):
+            loop = asyncio.get_running_loop()
+            before_result = await loop.run_in_executor(
+                None, self.wait_for_input, cur_node, before_result, job_id, interface
+            )
+
+        key = self.cache_key(cur_node, state)
+        try:
+            if not self.load_cached(cur_node, key, state):
+                await cur_node.arun_node(before_result, state)
+                self.store_cached(key, state)
+            output = state.result
+            logging_function(f"Node {cur_node.label} output: {str(output)}")
+        except Exception as node_err:
+            self.logger.error(
+                f"Error running node {cur_node.label}: {node_err}", exc_info=True
+            )
+            raise node_err
+        self.logger.info(f"Node {cur_node.label} output: {output}")
+        return output
+
+    def cache_key(self, node: NodeBase, state: State) -> Optional[str]:
+        """
+        Node cache key for running node on state, or None if it isn't cached
+        """
+        if not node.cache or self.node_cache is None:
+            return None
+        try:
+            return node_cache_key(node, state)
+        except Exception as exc:  # pylint: disable=broad-except
+            # a node that can't be keyed still runs, just without the cache
+            self.logger.warning(f"Not caching node {node.label}: {exc}")
+            return None
+
+    def load_cached(self, node: NodeBase, key: Optional[str], state: State) -> bool:
+        """
+        Apply a cached output to the state as if the node had run.
+        Returns False on a miss.
+        """
+        if key is None or self.node_cache is None:
+            return False
+        try:
+            output = self.node_cache.get(key)
+        except Exception as exc:  # pylint: disable=broad-except
+            self.logger.warning(f"Node cache lookup failed: {exc}")
+            output = None
+        if output is None:
+            self.cache_stats.miss()
+            return False
+        self.cache_stats.hit()
+        self.logger.info(f"Using cached output for node {node.label}")
+        state.snapshot[node.label] = output
+        state.result = output
+        return True
+
+    def store_cached(self, key: Optional[str], state: State) -> None:
+        """
+        Cache the output of a node that ran without errors
+        """
+        if key is None or self.node_cache is None:
+            return
+        if state.exception or state.result is None:
+            return
+        try:
+            self.node_cache.set(key, state.result)
+        except Exception as exc:  # pylint: disable=broad-except
+            self.logger.warning(f"Could not cache node output: {exc}")
 
     def begin_add_connector(self, node: NodeBase):
         """
@@ -377,6 +954,8 @@ class Flowchart:
         self.logger.info(f"Removing node {node}")
         if node in self.nodes:
             self.nodes.remove(node)
+        self._nodes_by_uid.pop(node.uid, None)
+        self.invalidate_plan()
         # remove all connectors connected to this node
         for other_node in self.nodes:
             for connector in other_node.connectors:
@@ -402,10 +981,12 @@ class Flowchart:
         for node in self.nodes:
             node.delete()
         self.nodes = []
+        self._nodes_by_uid = {}
         for connector in self.connectors:
             connector.delete()
         self.connectors = []
         self.graph.clear()
+        self.invalidate_plan()
         self.is_dirty = True
 
     def register_text_data(self, text_data: TextData) -> None:
@@ -418,74 +999,61 @@ class Flowchart:
 
     def cost(self, state: State) -> float:
         """
-        Return the cost of the flowchart.
+        Return the cost of the flowchart if every node reachable from the
+        start node runs.
         """
-        cost = 0.0
-        for node in self.nodes:
-            cost += node.cost(state)
-        return cost
+        return estimate_cost(self, state).max_cost
+
+    def iter_mermaid(self) -> Iterator[str]:
+        """
+        Yield a mermaid representation of the flowchart, a line at a time.
+        """
+        return MermaidConverter(self).iter_mermaid()
 
     def to_mermaid(self) -> str:
         """
         Return a mermaid string representation of the flowchart.
         """
-        converter = MermaidConverter(self)
-        return converter.to_mermaid()
+        return "".join(self.iter_mermaid())
+
+    def iter_flowchart_js(self) -> Iterator[str]:
+        """
+        Yield the flowchart in flowchart.js syntax, a line at a time.
+        """
+        return FlowchartJSConverter(self).iter_flowchart_js()
 
     def to_flowchart_js(self) -> str:
         """
         Convert the flowchart to a flowchart.js string.
         """
-
-        def strip_symbols(text: str) -> str:
-            sequences_to_remove = ["=>", "->", ":>", "|", "@>", ":$"]
-            for seq in sequences_to_remove:
-                text = text.replace(seq, "")
-            return text
-
-        def sanitize_identifier(identifier: str) -> str:
-            return strip_symbols(identifier.replace(" ", "_").replace("'", ""))
-
-        def sanitize_label(label: str) -> str:
-            return strip_symbols(label.replace("'", ""))
-
-        flowchart_str = ""
-        for node in self.nodes:
-            uid = sanitize_identifier(node.uid)
-            label = sanitize_label(node.label)
-            flowchart_str += f"{uid}=>{node.js_shape.value}: {label}|{node.uid}\n"
-        for connector in self.sorted_connectors():
-            prev_uid = sanitize_identifier(connector.prev.uid)
-            next_uid = sanitize_identifier(connector.next.uid)
-            flowchart_str += f"{prev_uid}->{next_uid}\n"
-        return flowchart_str
+        return "".join(self.iter_flowchart_js())
 
     def get_color_map(self) -> dict[str, str]:
         return {node.uid: node.color for node in self.nodes}
 
+    def iter_graph_ml(self) -> Iterator[str]:
+        """
+        Yield the flowchart as a GraphML document, an element at a time.
+        """
+        return GraphMLConverter(self).iter_graph_ml()
+
     def to_graph_ml(self) -> str:
         """
         Convert the flowchart to graphml
         """
-        graphml_string = """<?xml version="1.0" encoding="UTF-8"?>
-        <graphml xmlns="http://graphml.graphdrawing.org/xmlns">
+        return "".join(self.iter_graph_ml())
+
+    def iter_dot(self) -> Iterator[str]:
         """
-        for node in self.nodes:
-            graphml_string += f"""<node id="{node.uid}">
-            <data key="d0">{node.label}</data>
-            </node>
-            """
-        for connector in self.connectors:
-            if connector.condition_label:
-                graphml_string += f"""<edge source="{connector.prev.uid}" target="{connector.next.uid}">
-                <data key="d0">{connector.condition_label}</data>
-                </edge>
-                """
-            else:
-                graphml_string += f"""<edge source="{connector.prev.uid}" target="{connector.next.uid}"/>
-                """
-        graphml_string += "\r</graphml>"
-        return graphml_string
+        Yield the flowchart as a Graphviz DOT digraph, a statement at a time.
+        """
+        return DotConverter(self).iter_dot()
+
+    def to_dot(self) -> str:
+        """
+        Convert the flowchart to Graphviz DOT
+        """
+        return "".join(self.iter_dot())
 
     def arrange_networkx(self, algorithm: Callable) -> dict[str, tuple[float, float]]:
         """
@@ -501,15 +1069,4 @@ class Flowchart:
         """
         Return a list of connectors sorted by their distance from the start node.
         """
-        connectors = []
-        for connector in self.connectors:
-            connectors.append(
-                (
-                    connector,
-                    dict(nx.all_pairs_shortest_path(self.graph))[self.start_node][
-                        connector.prev
-                    ],
-                )
-            )
-        connectors.sort(key=lambda x: x[1])
-        return [connector[0] for connector in connectors]
+        return list(self.plan.sorted_connectors)
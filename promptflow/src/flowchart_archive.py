@@ -0,0 +1,207 @@
+"""
+Zip archives of flowcharts and the embedding files their nodes use. Archives
+are written while they are streamed to the client and read from the uploaded
+file, so nothing is staged in the working directory.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import posixpath
+import re
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Iterable, Iterator
+
+if TYPE_CHECKING:
+    from promptflow.src.flowchart import Flowchart
+
+FLOWCHART_FILE = "flowchart.json"
+# bytes read from an embedding file per write to the archive
+ARCHIVE_CHUNK_SIZE = 64 * 1024
+# relative EMBEDDINGS_DIR settings are resolved against the project root
+PROJECT_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+class FlowchartArchiveError(ValueError):
+    """An upload that isn't a flowchart archive"""
+
+
+class _ZipStream(io.RawIOBase):
+    """
+    Unseekable file for ZipFile to write to, which keeps what was written
+    until it is drained
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> Iterator[bytes]:
+        """
+        Hand out everything written since the last drain
+        """
+        if self._chunks:
+            data = b"".join(self._chunks)
+            self._chunks = []
+            yield data
+
+
+def embeddings_dir() -> str:
+    """
+    Absolute directory imported embedding files are copied into, set by
+    EMBEDDINGS_DIR, so it doesn't depend on where the server was started
+    """
+    configured = os.path.expanduser(os.getenv("EMBEDDINGS_DIR", "embeddings"))
+    return str(PROJECT_DIR / configured)
+
+
+def flowchart_embeddings_dir(root: str, data: dict, index: int) -> str:
+    """
+    Subdirectory of root for the embedding files of one imported flowchart,
+    named after its uid, so flowcharts never share or overwrite files
+    """
+    name = re.sub(r"[^\w-]", "_", str(data.get("uid") or "")) or f"flowchart-{index}"
+    return os.path.join(root, name)
+
+
+def embedding_file_keys(node: dict) -> list[str]:
+    """
+    Keys of a serialized node that hold the paths of embedding files
+    """
+    if node.get("node_type") != "EmbeddingsIngestNode":
+        return []
+    return [key for key in ["filename", "label_file"] if node.get(key)]
+
+
+def set_embedding_file(node: dict, key: str, path: str) -> None:
+    """
+    Point a serialized node at another copy of one of its embedding files
+    """
+    node[key] = path
+    if key in node.get("metadata", {}):
+        node["metadata"][key] = path
+
+
+def write_embedding_file(
+    archive: zipfile.ZipFile, stream: _ZipStream, path: str, arcname: str
+) -> Iterator[bytes]:
+    """
+    Copy an embedding file into an archive a chunk at a time, yielding the
+    archive's bytes as they are written
+    """
+    info = zipfile.ZipInfo.from_file(path, arcname)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    with open(path, "rb") as src, archive.open(info, "w") as dst:
+        while chunk := src.read(ARCHIVE_CHUNK_SIZE):
+            dst.write(chunk)
+            yield from stream.drain()
+
+
+def iter_flowchart_archive(flowcharts: Iterable["Flowchart"]) -> Iterator[bytes]:
+    """
+    Write flowcharts into a zip archive, yielding it in chunks as it is
+    written. Each flowchart is kept in its own folder; embedding files are
+    stored once per archive under embeddings/, and the nodes are pointed at
+    them.
+    """
+    stream = _ZipStream()
+    embeddings: dict[str, str] = {}
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+        for index, flowchart in enumerate(flowcharts):
+            data = flowchart.serialize().dict()
+            for node in data["nodes"]:
+                for key in embedding_file_keys(node):
+                    path = os.path.abspath(node[key])
+                    if not os.path.isfile(path):
+                        logging.error(f"Embedding file {path} not found")
+                        continue
+                    if path not in embeddings:
+                        name = os.path.basename(path)
+                        arcname = f"embeddings/{len(embeddings)}-{name}"
+                        embeddings[path] = arcname
+                        yield from write_embedding_file(archive, stream, path, arcname)
+                    set_embedding_file(node, key, embeddings[path])
+            archive.writestr(
+                f"flowcharts/{index}/{FLOWCHART_FILE}", json.dumps(data, indent=4)
+            )
+            yield from stream.drain()
+    yield from stream.drain()
+
+
+def extract_embedding_file(
+    archive: zipfile.ZipFile, name: str, embeddings_dir: str
+) -> str:
+    """
+    Copy an embedding file out of an archive into embeddings_dir, named by
+    its content so importing the same file again reuses the copy. Returns
+    the path of the copy.
+    """
+    os.makedirs(embeddings_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    with archive.open(name) as src, tempfile.NamedTemporaryFile(
+        dir=embeddings_dir, delete=False
+    ) as dst:
+        while chunk := src.read(ARCHIVE_CHUNK_SIZE):
+            digest.update(chunk)
+            dst.write(chunk)
+    # only the base name is used, so members can't point outside the directory
+    path = os.path.join(
+        embeddings_dir, f"{digest.hexdigest()[:16]}-{posixpath.basename(name)}"
+    )
+    os.replace(dst.name, path)
+    return path
+
+
+def read_flowchart_archive(file: IO[bytes], embeddings_dir: str) -> list[dict]:
+    """
+    Read the flowcharts in an archive, in the order they were written,
+    copying their embedding files into a subdirectory of embeddings_dir per
+    flowchart. Archives with a single flowchart.json at the root are read
+    as well.
+    """
+    try:
+        archive = zipfile.ZipFile(file)
+    except zipfile.BadZipFile as exc:
+        raise FlowchartArchiveError("Not a zip archive") from exc
+    with archive:
+        names = [
+            name
+            for name in archive.namelist()
+            if posixpath.basename(name) == FLOWCHART_FILE
+        ]
+        if not names:
+            raise FlowchartArchiveError(f"No {FLOWCHART_FILE} in archive")
+        members = set(archive.namelist())
+        flowcharts = []
+        for index, name in enumerate(names):
+            try:
+                with archive.open(name) as flowchart_file:
+                    data = json.load(flowchart_file)
+            except json.JSONDecodeError as exc:
+                raise FlowchartArchiveError(f"{name} is not valid JSON") from exc
+            directory = flowchart_embeddings_dir(embeddings_dir, data, index)
+            extracted: dict[str, str] = {}
+            for node in data.get("nodes", []):
+                for key in embedding_file_keys(node):
+                    member = node[key]
+                    if member not in members:
+                        # the file may already be on this server
+                        logging.error(f"Embedding file {member} not in archive")
+                        continue
+                    if member not in extracted:
+                        extracted[member] = extract_embedding_file(
+                            archive, member, directory
+                        )
+                    set_embedding_file(node, key, extracted[member])
+            flowcharts.append(data)
+        return flowcharts
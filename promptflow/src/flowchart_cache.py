@@ -0,0 +1,183 @@
+"""
+Per-worker cache of flowchart definitions, so tasks don't reload and
+rehydrate the graph from the database every time they run a flowchart.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional
+
+import redis
+
+if TYPE_CHECKING:
+    from promptflow.src.flowchart import Flowchart
+    from promptflow.src.postgres_interface import DBInterface, FlowchartDocument
+
+FLOWCHART_CHANNEL = "promptflow:flowchart_changed"
+
+
+def publish_flowchart_change(uid: str) -> None:
+    """
+    Tell every worker that the flowchart with this uid was changed or deleted
+    """
+    redis_url = os.getenv("REDIS_URL")
+    if not redis_url:
+        return
+    try:
+        redis.StrictRedis.from_url(redis_url).publish(FLOWCHART_CHANNEL, uid)
+    except redis.RedisError as exc:
+        # workers fall back to comparing versions when they stop listening
+        logging.getLogger(__name__).error(f"Could not publish change: {exc}")
+
+
+class FlowchartCache:
+    """
+    Holds the documents of recently used flowcharts, keyed by uid and
+    graph version. Every lookup builds a new Flowchart from the document, so
+    jobs never share runtime state such as is_running or InitNode.run_once.
+
+    While subscribed to change broadcasts, entries are trusted until a
+    broadcast evicts them. Otherwise the version is checked on every lookup.
+    Each broadcast bumps a generation counter, and a document is only
+    cached if no broadcast for it arrived while it was being loaded.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.logger = logging.getLogger(__name__)
+        self._entries: OrderedDict[str, FlowchartDocument] = OrderedDict()
+        # bumped by every invalidation of one flowchart, or of all of them
+        self._generations: dict[str, int] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+
+    @property
+    def listening(self) -> bool:
+        """
+        True while change broadcasts are being received
+        """
+        return self._listener is not None and self._listener.is_alive()
+
+    def listen(self, redis_url: str) -> None:
+        """
+        Evict flowcharts as soon as another process changes them
+        """
+        pubsub = redis.StrictRedis.from_url(redis_url).pubsub(
+            ignore_subscribe_messages=True
+        )
+        pubsub.subscribe(
+            **{FLOWCHART_CHANNEL: lambda msg: self.invalidate(msg["data"].decode())}
+        )
+        self._listener = pubsub.run_in_thread(
+            sleep_time=1, daemon=True, exception_handler=self._on_listener_error
+        )
+
+    def _on_listener_error(self, exc: Exception, pubsub, thread) -> None:
+        # changes may have been missed, so nothing cached can be trusted
+        self.logger.error(f"Stopped listening for flowchart changes: {exc}")
+        thread.stop()
+        pubsub.close()
+        self.invalidate()
+
+    def invalidate(self, uid: Optional[str] = None) -> None:
+        """
+        Drop one flowchart, or all of them
+        """
+        with self._lock:
+            if uid is None:
+                self._entries.clear()
+                self._generation += 1
+            else:
+                self._entries.pop(uid, None)
+                self._generations[uid] = self._generations.get(uid, 0) + 1
+        self.logger.debug(f"Invalidated cached flowchart {uid or '*'}")
+
+    def get(self, uid: str, interface: DBInterface) -> Flowchart:
+        """
+        Return a new Flowchart for uid, loading it only if it is not cached
+        or has changed
+        """
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is not None:
+                self._entries.move_to_end(uid)
+            generation = (self._generation, self._generations.get(uid, 0))
+        if entry is not None and not self.listening:
+            if interface.get_flowchart_version(uid) != entry.version:
+                entry = None
+        if entry is None:
+            # the document carries its own version, read in the same query
+            entry = interface.get_flowchart_document(uid)
+            with self._lock:
+                # a change broadcast during the load may predate the document
+                if generation == (self._generation, self._generations.get(uid, 0)):
+                    self._entries[uid] = entry
+                    self._entries.move_to_end(uid)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+                else:
+                    self.logger.debug(f"Flowchart {uid} changed while loading")
+        else:
+            self.logger.debug(f"Flowchart {uid} cache hit")
+        return interface.build_flowchart_from_document(entry)
+
+
+_default_cache: Optional[FlowchartCache] = None
+
+
+def get_flowchart_cache() -> Optional[FlowchartCache]:
+    """
+    Return the process-wide flowchart cache. FLOWCHART_CACHE_SIZE sets how
+    many flowcharts are kept (0 turns it off), and REDIS_URL enables
+    change broadcasts.
+    """
+    global _default_cache
+    maxsize = int(os.getenv("FLOWCHART_CACHE_SIZE", 128))
+    if maxsize <= 0:
+        return None
+    if _default_cache is None:
+        _default_cache = FlowchartCache(maxsize)
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url:
+            _default_cache.listen(redis_url)
+    return _default_cache
+
+
+class ExportCache:
+    """
+    Keeps rendered exports of flowcharts, such as their JSON or mermaid
+    text, for the version they were rendered from. A newer version replaces
+    the old export, so entries never need to be invalidated.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple[str, str], tuple[int, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, uid: str, kind: str, version: int) -> Optional[bytes]:
+        """
+        Return the export of this version of the flowchart, if there is one
+        """
+        with self._lock:
+            entry = self._entries.get((uid, kind))
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end((uid, kind))
+            return entry[1]
+
+    def put(self, uid: str, kind: str, version: int, export: bytes) -> None:
+        """
+        Store the export of a version of the flowchart
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[(uid, kind)] = (version, export)
+            self._entries.move_to_end((uid, kind))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
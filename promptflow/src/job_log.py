@@ -0,0 +1,135 @@
+"""
+Buffered writer for job logs, so logging doesn't cost a database round
+trip per message.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING:
+    from promptflow.src.postgres_interface import DBInterface
+
+_STOP = object()
+
+
+class JobLogWriter:
+    """
+    Buffers the logs of one job and writes them in batches from a
+    background thread, once batch_size logs are waiting or flush_interval
+    seconds after the first one. write() blocks while max_pending logs are
+    waiting, so a slow database slows the job down instead of losing logs.
+    Once a batch can't be written, every later log is dropped as well, so
+    the saved log never has a gap in the middle; close() then raises.
+    """
+
+    def __init__(
+        self,
+        interface: DBInterface,
+        job_id: int,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        max_pending: int = 1000,
+        max_attempts: int = 3,
+    ):
+        self.interface = interface
+        self.job_id = job_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger(__name__)
+        self.error: Optional[Exception] = None
+        # logs given up on after the first batch that couldn't be written
+        self.dropped = 0
+        self._queue: queue.Queue[Any] = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name=f"job-log-{job_id}", daemon=True
+        )
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls, interface: DBInterface, job_id: int) -> JobLogWriter:
+        """
+        Create a writer sized by JOB_LOG_BATCH_SIZE, JOB_LOG_FLUSH_INTERVAL
+        and JOB_LOG_BUFFER_SIZE
+        """
+        return cls(
+            interface,
+            job_id,
+            batch_size=int(os.getenv("JOB_LOG_BATCH_SIZE", 100)),
+            flush_interval=float(os.getenv("JOB_LOG_FLUSH_INTERVAL", 0.5)),
+            max_pending=int(os.getenv("JOB_LOG_BUFFER_SIZE", 1000)),
+        )
+
+    def write(self, data: dict) -> None:
+        """
+        Queue a log entry, waiting if the buffer is full
+        """
+        if self._closed:
+            raise RuntimeError(f"Log writer for job {self.job_id} is closed")
+        self._queue.put(data)
+
+    def close(self) -> None:
+        """
+        Flush the remaining logs and stop the writer.
+        Raises the write error if any logs could not be saved.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self) -> JobLogWriter:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        stopped = False
+        while not stopped:
+            batch: list[dict] = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopped = True
+                    break
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch: list[dict]) -> None:
+        if not batch:
+            return
+        if self.error is not None:
+            self.dropped += len(batch)
+            return
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.interface.create_job_logs(self.job_id, batch)
+                return
+            except Exception as e:  # pylint: disable=broad-except
+                if attempt == self.max_attempts:
+                    self.error = e
+                    self.dropped += len(batch)
+                    self.logger.error(
+                        f"Could not write logs for job {self.job_id}, "
+                        f"dropping the rest: {e}"
+                    )
+                    return
+                time.sleep(self.flush_interval)
@@ -0,0 +1,98 @@
+"""
+Event loop shared by the jobs of a worker process. Each Celery task hands
+its flowchart run to the loop and waits for it, so with a thread pool one
+process drives many I/O bound jobs at once instead of starting an event
+loop per job.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Coroutine, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class JobLoop:
+    """
+    An event loop running in its own thread. At most max_jobs coroutines
+    run on it at once; the rest wait for a slot. Nodes without a native
+    async implementation run on an executor with as many threads.
+    """
+
+    def __init__(self, max_jobs: int = 32):
+        self.max_jobs = max_jobs
+        self.logger = logging.getLogger(__name__)
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(
+            ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="job-node")
+        )
+        self._slots = asyncio.Semaphore(max_jobs)
+        self._thread = threading.Thread(
+            target=self._run_forever, name="job-loop", daemon=True
+        )
+        self._thread.start()
+
+    def _run_forever(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _limited(self, coro: Coroutine[Any, Any, T]) -> T:
+        async with self._slots:
+            return await coro
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        """
+        Run a coroutine on the loop and block the calling thread until it
+        is done. Must not be called from the loop's own thread.
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("JobLoop.run called from the loop thread")
+        future = asyncio.run_coroutine_threadsafe(self._limited(coro), self.loop)
+        return future.result()
+
+    def close(self) -> None:
+        """
+        Stop the loop and its executor. Called when the worker shuts down,
+        after its tasks have finished.
+        """
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.run_until_complete(self.loop.shutdown_default_executor())
+        self.loop.close()
+        self.logger.info("Job loop closed")
+
+
+_default_loop: Optional[JobLoop] = None
+_default_loop_pid: Optional[int] = None
+_default_loop_lock = threading.Lock()
+
+
+def get_job_loop() -> JobLoop:
+    """
+    Return this process's job loop, started on first use.
+    JOB_LOOP_MAX_JOBS sets how many jobs run on it at once.
+    """
+    global _default_loop, _default_loop_pid
+    with _default_loop_lock:
+        # a loop thread doesn't survive a fork, so each process starts its own
+        if _default_loop is None or _default_loop_pid != os.getpid():
+            _default_loop = JobLoop(int(os.getenv("JOB_LOOP_MAX_JOBS", 32)))
+            _default_loop_pid = os.getpid()
+        return _default_loop
+
+
+def close_job_loop() -> None:
+    """
+    Stop this process's job loop, if it was started
+    """
+    global _default_loop
+    with _default_loop_lock:
+        if _default_loop is not None and _default_loop_pid == os.getpid():
+            _default_loop.close()
+        _default_loop = None
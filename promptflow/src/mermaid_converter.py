@@ -1,6 +1,7 @@
+import re
 from enum import Enum
 from string import Template
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Iterator
 
 if TYPE_CHECKING:
     from promptflow.src.connectors.connector import Connector
@@ -47,7 +48,7 @@ class MermaidConnectorShape(Enum):
     DOTTED = Template("$uid -.-> $uid2;")
     DOTTED_TEXT = Template('$uid -. "$label" .-> $uid2')
     THICK = Template("$uid ==> $uid2")
-    THICK_TEXT = Template('$uid == "$label" ==> $uid')
+    THICK_TEXT = Template('$uid == "$label" ==> $uid2')
     INVISIBLE = Template("$uid ~~~ $uid2")
 
 
@@ -59,25 +60,35 @@ class MermaidConverter:
         self.orientation = orientation
 
     def sanitize_uid(self, uid) -> str:
-        """Mermaid does not allow spaces in node names, so we replace them with underscores"""
-        return uid.replace(" ", "_")
+        """
+        Mermaid node names are words, so anything else, such as spaces or &,
+        is replaced with underscores
+        """
+        return re.sub(r"[^\w-]", "_", uid)
+
+    def sanitize_label(self, label: str) -> str:
+        """Labels are quoted, so quotes in them are written as entity codes"""
+        return label.replace('"', "#quot;").replace("\r", "").replace("\n", "<br>")
 
     def convert_node(self, node: "NodeBase") -> str:
         """Converts a node to mermaid syntax"""
-        return f"\t{node.mermaid_shape.value.substitute(uid=self.sanitize_uid(node.uid), label=node.label)}\n"
+        return f"\t{node.mermaid_shape.value.substitute(uid=self.sanitize_uid(node.uid), label=self.sanitize_label(node.label))}\n"
 
     def convert_connector(self, connector: "Connector") -> str:
         """Converts a connector to mermaid syntax"""
         if connector.condition_label:
-            return f"\t{connector.mermaid_shape.value.substitute(uid=self.sanitize_uid(connector.prev.uid), label=connector.condition_label, uid2=self.sanitize_uid(connector.next.uid))}\n"
+            return f"\t{connector.mermaid_shape.value.substitute(uid=self.sanitize_uid(connector.prev.uid), label=self.sanitize_label(connector.condition_label), uid2=self.sanitize_uid(connector.next.uid))}\n"
         else:
             return f"\t{connector.mermaid_shape.value.substitute(uid=self.sanitize_uid(connector.prev.uid), uid2=self.sanitize_uid(connector.next.uid))}\n"
 
-    def to_mermaid(self) -> str:
-        """Converts the flowchart to mermaid syntax"""
-        mermaid_str = f"flowchart {self.orientation.value}\n"
+    def iter_mermaid(self) -> Iterator[str]:
+        """Yields the flowchart in mermaid syntax, a line at a time"""
+        yield f"flowchart {self.orientation.value}\n"
         for node in self.flowchart.nodes:
-            mermaid_str += self.convert_node(node)
+            yield self.convert_node(node)
         for connector in self.flowchart.connectors:
-            mermaid_str += self.convert_connector(connector)
-        return mermaid_str
+            yield self.convert_connector(connector)
+
+    def to_mermaid(self) -> str:
+        """Converts the flowchart to mermaid syntax"""
+        return "".join(self.iter_mermaid())
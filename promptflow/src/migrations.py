@@ -0,0 +1,122 @@
+"""
+Ordered, versioned schema migrations for the Postgres database.
+
+Migrations are the numbered .sql files in promptflow/sql/migrations.
+Each one is applied once, in order, and recorded in schema_migrations.
+"""
+from __future__ import annotations
+
+import logging
+import re
+from pathlib import Path
+from typing import NamedTuple
+
+import psycopg2.extensions
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "sql" / "migrations"
+# arbitrary key shared by every process applying migrations
+MIGRATION_LOCK_ID = 7_170_531_001
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    """A numbered schema migration"""
+
+    version: int
+    name: str
+    path: Path
+
+
+def list_migrations(directory: Path = MIGRATIONS_DIR) -> list[Migration]:
+    """
+    Return the migrations in a directory, ordered by version.
+    Files are named like 0002_add_jobs_index.sql.
+    """
+    migrations = []
+    for path in directory.glob("*.sql"):
+        match = re.match(r"(\d+)_(.+)\.sql$", path.name)
+        if not match:
+            raise ValueError(f"Badly named migration {path.name}")
+        migrations.append(Migration(int(match[1]), match[2], path))
+    migrations.sort()
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError("Duplicate migration versions")
+    return migrations
+
+
+def current_version(cursor: psycopg2.extensions.cursor) -> int:
+    """
+    Return the version of the latest applied migration, 0 if none are
+    """
+    cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cursor.fetchone()[0]
+
+
+def migrate(
+    conn: psycopg2.extensions.connection, directory: Path = MIGRATIONS_DIR
+) -> list[Migration]:
+    """
+    Apply every migration newer than the database's version, each in its
+    own transaction. An advisory lock makes concurrent callers wait, so
+    each migration runs exactly once. Returns the migrations applied.
+    """
+    migrations = list_migrations(directory)
+    latest = migrations[-1].version if migrations else 0
+    with conn.cursor() as cursor:
+        version = current_version(cursor)
+    conn.commit()
+    if version >= latest:
+        return []
+
+    applied: list[Migration] = []
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                  version integer PRIMARY KEY NOT NULL,
+                  name TEXT NOT NULL,
+                  applied timestamp NOT NULL DEFAULT current_timestamp
+                )
+                """
+            )
+            conn.commit()
+            # another process may have migrated while we waited for the lock
+            version = current_version(cursor)
+            for migration in migrations:
+                if migration.version <= version:
+                    continue
+                logger.info(f"Applying migration {migration.path.name}")
+                cursor.execute(migration.path.read_text())
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (migration.version, migration.name),
+                )
+                conn.commit()
+                applied.append(migration)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            release_lock(conn, cursor)
+    return applied
+
+
+def release_lock(
+    conn: psycopg2.extensions.connection, cursor: psycopg2.extensions.cursor
+) -> None:
+    """
+    Release the migration lock. If the connection broke, Postgres releases
+    the lock when it closes, and the error that broke it is the one to see.
+    """
+    try:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        conn.commit()
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.error(f"Could not release the migration lock: {exc}")
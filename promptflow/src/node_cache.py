@@ -0,0 +1,149 @@
+"""
+Content-addressed cache of node outputs, so deterministic nodes
+don't redo work when a flowchart is re-run with the same inputs.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Optional
+
+import redis
+
+if TYPE_CHECKING:
+    from promptflow.src.nodes.node_base import NodeBase
+    from promptflow.src.state import State
+
+
+def node_cache_key(node: NodeBase, state: State) -> Optional[str]:
+    """
+    Hash of everything a node's output depends on: its type, options,
+    the incoming result and the parts of the state it reads.
+    Returns None if the node can't say what it reads, and raises TypeError
+    if what it reads isn't JSON, which would give unstable keys.
+    """
+    inputs = node.cache_inputs(state)
+    if inputs is None:
+        return None
+    payload = json.dumps(
+        [node.__class__.__name__, node.get_options(), state.result, inputs],
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class NodeCache(ABC):
+    """
+    Storage backend for cached node outputs
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Any:
+        """
+        Return the cached output for key, or None on a miss
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: Any) -> None:
+        """
+        Store a node output under key
+        """
+
+
+class LRUNodeCache(NodeCache):
+    """
+    In-process cache holding the most recently used outputs. Outputs are
+    stored as JSON, like in Redis, so jobs never share a mutable output.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            raw = self._entries[key]
+        return json.loads(raw)
+
+    def set(self, key: str, value: Any) -> None:
+        raw = json.dumps(value, default=str)
+        with self._lock:
+            self._entries[key] = raw
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class RedisNodeCache(NodeCache):
+    """
+    Cache shared between workers, stored as JSON in Redis
+    """
+
+    def __init__(
+        self, url: str, prefix: str = "promptflow:node_cache:", ttl: int = 86400
+    ):
+        self.redis = redis.StrictRedis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key: str) -> Any:
+        raw = self.redis.get(self.prefix + key)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    def set(self, key: str, value: Any) -> None:
+        self.redis.set(self.prefix + key, json.dumps(value, default=str), ex=self.ttl)
+
+
+class NodeCacheStats:
+    """
+    Hit and miss counters for a single job
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def serialize(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_default_cache: Optional[NodeCache] = None
+
+
+def get_node_cache() -> Optional[NodeCache]:
+    """
+    Return the process-wide node cache configured by NODE_CACHE:
+    "lru" (default), "redis" (uses REDIS_URL) or "none".
+    """
+    global _default_cache
+    backend = os.getenv("NODE_CACHE", "lru").lower()
+    if backend == "none":
+        return None
+    if _default_cache is None:
+        if backend == "redis":
+            redis_url = os.getenv("REDIS_URL")
+            if not redis_url:
+                raise ValueError("REDIS_URL not set")
+            _default_cache = RedisNodeCache(redis_url)
+        else:
+            _default_cache = LRUNodeCache(int(os.getenv("NODE_CACHE_SIZE", 1024)))
+    return _default_cache
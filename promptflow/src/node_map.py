@@ -31,6 +31,7 @@ from promptflow.src.nodes.image_node import (
     SaveImageNode,
 )
 from promptflow.src.nodes.input_node import FileInput, JSONFileInput, UserInputNode
+from promptflow.src.nodes.join_node import JoinNode
 from promptflow.src.nodes.llm_node import ClaudeNode, GoogleVertexNode, OpenAINode
 from promptflow.src.nodes.memory_node import PineconeInsertNode, PineconeQueryNode
 from promptflow.src.nodes.node_base import NodeBase
@@ -45,6 +46,7 @@ from promptflow.src.nodes.websearch_node import GoogleSearchNode, SerpApiNode
 node_map: Dict[str, Type[NodeBase]] = {
     "InitNode": InitNode,
     "StartNode": StartNode,
+    "JoinNode": JoinNode,
     "UserInputNode": UserInputNode,
     "FileInput": FileInput,
     "JSONFileInput": JSONFileInput,
@@ -109,8 +111,7 @@ def populate_node_map():
         )
     )
 
-    conn = interface.conn
-    with conn.cursor() as cur:
+    with interface.cursor() as cur:
         for node_name in node_map:
             cur.execute(
                 """
@@ -118,9 +119,6 @@ def populate_node_map():
                 """,
                 (node_name,),
             )
-    conn.commit()
-
-    conn.close()
 
 
 if __name__ == "__main__":
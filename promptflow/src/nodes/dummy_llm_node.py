@@ -18,6 +18,12 @@ class DummyNode(OpenAINode):
     def _completion(self, prompt: str, state: State) -> str:
         return self.dummy_string
 
+    async def _achat_completion(self, prompt: str, state: State) -> str:
+        return self.dummy_string
+
+    async def _acompletion(self, prompt: str, state: State) -> str:
+        return self.dummy_string
+
     @staticmethod
     def get_option_keys() -> list[str]:
         return OpenAINode.get_option_keys() + ["dummy_string"]
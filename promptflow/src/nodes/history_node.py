@@ -2,9 +2,7 @@
 Manages writing history to state
 """
 from abc import ABC
-from typing import TYPE_CHECKING, Any, Optional
-
-import tiktoken
+from typing import TYPE_CHECKING, Any
 
 from promptflow.src.nodes.node_base import NodeBase
 from promptflow.src.state import State
@@ -113,17 +111,8 @@ class WindowedHistoryNode(HistoryWindow):
         self.window = window
 
     def apply_window(self, state):
-        # find where to start the window
-        total_tokens = 0
-        i = 0
-        enc = tiktoken.get_encoding("cl100k_base")
-        for i, message in enumerate(reversed(state.history)):
-            encoded = enc.encode(message["content"])
-            if total_tokens + len(encoded) > self.window:
-                break
-            total_tokens += len(encoded)
-        state.history = state.history[-i:]
-
+        # keep the latest messages that fit in the window
+        state.history = state.history.window(self.window)
         return state.history
 
     def serialize(self):
@@ -6,9 +6,10 @@ from enum import Enum
 from typing import Any, Callable
 
 import bs4
+import httpx
 import requests
 
-from promptflow.src.nodes.node_base import NodeBase
+from promptflow.src.nodes.node_base import NodeBase, RetryPolicy
 from promptflow.src.state import State
 
 
@@ -30,6 +31,28 @@ request_functions: dict[str, Callable[[Any], requests.Response]] = {
     RequestType.DELETE.value: requests.delete,
 }
 
+# loading certificates is slow and blocking, so build the context once
+SSL_CONTEXT = httpx.create_ssl_context()
+
+
+async def arequest(request_type: str, url: str, **kwargs) -> str:
+    """
+    Send a http request without blocking the event loop and return the body
+    """
+    async with httpx.AsyncClient(verify=SSL_CONTEXT, follow_redirects=True) as client:
+        response = await client.request(request_type.upper(), url, **kwargs)
+        return response.text
+
+
+def parse_url_json(text: str, key: str) -> dict[str, Any]:
+    """
+    Parse a JSON object holding a url under key, making sure it has a scheme
+    """
+    data = json.loads(text)
+    if not data[key].startswith("https://"):
+        data[key] = "https://" + data[key]
+    return data
+
 
 class HttpNode(NodeBase):
     """
@@ -38,6 +61,7 @@ class HttpNode(NodeBase):
 
     url: str
     request_type: str
+    retry_policy = RetryPolicy(max_attempts=3)
 
     def __init__(
         self,
@@ -63,6 +87,17 @@ class HttpNode(NodeBase):
         response = request_functions[self.request_type](self.url, **kwargs)
         return response.text
 
+    async def arun_subclass(self, before_result: Any, state) -> str:
+        """
+        Sends a http request without blocking
+        """
+        try:
+            data = json.loads(state.result)
+        except json.decoder.JSONDecodeError:
+            return "Invalid JSON"
+        kwargs = {"json": data} if self.request_type == RequestType.POST.value else {}
+        return await arequest(self.request_type, self.url, **kwargs)
+
     def serialize(self):
         return super().serialize() | {
             "url": self.url,
@@ -81,6 +116,7 @@ class JSONRequestNode(NodeBase):
 
     key: str = "url"
     request_type: str
+    retry_policy = RetryPolicy(max_attempts=3)
 
     def __init__(
         self,
@@ -103,15 +139,28 @@ class JSONRequestNode(NodeBase):
         Sends a http request
         """
         try:
-            data = json.loads(state.result)
-            if not data[self.key].startswith("https://"):
-                data[self.key] = "https://" + data[self.key]
+            data = parse_url_json(state.result, self.key)
         except json.decoder.JSONDecodeError:
             return "Invalid JSON"
         kwargs = {"json": data} if self.request_type == RequestType.POST.value else {}
         response = request_functions[self.request_type](data[self.key], **kwargs)
         return response.text
 
+    async def arun_subclass(
+        self,
+        before_result: Any,
+        state: State,
+    ) -> str:
+        """
+        Sends a http request without blocking
+        """
+        try:
+            data = parse_url_json(state.result, self.key)
+        except json.decoder.JSONDecodeError:
+            return "Invalid JSON"
+        kwargs = {"json": data} if self.request_type == RequestType.POST.value else {}
+        return await arequest(self.request_type, data[self.key], **kwargs)
+
     def serialize(self):
         return super().serialize() | {
             "key": self.key,
@@ -129,6 +178,7 @@ class ScrapeNode(NodeBase):
     """
 
     key: str = "url"
+    retry_policy = RetryPolicy(max_attempts=3)
 
     def __init__(
         self,
@@ -150,14 +200,33 @@ class ScrapeNode(NodeBase):
         Scrapes a page
         """
         try:
-            data = json.loads(state.result)
-            if not data[self.key].startswith("https://"):
-                data[self.key] = "https://" + data[self.key]
+            data = parse_url_json(state.result, self.key)
         except json.decoder.JSONDecodeError:
             return "Invalid JSON"
         response = requests.get(data[self.key])
-        soup = bs4.BeautifulSoup(response.text, "html.parser")
-        # return only the text and links
+        return self.extract_text(response.text)
+
+    async def arun_subclass(
+        self,
+        before_result: Any,
+        state: State,
+    ) -> str:
+        """
+        Scrapes a page without blocking
+        """
+        try:
+            data = parse_url_json(state.result, self.key)
+        except json.decoder.JSONDecodeError:
+            return "Invalid JSON"
+        html = await arequest(RequestType.GET.value, data[self.key])
+        return self.extract_text(html)
+
+    @staticmethod
+    def extract_text(html: str) -> str:
+        """
+        Return only the text and links of a page, links as markdown
+        """
+        soup = bs4.BeautifulSoup(html, "html.parser")
         text = ""
         for element in soup.find_all(
             ["p", "a"]
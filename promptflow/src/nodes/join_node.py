@@ -0,0 +1,24 @@
+"""
+Barrier node that waits for parallel branches to finish
+"""
+from typing import Any
+
+from promptflow.src.mermaid_converter import MermaidNodeShape
+from promptflow.src.nodes.node_base import FlowchartJSTypes, NodeBase, NxNodeShape
+from promptflow.src.state import State
+from promptflow.src.themes import monokai
+
+
+class JoinNode(NodeBase):
+    """
+    Waits for every parallel branch to finish before continuing.
+    Branch snapshots, history and results are merged in connector order.
+    """
+
+    node_color = monokai.ORANGE
+    nx_shape = NxNodeShape.DIAMOND
+    js_shape = FlowchartJSTypes.parallel
+    mermaid_shape = MermaidNodeShape.HEXAGON
+
+    def run_subclass(self, before_result: Any, state: State) -> str:
+        return state.result
@@ -5,12 +5,15 @@ from typing import TYPE_CHECKING, Any
 import anthropic
 import google.generativeai as genai
 import openai
-import tiktoken
 
-from promptflow.src.nodes.node_base import NodeBase
+from promptflow.src.nodes.node_base import NodeBase, RetryPolicy
 from promptflow.src.state import State
 from promptflow.src.themes import monokai
-from promptflow.src.utils import retry_with_exponential_backoff
+from promptflow.src.tokenizer import encoding_for_model
+from promptflow.src.utils import (
+    aretry_with_exponential_backoff,
+    retry_with_exponential_backoff,
+)
 
 if TYPE_CHECKING:
     from promptflow.src.flowchart import Flowchart
@@ -81,6 +84,7 @@ class OpenAINode(NodeBase):
     """
 
     node_color = monokai.GREEN
+    # API calls already retry with retry_with_exponential_backoff
 
     def __init__(
         self,
@@ -103,29 +107,64 @@ class OpenAINode(NodeBase):
         """
         Simple wrapper around the OpenAI API to generate text.
         """
+        completion = openai.ChatCompletion.create(
+            **self._chat_completion_kwargs(prompt, state)
+        )
+        return completion["choices"][0]["message"]["content"]  # type: ignore
+
+    @aretry_with_exponential_backoff
+    async def _achat_completion(self, prompt: str, state: State) -> str:
+        """
+        Async version of _chat_completion
+        """
+        completion = await openai.ChatCompletion.acreate(
+            **self._chat_completion_kwargs(prompt, state)
+        )
+        return completion["choices"][0]["message"]["content"]  # type: ignore
+
+    def _chat_completion_kwargs(self, prompt: str, state: State) -> dict[str, Any]:
+        """
+        Build the arguments for a chat completion request.
+        """
         messages = [
             *state.history,
         ]
         if prompt:
             messages.append({"role": "user", "content": prompt})
-        completion = openai.ChatCompletion.create(
-            model=self.model,
-            messages=messages,
-            temperature=self.temperature,
-            top_p=self.top_p,
-            n=self.n,
-            # stop=self.stop,
-            max_tokens=self.max_tokens,
-            presence_penalty=self.presence_penalty,
-            frequency_penalty=self.frequency_penalty,
-        )
-        return completion["choices"][0]["message"]["content"]  # type: ignore
+        return {
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "n": self.n,
+            # "stop": self.stop,
+            "max_tokens": self.max_tokens,
+            "presence_penalty": self.presence_penalty,
+            "frequency_penalty": self.frequency_penalty,
+        }
 
     @retry_with_exponential_backoff
     def _completion(self, prompt: str, state: State) -> str:
         """
         Simple wrapper around the OpenAI API to generate text.
         """
+        completion = openai.Completion.create(**self._completion_kwargs(prompt, state))
+        return completion["choices"][0]["text"]  # type: ignore
+
+    @aretry_with_exponential_backoff
+    async def _acompletion(self, prompt: str, state: State) -> str:
+        """
+        Async version of _completion
+        """
+        completion = await openai.Completion.acreate(
+            **self._completion_kwargs(prompt, state)
+        )
+        return completion["choices"][0]["text"]  # type: ignore
+
+    def _completion_kwargs(self, prompt: str, state: State) -> dict[str, Any]:
+        """
+        Build the arguments for a completion request.
+        """
         # todo this history is really opinionated
         history = "\n".join(
             [
@@ -136,18 +175,17 @@ class OpenAINode(NodeBase):
             ]
         )
         prompt = f"{history}\n{prompt}\n"
-        completion = openai.Completion.create(
-            model=self.model,
-            prompt=prompt,
-            max_tokens=self.max_tokens,
-            temperature=self.temperature,
-            top_p=self.top_p,
-            n=self.n,
-            # stop=self.stop,
-            presence_penalty=self.presence_penalty,
-            frequency_penalty=self.frequency_penalty,
-        )
-        return completion["choices"][0]["text"]  # type: ignore
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "n": self.n,
+            # "stop": self.stop,
+            "presence_penalty": self.presence_penalty,
+            "frequency_penalty": self.frequency_penalty,
+        }
 
     def run_subclass(self, before_result: Any, state) -> str:
         """
@@ -163,6 +201,20 @@ class OpenAINode(NodeBase):
         self.logger.info(f"Result of LLMNode is {completion}")  # type: ignore
         return completion  # type: ignore
 
+    async def arun_subclass(self, before_result: Any, state) -> str:
+        """
+        Format the prompt and run the OpenAI API without blocking.
+        """
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+        prompt = state.result
+        self.logger.info(f"Running LLMNode with prompt: {prompt}")
+        if self.model in chat_models:
+            completion = await self._achat_completion(prompt, state)
+        else:
+            completion = await self._acompletion(prompt, state)
+        self.logger.info(f"Result of LLMNode is {completion}")  # type: ignore
+        return completion  # type: ignore
+
     def serialize(self):
         return super().serialize() | {
             "model": self.model,
@@ -188,8 +240,9 @@ class OpenAINode(NodeBase):
         Return the cost of running this node.
         """
         # count the number of tokens
-        enc = tiktoken.encoding_for_model(self.model)
-        prompt_tokens = enc.encode(state.result.format(state=state))
+        prompt_tokens = encoding_for_model(self.model).encode(
+            state.result.format(state=state)
+        )
         max_completion_tokens = self.max_tokens - len(prompt_tokens)
         prompt_cost = prompt_cost_1k[self.model] * len(prompt_tokens) / 1000
         completion_cost = completion_cost_1k[self.model] * max_completion_tokens / 1000
@@ -210,6 +263,8 @@ class OpenAINode(NodeBase):
 
 
 class ClaudeNode(NodeBase):
+    retry_policy = RetryPolicy(max_attempts=3)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.model = kwargs.get("model", AnthropicModel.claude_v1.value)
@@ -232,14 +287,25 @@ class ClaudeNode(NodeBase):
         Format the prompt and run the Anthropics API
         """
         c = anthropic.Client(os.environ["ANTHROPIC_API_KEY"])
-        resp = c.completion(
-            prompt=self._build_history(state) + "\n" + anthropic.AI_PROMPT,
-            stop_sequences=[anthropic.HUMAN_PROMPT],
-            model=self.model,
-            max_tokens_to_sample=self.max_tokens,
-        )
+        resp = c.completion(**self._completion_kwargs(state))
+        return resp["completion"]
+
+    async def arun_subclass(self, before_result: Any, state) -> str:
+        """
+        Format the prompt and run the Anthropics API without blocking.
+        """
+        c = anthropic.Client(os.environ["ANTHROPIC_API_KEY"])
+        resp = await c.acompletion(**self._completion_kwargs(state))
         return resp["completion"]
 
+    def _completion_kwargs(self, state: State) -> dict[str, Any]:
+        return {
+            "prompt": self._build_history(state) + "\n" + anthropic.AI_PROMPT,
+            "stop_sequences": [anthropic.HUMAN_PROMPT],
+            "model": self.model,
+            "max_tokens_to_sample": self.max_tokens,
+        }
+
     def serialize(self):
         return super().serialize() | {
             "model": self.model,
@@ -251,8 +317,9 @@ class ClaudeNode(NodeBase):
         Return the cost of running this node.
         """
         # count the number of tokens
-        enc = tiktoken.encoding_for_model(self.model)
-        prompt_tokens = enc.encode(state.result.format(state=state))
+        prompt_tokens = encoding_for_model(self.model).encode(
+            state.result.format(state=state)
+        )
         max_completion_tokens = self.max_tokens - len(prompt_tokens)
         prompt_cost = prompt_cost_1k[self.model] * len(prompt_tokens) / 1000
         completion_cost = completion_cost_1k[self.model] * max_completion_tokens / 1000
@@ -273,6 +340,7 @@ class GoogleVertexNode(NodeBase):
     """
 
     model = GoogleModel.text_bison_001.value
+    retry_policy = RetryPolicy(max_attempts=3)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -304,8 +372,9 @@ class GoogleVertexNode(NodeBase):
         Return the cost of running this node.
         """
         # count the number of tokens
-        enc = tiktoken.encoding_for_model(self.model)
-        prompt_tokens = enc.encode(state.result.format(state=state))
+        prompt_tokens = encoding_for_model(self.model).encode(
+            state.result.format(state=state)
+        )
         max_completion_tokens = 1024 - len(prompt_tokens)
         prompt_cost = prompt_cost_1k[self.model] * len(prompt_tokens) / 1000
         completion_cost = completion_cost_1k[self.model] * max_completion_tokens / 1000
@@ -1,10 +1,14 @@
 """
 Base class for all nodes
 """
+import asyncio
 import logging
+import time
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, Optional
+
+from pydantic import BaseModel  # pylint: disable=no-name-in-module
 
 from promptflow.src.mermaid_converter import MermaidNodeShape
 from promptflow.src.serializable import Serializable
@@ -41,6 +45,20 @@ class FlowchartJSTypes(Enum):
     parallel = "parallel"
 
 
+class RetryPolicy(BaseModel):
+    """How often a node is retried when it raises, and how long to wait"""
+
+    max_attempts: int = 1
+    backoff: float = 1.0
+    backoff_factor: float = 2.0
+
+    def delay(self, attempt: int) -> float:
+        """
+        Seconds to wait after the given (1-based) failed attempt
+        """
+        return self.backoff * self.backoff_factor ** (attempt - 1)
+
+
 class NodeBase(Serializable, ABC):
     """
     Represents a node in the flowchart, which could be a prompt, an llm, traditional code, etc.
@@ -51,6 +69,10 @@ class NodeBase(Serializable, ABC):
     js_shape = FlowchartJSTypes.operation
     mermaid_shape = MermaidNodeShape.ROUND_RECT
     prev_color = color
+    # whether outputs are cached by default; only for deterministic nodes
+    cacheable = False
+    # retries for nodes that fail transiently, e.g. on network errors
+    retry_policy = RetryPolicy()
 
     def __init__(
         self,
@@ -73,6 +95,7 @@ class NodeBase(Serializable, ABC):
         self.node_type_id = kwargs.get("node_type_id", None)
         if self.node_type_id is None:
             raise ValueError("node_type_id must be specified")
+        self.cache: bool = kwargs.get("cache", self.cacheable)
 
     def __eq__(self, __o: object) -> bool:
         if isinstance(__o, NodeBase):
@@ -116,6 +139,17 @@ class NodeBase(Serializable, ABC):
         Code that will be run when the node is executed.
         """
 
+    async def arun_subclass(self, before_result: Any, state: State) -> str | None:
+        """
+        Async version of run_subclass, used by Flowchart.arun.
+        I/O bound nodes override this; by default run_subclass is run
+        in a thread executor so it doesn't block the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, self.run_subclass, before_result, state
+        )
+
     def before(self, state: State) -> Any:
         """
         Blocking method called before main node execution.
@@ -127,11 +161,52 @@ class NodeBase(Serializable, ABC):
         Handles setting the snapshot and returning the output.
         """
         state.snapshot[self.label] = state.snapshot.get(self.label, "")
-        try:
-            output: str = self.run_subclass(before_result, state)
-        except Exception as node_exception:
-            state.exception = True
-            output = f"Error in node: {node_exception}"
+        attempt = 1
+        while True:
+            try:
+                output: str = self.run_subclass(before_result, state)
+                break
+            except Exception as node_exception:
+                if not self.should_retry(attempt, node_exception):
+                    state.exception = True
+                    output = f"Error in node: {node_exception}"
+                    break
+                time.sleep(self.retry_policy.delay(attempt))
+                attempt += 1
+        state.snapshot[self.label] = output
+        state.result = output
+        return output
+
+    def should_retry(self, attempt: int, error: Exception) -> bool:
+        """
+        Whether to run the node again after its given attempt raised
+        """
+        if attempt >= self.retry_policy.max_attempts:
+            return False
+        self.logger.warning(
+            f"Node {self.label} failed (attempt {attempt} of "
+            f"{self.retry_policy.max_attempts}): {error}, retrying in "
+            f"{self.retry_policy.delay(attempt)}s"
+        )
+        return True
+
+    async def arun_node(self, before_result: Any, state: State) -> str:
+        """
+        Async version of run_node
+        """
+        state.snapshot[self.label] = state.snapshot.get(self.label, "")
+        attempt = 1
+        while True:
+            try:
+                output: str = await self.arun_subclass(before_result, state)
+                break
+            except Exception as node_exception:
+                if not self.should_retry(attempt, node_exception):
+                    state.exception = True
+                    output = f"Error in node: {node_exception}"
+                    break
+                await asyncio.sleep(self.retry_policy.delay(attempt))
+                attempt += 1
         state.snapshot[self.label] = output
         state.result = output
         return output
@@ -184,12 +259,21 @@ class NodeBase(Serializable, ABC):
         state.snapshot[self.label] = ""
         return 0.0
 
+    def cache_inputs(self, state: State) -> Optional[dict[str, Any]]:
+        """
+        The parts of the state, besides state.result, that the output
+        depends on. Used to build the node cache key, so it has to be JSON.
+        Return None if the node can't be cached, which is the default:
+        deterministic nodes override this with only the keys they read.
+        """
+        return None
+
     @staticmethod
     def get_option_keys() -> list[str]:
         """
         Return the keys for the node options.
         """
-        return ["label"]
+        return ["label", "cache"]
 
     @classmethod
     def description(cls) -> str:
@@ -1,6 +1,8 @@
 """
 Holds text which gets formatted with state data
 """
+import re
+import string
 from typing import TYPE_CHECKING, Any, Optional
 
 from promptflow.src.nodes.node_base import NodeBase
@@ -18,6 +20,7 @@ class PromptNode(NodeBase):
     """
 
     node_color = monokai.PURPLE
+    cacheable = True
 
     def __init__(
         self,
@@ -45,6 +48,24 @@ class PromptNode(NodeBase):
         state.result = prompt
         return prompt
 
+    def cache_inputs(self, state: State) -> Optional[dict[str, Any]]:
+        """
+        Only the snapshot keys referenced as {state[key]} in the prompt
+        """
+        keys = []
+        try:
+            fields = list(string.Formatter().parse(self.prompt.text))
+        except ValueError:
+            return None
+        for _, field, _, _ in fields:
+            if field is None or field == "state.result":
+                continue
+            match = re.fullmatch(r"state\[([^\[\]]+)\]", field)
+            if not match:
+                return None
+            keys.append(match.group(1))
+        return {"snapshot": {key: state[key] for key in keys}}
+
     def serialize(self) -> dict:
         return super().serialize() | {
             "prompt": self.prompt.serialize(),
@@ -3,9 +3,10 @@ Nodes that handle regular expressions and parsing text, usually
 from LLM output (but not always)
 """
 import re
-from typing import Any
+from typing import Any, Optional
 
 from promptflow.src.nodes.node_base import NodeBase
+from promptflow.src.state import State
 
 
 class RegexNode(NodeBase):
@@ -13,6 +14,8 @@ class RegexNode(NodeBase):
     Node that handles regular expressions
     """
 
+    cacheable = True
+
     def __init__(
         self,
         *args,
@@ -34,6 +37,9 @@ class RegexNode(NodeBase):
             return ""
         return search.group(0)
 
+    def cache_inputs(self, state: State) -> Optional[dict[str, Any]]:
+        return {}
+
     def serialize(self) -> dict:
         return super().serialize() | {
             "regex": self.regex,
@@ -49,6 +55,8 @@ class TagNode(NodeBase):
     Gets the text in-between two tags
     """
 
+    cacheable = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.start_tag = kwargs.get("start_tag", "")
@@ -69,6 +77,9 @@ class TagNode(NodeBase):
         start_index += len(self.start_tag)
         return content[start_index:end_index]
 
+    def cache_inputs(self, state: State) -> Optional[dict[str, Any]]:
+        return {}
+
     def serialize(self) -> dict:
         return super().serialize() | {
             "start_tag": self.start_tag,
@@ -48,6 +48,7 @@ class JsonNode(StructuredDataNode):
     """
 
     schema = None
+    cacheable = True
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -68,6 +69,9 @@ class JsonNode(StructuredDataNode):
             return "Schema error: " + str(e)
         return data
 
+    def cache_inputs(self, state: State) -> Optional[dict[str, Any]]:
+        return {}
+
     def serialize(self):
         return super().serialize() | {"schema": self.schema}
 
@@ -81,6 +85,11 @@ class JsonerizerNode(NodeBase):
     Node that converts a python dictionary into JSON.
     """
 
+    cacheable = True
+
+    def cache_inputs(self, state: State) -> Optional[dict[str, Any]]:
+        return {}
+
     def run_subclass(self, before_result: Any, state) -> str:
         d: dict = ast.literal_eval(state.result)
         return json.dumps(d, indent=4)
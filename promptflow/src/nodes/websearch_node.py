@@ -6,10 +6,12 @@ import os
 from abc import ABC
 from typing import Any
 
+import httpx
 from googlesearch import search
 from serpapi import GoogleSearch
 
-from promptflow.src.nodes.node_base import NodeBase
+from promptflow.src.nodes.http_node import SSL_CONTEXT
+from promptflow.src.nodes.node_base import NodeBase, RetryPolicy
 
 
 class WebSearchNode(NodeBase, ABC):
@@ -17,14 +19,31 @@ class WebSearchNode(NodeBase, ABC):
     Node that makes a web search.
     """
 
+    retry_policy = RetryPolicy(max_attempts=3)
+
 
 class SerpApiNode(WebSearchNode):
     """
     Query Google using the SerpApi.
     """
 
+    search_url = "https://serpapi.com/search.json"
+
     def run_subclass(self, before_result: Any, state) -> str:
-        searchParams = {
+        search = GoogleSearch(self._search_params(state))
+        results = search.get_dict().get("organic_results", [])
+        return str(results)
+
+    async def arun_subclass(self, before_result: Any, state) -> str:
+        async with httpx.AsyncClient(verify=SSL_CONTEXT) as client:
+            response = await client.get(
+                self.search_url, params=self._search_params(state)
+            )
+        results = response.json().get("organic_results", [])
+        return str(results)
+
+    def _search_params(self, state) -> dict[str, str]:
+        return {
             "engine": "google",
             "q": str(state.result),
             "location": "Austin, Texas, United States",
@@ -33,9 +52,6 @@ class SerpApiNode(WebSearchNode):
             "hl": "en",
             "api_key": os.environ["SERP_API_KEY"],
         }
-        search = GoogleSearch(searchParams)
-        results = search.get_dict().get("organic_results", [])
-        return str(results)
 
 
 class GoogleSearchNode(WebSearchNode):
@@ -1,20 +1,57 @@
 import base64
+import copy
 import json
+import logging
+import os
+import uuid
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import psycopg2
+import psycopg2.errors
 import psycopg2.extensions
+import psycopg2.extras
 from pydantic import conint  # pylint: disable=no-name-in-module
 from pydantic import BaseModel, constr, validator
 
+from promptflow.src.connection_pool import get_connection_pool
 from promptflow.src.connectors.connector import Connector
-from promptflow.src.flowchart import Flowchart
+from promptflow.src.flowchart import Flowchart, FlowchartPatch
+from promptflow.src.flowchart_cache import publish_flowchart_change
+from promptflow.src.migrations import migrate
 from promptflow.src.node_map import node_map
 from promptflow.src.nodes.node_base import NodeBase
 from promptflow.src.text_data import TextData
 
+# rows fetched per round trip when streaming query results
+STREAM_BATCH_SIZE = 1000
+# flowcharts saved per statement by save_flowcharts
+SAVE_BATCH_SIZE = 50
+# jobs parked until input is posted for them
+SUSPENDED_STATUSES = ("INPUT_REQUIRED", "FILE_INPUT_REQUIRED")
+# jobs no task is working on, which can be started again
+RESUMABLE_STATUSES = ("FAILED", *SUSPENDED_STATUSES)
+
+# the most frequent reads, planned once per connection instead of every call
+PREPARED_STATEMENTS = {
+    "graph_document_by_uid": "SELECT graph_document($1)",
+    "graph_version_by_uid": "SELECT version FROM graphs WHERE uid = $1",
+    "job_view_by_id": "SELECT * FROM jobs_view WHERE id = $1",
+    "job_output_by_id": (
+        "SELECT job_id, output_type, output FROM job_outputs WHERE job_id = $1"
+    ),
+}
+
+
+def stream_idle_timeout() -> float:
+    """
+    Seconds a streamed query may wait for the client between batches,
+    set by POSTGRES_STREAM_IDLE_TIMEOUT
+    """
+    return float(os.getenv("POSTGRES_STREAM_IDLE_TIMEOUT", 30))
+
 
 class JobView(BaseModel):
     """Model representing a job in the database"""
@@ -129,6 +166,7 @@ class JobLog(BaseModel):
     log: Optional[Dict[str, Any]]
     job_id: conint(gt=0)
     created: datetime
+    id: Optional[conint(gt=0)]
 
     @staticmethod
     def hydrate(row: Tuple[Any, ...]) -> "JobLog":
@@ -141,7 +179,42 @@ class JobLog(BaseModel):
         Returns
             JobLog: A JobLog instance populated with the data from the row.
         """
-        return JobLog(log=row[0], job_id=row[1], created=row[2])
+        return JobLog(log=row[0], job_id=row[1], created=row[2], id=row[3])
+
+
+class JobCheckpoint(BaseModel):
+    """State and pending work of a job after its last completed node"""
+
+    job_id: conint(gt=0)
+    phase: constr(min_length=1)
+    node: Optional[str]
+    state: Dict[str, Any]
+    queue: Dict[str, Any]
+    created: datetime
+    awaiting_input: bool = False
+    node_input: Optional[str] = None
+
+    @staticmethod
+    def hydrate(row: Tuple[Any, ...]) -> "JobCheckpoint":
+        """
+        Hydrates a JobCheckpoint instance from a dictionary representing a database row.
+
+        Args:
+            row (Dict[str, Any]): Dictionary representing a database row.
+
+        Returns
+            JobCheckpoint: A JobCheckpoint instance populated with the data from the row.
+        """
+        return JobCheckpoint(
+            job_id=row[0],
+            phase=row[1],
+            node=row[2],
+            state=row[3],
+            queue=row[4],
+            created=row[5],
+            awaiting_input=row[6],
+            node_input=row[7],
+        )
 
 
 class DatabaseConfig(BaseModel):
@@ -153,6 +226,19 @@ class DatabaseConfig(BaseModel):
     password: str
     port: int
 
+    @classmethod
+    def from_env(cls) -> "DatabaseConfig":
+        """
+        Build the configuration from the POSTGRES_* environment variables.
+        """
+        return cls(
+            host=os.getenv("POSTGRES_HOST", "172.21.0.2"),
+            database=os.getenv("POSTGRES_DB", "postgres"),
+            user=os.getenv("POSTGRES_USER", "postgres"),
+            password=os.getenv("POSTGRES_PASSWORD", "postgres"),
+            port=int(os.getenv("POSTGRES_PORT", 5432)),
+        )
+
     @validator("host")
     def validate_host(cls, value):
         if not value:
@@ -184,6 +270,26 @@ class DatabaseConfig(BaseModel):
         return value
 
 
+class FlowchartVersionConflict(ValueError):
+    """Raised when a flowchart was changed since the version a patch expects"""
+
+
+class FlowchartDocument(BaseModel):
+    """
+    A whole flowchart as stored in the database, with each node and branch
+    listed once
+    """
+
+    id: conint(gt=0)
+    uid: constr(min_length=1)
+    label: str
+    created: datetime
+    version: int
+    # used as loaded; validating every node costs more than building them
+    nodes: list
+    branches: list
+
+
 class GraphNamesAndIds(BaseModel):
     """
     Model representing the names and IDs of graphs.
@@ -231,11 +337,12 @@ class DBInterface(ABC):
             config (DatabaseConfig): The configuration for the database connection.
         """
         self.config: DatabaseConfig = config
+        self.logger = logging.getLogger(__name__)
 
     @abstractmethod
     def init_schema(self):
         """
-        Run the initialize_schema.sql script to create the tables and functions
+        Bring the database schema up to date by applying any pending migrations
         """
 
     @abstractmethod
@@ -252,6 +359,30 @@ class DBInterface(ABC):
             List[Flowchart]: List of constructed flowcharts.
         """
 
+    @abstractmethod
+    def build_flowchart_from_document(self, document: FlowchartDocument) -> Flowchart:
+        """
+        Builds a flowchart from its document in a single pass.
+
+        Args:
+            document (FlowchartDocument): The flowchart's nodes and branches.
+
+        Returns:
+            Flowchart: The constructed flowchart.
+        """
+
+    @abstractmethod
+    def get_flowchart_document(self, uid: str) -> FlowchartDocument:
+        """
+        Gets a whole flowchart from the database in one query.
+
+        Args:
+            uid (str): The UID of the flowchart.
+
+        Returns:
+            FlowchartDocument: The flowchart's nodes and branches.
+        """
+
     @abstractmethod
     def get_node_type_id(self, node_type):
         """
@@ -306,6 +437,30 @@ class DBInterface(ABC):
             Flowchart: The flowchart with the given ID.
         """
 
+    @abstractmethod
+    def get_graph_view(self, uid: str) -> List[GraphView]:
+        """
+        Gets the graph view rows of a flowchart.
+
+        Args:
+            uid (str): The UID of the flowchart.
+
+        Returns:
+            List[GraphView]: One row per node and branch of the flowchart.
+        """
+
+    @abstractmethod
+    def get_flowchart_version(self, uid: str) -> int:
+        """
+        Gets the version of a flowchart, which changes whenever it is saved.
+
+        Args:
+            uid (str): The UID of the flowchart.
+
+        Returns:
+            int: The current version of the flowchart.
+        """
+
     @abstractmethod
     def get_all_flowchart_ids_and_names(self) -> List[GraphNamesAndIds]:
         """
@@ -327,6 +482,29 @@ class DBInterface(ABC):
             flowchart (Flowchart): The flowchart to save.
         """
 
+    @abstractmethod
+    def save_flowcharts(self, flowcharts: List[Flowchart]):
+        """
+        Saves several flowcharts to the database in one transaction.
+
+        Args:
+            flowcharts (List[Flowchart]): The flowcharts to save.
+        """
+
+    @abstractmethod
+    def patch_flowchart(self, flowchart_uid: str, patch: FlowchartPatch) -> int:
+        """
+        Applies changes to a saved flowchart in one transaction, touching
+        only the nodes and branches named in the patch.
+
+        Args:
+            flowchart_uid (str): The UID of the flowchart to change.
+            patch (FlowchartPatch): The nodes and branches to change.
+
+        Returns:
+            int: The new version of the flowchart.
+        """
+
     @abstractmethod
     def delete_flowchart(self, flowchart_uid: str):
         """
@@ -366,6 +544,68 @@ class DBInterface(ABC):
             log (dict): The log to create.
         """
 
+    @abstractmethod
+    def create_job_logs(self, job_id: int, logs: List[dict]):
+        """
+        Creates several job logs in one statement, in the order given.
+
+        Args:
+            job_id (int): The ID of the job the logs belong to.
+            logs (List[dict]): The logs to create.
+        """
+
+    @abstractmethod
+    def save_job_checkpoint(self, job_id: int, checkpoint: dict):
+        """
+        Stores the latest checkpoint of a job, replacing the previous one.
+
+        Args:
+            job_id (int): The ID of the job.
+            checkpoint (dict): The phase, last node, state and queue of the job.
+        """
+
+    @abstractmethod
+    def get_job_checkpoint(self, job_id: int) -> Optional[JobCheckpoint]:
+        """
+        Gets the latest checkpoint of a job.
+
+        Args:
+            job_id (int): The ID of the job.
+
+        Returns:
+            Optional[JobCheckpoint]: The checkpoint, or None if the job has none.
+        """
+
+    @abstractmethod
+    def claim_job(self, job_id: int, statuses: Tuple[str, ...]) -> bool:
+        """
+        Sets a job back to PENDING if its status is one of statuses, in a
+        single statement, so only one caller can start a task for it.
+
+        Args:
+            job_id (int): The ID of the job.
+            statuses (Tuple[str, ...]): The statuses the job may be in.
+
+        Returns:
+            bool: True if the job was in one of statuses and is now claimed.
+        """
+
+    @abstractmethod
+    def claim_job_input(self, job_id: int, node_input: str) -> bool:
+        """
+        Stores the input for the node a suspended job is waiting on, so the
+        job is resumed only once. The input is kept with the checkpoint
+        until the next checkpoint replaces it, after the node has run.
+        The job is claimed as by claim_job in the same transaction.
+
+        Args:
+            job_id (int): The ID of the job.
+            node_input (str): The input posted for the node.
+
+        Returns:
+            bool: True if the job was waiting for input and is now claimed.
+        """
+
     @abstractmethod
     def get_job_view(self, job_id: int) -> JobView:
         """
@@ -379,15 +619,36 @@ class DBInterface(ABC):
         """
 
     @abstractmethod
-    def get_job_logs(self, job_id: int) -> List[JobLog]:
+    def get_job_logs(
+        self,
+        job_id: int,
+        after_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        limit: Optional[int] = None,
+    ) -> List[JobLog]:
         """
-        Gets a job log from the database.
+        Gets the logs of a job from the database, oldest first.
 
         Args:
             job_id (int): The ID of the job to retrieve.
+            after_id (Optional[int]): Only logs after the log with this ID.
+            since (Optional[datetime]): Only logs created after this time.
+            limit (Optional[int]): The maximum number of logs to return.
 
         Returns:
-            List[JobLog]: The job log with the given ID.
+            List[JobLog]: The logs of the job with the given ID.
+        """
+
+    @abstractmethod
+    def iter_job_logs(
+        self,
+        job_id: int,
+        after_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[JobLog]:
+        """
+        Like get_job_logs, but fetches the logs in batches as they are consumed.
         """
 
     @abstractmethod
@@ -403,6 +664,88 @@ class DBInterface(ABC):
             None
         """
 
+    @abstractmethod
+    def get_flowchart_image(self, flowchart_uid: str) -> Tuple[int, Optional[bytes]]:
+        """
+        Gets the stored image of a flowchart, if it was rendered from the
+        flowchart's current version.
+
+        Args:
+            flowchart_uid (str): The UID of the flowchart.
+
+        Returns:
+            Tuple[int, Optional[bytes]]: The current version and the PNG image,
+            or None if the image is missing or out of date.
+        """
+
+    @abstractmethod
+    def store_flowchart_image(self, flowchart_uid: str, version: int, image: bytes):
+        """
+        Stores the image rendered from a version of a flowchart. Renders of a
+        version that is no longer current are discarded.
+
+        Args:
+            flowchart_uid (str): The UID of the flowchart.
+            version (int): The version the image was rendered from.
+            image (bytes): The PNG image.
+        """
+
+    @abstractmethod
+    def claim_flowchart_render(
+        self, flowchart_uid: str, version: int, timeout: float
+    ) -> bool:
+        """
+        Claims the render of the current version of a flowchart, so only one
+        caller queues it. A claim older than timeout can be taken over.
+
+        Args:
+            flowchart_uid (str): The UID of the flowchart.
+            version (int): The version to render.
+            timeout (float): Seconds after which a render is presumed lost.
+
+        Returns:
+            bool: Whether the caller should queue the render.
+        """
+
+    @abstractmethod
+    def release_flowchart_render(self, flowchart_uid: str, version: int):
+        """
+        Gives up the claim on a render that failed, so it can be queued again.
+
+        Args:
+            flowchart_uid (str): The UID of the flowchart.
+            version (int): The version whose render failed.
+        """
+
+    @abstractmethod
+    def get_flowchart_layout(
+        self, flowchart_uid: str, version: int
+    ) -> Optional[Dict[str, List[float]]]:
+        """
+        Gets the stored node positions of a version of a flowchart.
+
+        Args:
+            flowchart_uid (str): The UID of the flowchart.
+            version (int): The version of the flowchart.
+
+        Returns:
+            Optional[Dict[str, List[float]]]: The position of each node by uid,
+            or None if no layout was stored for this version.
+        """
+
+    @abstractmethod
+    def store_flowchart_layout(
+        self, flowchart_uid: str, version: int, layout: Dict[str, List[float]]
+    ):
+        """
+        Stores the node positions computed for a version of a flowchart.
+
+        Args:
+            flowchart_uid (str): The UID of the flowchart.
+            version (int): The version the layout was computed for.
+            layout (Dict[str, List[float]]): The position of each node by uid.
+        """
+
     @abstractmethod
     def insert_job_output(self, job_id: int, output_type: str, output: str):
         """
@@ -436,29 +779,53 @@ class PostgresInterface(DBInterface):
 
     Attributes:
         config (DatabaseConfig): The configuration for the database connection.
-        conn: The connection to the PostgreSQL database.
-        cursor: The cursor for executing SQL queries.
+        pool (ConnectionPool): The process-wide pool connections are checked out from.
     """
 
     def __init__(self, config: DatabaseConfig):
         super().__init__(config)
-        self.conn = psycopg2.connect(
-            host=config.host,
-            database=config.database,
-            user=config.user,
-            password=config.password,
-            port=config.port,
-        )
-        self.init_schema()
+        self.pool = get_connection_pool(config)
+        if not self.pool.schema_initialized:
+            try:
+                self.init_schema()
+                self.pool.schema_initialized = True
+            except Exception as e:
+                self.logger.error(f"Error initializing schema: {e}")
+
+    @contextmanager
+    def cursor(self) -> Iterator[psycopg2.extensions.cursor]:
+        """
+        Cursor on a pooled connection, committed when the block exits
+        and rolled back if it raises
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                yield cursor
+
+    def execute_prepared(
+        self, cursor: psycopg2.extensions.cursor, name: str, params: Tuple[Any, ...]
+    ):
+        """
+        Run one of PREPARED_STATEMENTS, preparing it the first time it is
+        used on the cursor's connection
+        """
+        conn = cursor.connection
+        if name not in conn.prepared:
+            cursor.execute(
+                "SELECT 1 FROM pg_prepared_statements WHERE name = %s", (name,)
+            )
+            if cursor.fetchone() is None:
+                cursor.execute(f"PREPARE {name} AS {PREPARED_STATEMENTS[name]}")
+            conn.prepared.add(name)
+        placeholders = ", ".join(["%s"] * len(params))
+        cursor.execute(f"EXECUTE {name} ({placeholders})", params)
 
     def init_schema(self):
-        try:
-            with open("promptflow/sql/postgres_schema.sql", "r") as file:
-                with self.conn.cursor() as cursor:
-                    cursor.execute(file.read())
-                    self.conn.commit()
-        except Exception as e:
-            print(f"Error initializing schema: {e}")
+        with self.pool.connection() as conn:
+            for migration in migrate(conn):
+                self.logger.info(
+                    f"Applied migration {migration.version}: {migration.name}"
+                )
 
     def build_flowcharts_from_graph_view(
         self, graph_view: List[GraphView]
@@ -467,30 +834,58 @@ class PostgresInterface(DBInterface):
 
         for row in graph_view:
             flowchart = self.get_or_create_flowchart(flowcharts, row)
-            if row.current_node:
+            # the view has one row per branch, so nodes can repeat
+            if row.current_node and not flowchart.has_node(row.current_node):
                 self.add_node_to_flowchart(flowchart, row)
-            flowcharts.append(flowchart)
 
-        # Todo: Add connectors to flowchart in a single pass
+        flowcharts_by_uid = {flowchart.uid: flowchart for flowchart in flowcharts}
+        added_branches = set()
         for row in graph_view:
-            flowchart = list(filter(lambda x: x.uid == row.graph_uid, flowcharts))[0]
-            if row.next_node:
-                self.add_connector_to_flowchart(flowchart, row)
+            if row.next_node and row.branch_id not in added_branches:
+                added_branches.add(row.branch_id)
+                self.add_connector_to_flowchart(flowcharts_by_uid[row.graph_uid], row)
 
+        for flowchart in flowcharts:
+            flowchart.compile()
         return flowcharts
 
-    def get_node_type_id(self, node_type):
-        with self.conn.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT id FROM node_types WHERE name = %s
-                """,
-                [node_type],
+    def build_flowchart_from_document(self, document: FlowchartDocument) -> Flowchart:
+        flowchart = Flowchart(self, document.uid, document.label, document.created)
+        flowchart.id = document.id
+        for node in document.nodes:
+            self.deserialize_node(
+                flowchart,
+                node["node_type"],
+                node["metadata"],
+                node["label"],
+                node["uid"],
+                node["node_type_id"],
             )
-            row = cursor.fetchone()
-            if row is None:
+        for branch in document.branches:
+            label = branch["label"] or "Untitled"
+            flowchart.add_connector(
+                Connector(
+                    flowchart.find_node(branch["prev"]),
+                    flowchart.find_node(branch["next"]),
+                    TextData(label, branch["conditional"], flowchart)
+                    if branch["conditional"]
+                    else None,
+                    branch["uid"],
+                )
+            )
+        flowchart.compile()
+        return flowchart
+
+    def get_node_type_id(self, node_type):
+        node_type_ids = self.pool.node_type_ids
+        if node_type not in node_type_ids:
+            # load every type at once, so later lookups don't hit the database
+            with self.cursor() as cursor:
+                cursor.execute("SELECT name, id FROM node_types")
+                node_type_ids.update(cursor.fetchall())
+            if node_type not in node_type_ids:
                 raise ValueError(f"Node type {node_type} not found")
-            return row[0]
+        return node_type_ids[node_type]
 
     def get_or_create_flowchart(
         self, flowcharts: List[Flowchart], row: GraphView
@@ -512,20 +907,31 @@ class PostgresInterface(DBInterface):
         return flowchart
 
     @staticmethod
-    def add_node_to_flowchart(flowchart: Flowchart, row: GraphView) -> NodeBase:
-        if not row.node_type_name:
+    def deserialize_node(
+        flowchart: Flowchart,
+        node_type_name: Optional[str],
+        metadata: Optional[Dict[str, Any]],
+        label: Optional[str],
+        uid: Optional[str],
+        node_type_id: Optional[int],
+    ) -> NodeBase:
+        """
+        Create a node from its stored fields and add it to the flowchart
+        """
+        if not node_type_name:
             raise ValueError("Node type name cannot be null")
-        node_cls = node_map.get(row.node_type_name)
+        node_cls = node_map.get(node_type_name)
         if node_cls is None:
-            raise ValueError(f"Node type {row.node_type_name} not found in node_map")
+            raise ValueError(f"Node type {node_type_name} not found in node_map")
 
         node = node_cls.deserialize(
             flowchart,
-            (row.node_type_metadata or {})
+            # rows may be cached and shared, so nodes get their own options
+            copy.deepcopy(metadata or {})
             | {
-                "label": row.node_label,
-                "uid": row.current_node,
-                "node_type_id": row.node_type_id,
+                "label": label,
+                "uid": uid,
+                "node_type_id": node_type_id,
             },
         )
 
@@ -533,11 +939,20 @@ class PostgresInterface(DBInterface):
 
         return node
 
+    @staticmethod
+    def add_node_to_flowchart(flowchart: Flowchart, row: GraphView) -> NodeBase:
+        return PostgresInterface.deserialize_node(
+            flowchart,
+            row.node_type_name,
+            row.node_type_metadata,
+            row.node_label,
+            row.current_node,
+            row.node_type_id,
+        )
+
     def add_connector_to_flowchart(self, flowchart: Flowchart, row: GraphView):
         if not row.branch_id:
             return
-        if row.branch_id in map(lambda x: x.uid, flowchart.connectors):
-            return
         if not row.current_node or not row.next_node:
             return
         if not row.branch_label:
@@ -555,28 +970,41 @@ class PostgresInterface(DBInterface):
             )
             flowchart.add_connector(connector)
 
-    def get_flowchart_by_uid(self, uid) -> Flowchart:
-        with self.conn.cursor() as cursor:
-            cursor.execute(
-                "SELECT * FROM graph_view where graph_uid=%s", (uid,)
-            )  # todo select id,name from graph_view  for function get_graph_view
-            # todo for function get_graph_view_to_flowchart_list select id,name from graph_view where id = input_id
+    def get_graph_view(self, uid: str) -> List[GraphView]:
+        with self.cursor() as cursor:
+            cursor.execute("SELECT * FROM graph_view where graph_uid=%s", (uid,))
             rows = cursor.fetchall()
             if not rows:
                 raise ValueError(f"Flowchart with uid {uid} not found")
-            self.conn.commit()
-            graph_nodes = row_results_to_class_list(GraphView, rows)
-            return self.build_flowcharts_from_graph_view(graph_nodes)[0]
+            return row_results_to_class_list(GraphView, rows)
+
+    def get_flowchart_version(self, uid: str) -> int:
+        with self.cursor() as cursor:
+            self.execute_prepared(cursor, "graph_version_by_uid", (uid,))
+            row = cursor.fetchone()
+            if not row:
+                raise ValueError(f"Flowchart with uid {uid} not found")
+            return row[0]
+
+    def get_flowchart_document(self, uid: str) -> FlowchartDocument:
+        with self.cursor() as cursor:
+            self.execute_prepared(cursor, "graph_document_by_uid", (uid,))
+            row = cursor.fetchone()
+            if not row or row[0] is None:
+                raise ValueError(f"Flowchart with uid {uid} not found")
+            return FlowchartDocument(**row[0])
+
+    def get_flowchart_by_uid(self, uid) -> Flowchart:
+        return self.build_flowchart_from_document(self.get_flowchart_document(uid))
 
     def get_all_flowchart_ids_and_names(self) -> List[GraphNamesAndIds]:
-        with self.conn.cursor() as cursor:
+        with self.cursor() as cursor:
             cursor.execute("SELECT uid, label FROM graphs")
             rows = cursor.fetchall()
-            self.conn.commit()
             return row_results_to_class_list(GraphNamesAndIds, rows)
 
     def save_flowchart(self, flowchart: Flowchart):
-        with self.conn.cursor() as cursor:
+        with self.cursor() as cursor:
             cursor.callproc(
                 """
                 upsert_graph
@@ -585,20 +1013,57 @@ class PostgresInterface(DBInterface):
                     json.dumps(flowchart.serialize().dict()),
                 ],
             )
-            self.conn.commit()
+        publish_flowchart_change(flowchart.uid)
+
+    def save_flowcharts(self, flowcharts: List[Flowchart]):
+        # one statement per batch, and every batch in the same transaction
+        with self.cursor() as cursor:
+            for start in range(0, len(flowcharts), SAVE_BATCH_SIZE):
+                batch = [
+                    flowchart.serialize().dict()
+                    for flowchart in flowcharts[start : start + SAVE_BATCH_SIZE]
+                ]
+                cursor.execute(
+                    """
+                    SELECT count(*)
+                    FROM jsonb_array_elements(%s::jsonb) AS g(graph),
+                    LATERAL upsert_graph(g.graph)
+                    """,
+                    (json.dumps(batch),),
+                )
+        for flowchart in flowcharts:
+            publish_flowchart_change(flowchart.uid)
+
+    def patch_flowchart(self, flowchart_uid: str, patch: FlowchartPatch) -> int:
+        for node in patch.nodes:
+            self.get_node_type_id(node.get("node_type"))
+        data = patch.dict(exclude_none=True) | {"uid": flowchart_uid}
+        try:
+            with self.cursor() as cursor:
+                cursor.execute("SELECT patch_graph(%s)", (json.dumps(data),))
+                version = cursor.fetchone()[0]
+        except psycopg2.errors.NoDataFound as exc:
+            raise ValueError(f"Flowchart with uid {flowchart_uid} not found") from exc
+        except psycopg2.errors.SerializationFailure as exc:
+            raise FlowchartVersionConflict(str(exc).splitlines()[0]) from exc
+        except psycopg2.IntegrityError as exc:
+            # e.g. a branch to a node that doesn't exist
+            raise ValueError(f"Invalid patch: {str(exc).splitlines()[0]}") from exc
+        publish_flowchart_change(flowchart_uid)
+        return version
 
     def delete_flowchart(self, flowchart_uid: str):
-        with self.conn.cursor() as cursor:
+        with self.cursor() as cursor:
             cursor.execute(
                 """
                 DELETE FROM graphs WHERE uid = %s
                 """,
                 [flowchart_uid],
             )
-            self.conn.commit()
+        publish_flowchart_change(flowchart_uid)
 
     def create_job(self, job: dict, flowchart_id: int) -> int:
-        with self.conn.cursor() as cursor:
+        with self.cursor() as cursor:
             cursor.callproc(
                 "create_job",
                 [
@@ -609,11 +1074,10 @@ class PostgresInterface(DBInterface):
             if job_data is None:
                 raise ValueError("Job creation failed")
             job_id = job_data[0]
-            self.conn.commit()
             return job_id
 
     def update_job_status(self, job_id: int, status: str):
-        with self.conn.cursor() as cursor:
+        with self.cursor() as cursor:
             cursor.callproc(
                 "update_job_status",
                 [
@@ -625,71 +1089,245 @@ class PostgresInterface(DBInterface):
                     )
                 ],
             )
-            self.conn.commit()
 
     def create_job_log(self, job_id: int, data: dict):
-        with self.conn.cursor() as cursor:
+        with self.cursor() as cursor:
             cursor.execute(
                 "CALL create_job_log(%s)",
                 (json.dumps({"jobId": job_id, "data": data}),),
             )
-            self.conn.commit()
 
-    def get_all_jobs(
-        self,
-        graph_uid: Optional[str] = None,
-        status: Optional[str] = None,
-        limit: Optional[int] = None,
-    ) -> List[JobView]:
-        with self.conn.cursor() as cursor:
-            query = """SELECT * FROM jobs_view"""
-            if graph_uid or status:
-                query += """ WHERE"""
-                if graph_uid:
-                    query += """ graph_uid='%s'""" % graph_uid
-                if graph_uid and status:
-                    query += """ AND"""
-                if status:
-                    query += """ status=%s""" % status
-            query += """ ORDER BY id DESC"""
-            if limit:
-                query += """ LIMIT %s""" % str(limit)
+    def create_job_logs(self, job_id: int, logs: List[dict]):
+        if not logs:
+            return
+        with self.cursor() as cursor:
+            # clock_timestamp() differs per row, so the batch keeps its order
+            psycopg2.extras.execute_values(
+                cursor,
+                'INSERT INTO job_logs (job_id, "log", created) VALUES %s',
+                [(job_id, json.dumps(log)) for log in logs],
+                template="(%s, %s, clock_timestamp())",
+                page_size=len(logs),
+            )
+
+    def save_job_checkpoint(self, job_id: int, checkpoint: dict):
+        with self.cursor() as cursor:
             cursor.execute(
-                query,
+                """
+                INSERT INTO job_checkpoints
+                    (job_id, phase, node, state, queue, awaiting_input, node_input)
+                VALUES (%s, %s, %s, %s, %s, %s, NULL)
+                ON CONFLICT (job_id) DO UPDATE SET
+                    phase = EXCLUDED.phase,
+                    node = EXCLUDED.node,
+                    state = EXCLUDED.state,
+                    queue = EXCLUDED.queue,
+                    awaiting_input = EXCLUDED.awaiting_input,
+                    node_input = NULL,
+                    created = current_timestamp
+                """,
+                (
+                    job_id,
+                    checkpoint["phase"],
+                    checkpoint.get("node"),
+                    json.dumps(checkpoint["state"], default=str),
+                    json.dumps(checkpoint["queue"]),
+                    checkpoint.get("awaiting_input", False),
+                ),
             )
-            rows = cursor.fetchall()
-            self.conn.commit()
-            return list(map(JobView.hydrate, rows))
 
-    def get_job_view(self, job_id: int) -> JobView:
-        with self.conn.cursor() as cursor:
+    def get_job_checkpoint(self, job_id: int) -> Optional[JobCheckpoint]:
+        with self.cursor() as cursor:
             cursor.execute(
                 """
-                SELECT * FROM jobs_view where id=%s
+                SELECT job_id, phase, node, state, queue, created, awaiting_input,
+                    node_input
+                FROM job_checkpoints WHERE job_id = %s
                 """,
-                [job_id],
+                (job_id,),
             )
             row = cursor.fetchone()
-            self.conn.commit()
             if not row:
-                raise ValueError(f"Job with id {job_id} not found")
-            return JobView.hydrate(row)
+                return None
+            return JobCheckpoint.hydrate(row)
+
+    def _claim_job(
+        self,
+        cursor: psycopg2.extensions.cursor,
+        job_id: int,
+        statuses: Tuple[str, ...],
+    ) -> bool:
+        # the row lock taken by the update makes concurrent claims wait
+        cursor.execute(
+            """
+            UPDATE jobs SET current_status = 'PENDING', updated = current_timestamp
+            WHERE id = %s AND current_status = ANY(%s)
+            RETURNING id
+            """,
+            (job_id, list(statuses)),
+        )
+        if cursor.fetchone() is None:
+            return False
+        cursor.execute(
+            """
+            INSERT INTO job_status (status_id, job_id)
+            SELECT id, %s FROM job_statuses WHERE status = 'PENDING'
+            """,
+            (job_id,),
+        )
+        return True
 
-    def get_job_logs(self, job_id: int) -> List[JobLog]:
-        with self.conn.cursor() as cursor:
+    def claim_job(self, job_id: int, statuses: Tuple[str, ...]) -> bool:
+        with self.cursor() as cursor:
+            return self._claim_job(cursor, job_id, statuses)
+
+    def claim_job_input(self, job_id: int, node_input: str) -> bool:
+        with self.cursor() as cursor:
+            if not self._claim_job(cursor, job_id, SUSPENDED_STATUSES):
+                return False
             cursor.execute(
                 """
-                SELECT * FROM job_logs where job_id=%s
+                UPDATE job_checkpoints SET node_input = %s
+                WHERE job_id = %s AND awaiting_input AND node_input IS NULL
+                RETURNING job_id
                 """,
-                [job_id],
+                (node_input, job_id),
             )
-            rows = cursor.fetchall()
-            self.conn.commit()
-            return row_results_to_class_list(JobLog, rows)
+            if cursor.fetchone() is None:
+                # waiting inside a parallel branch, not suspended
+                cursor.connection.rollback()
+                return False
+            return True
+
+    def _jobs_query(
+        self,
+        graph_uid: Optional[str],
+        status: Optional[str],
+        after_id: Optional[int],
+        since: Optional[datetime],
+        limit: Optional[int],
+    ) -> Tuple[str, List[Any]]:
+        conditions, params = [], []
+        if graph_uid:
+            conditions.append("graph_uid = %s")
+            params.append(graph_uid)
+        if status:
+            conditions.append("status = %s")
+            params.append(status)
+        if after_id is not None:
+            conditions.append("id < %s")
+            params.append(after_id)
+        if since is not None:
+            conditions.append("updated > %s")
+            params.append(since)
+        query = "SELECT * FROM jobs_view"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id DESC"
+        if limit:
+            query += " LIMIT %s"
+            params.append(limit)
+        return query, params
+
+    def _job_logs_query(
+        self,
+        job_id: int,
+        after_id: Optional[int],
+        since: Optional[datetime],
+        limit: Optional[int],
+    ) -> Tuple[str, List[Any]]:
+        query = 'SELECT "log", job_id, created, id FROM job_logs WHERE job_id = %s'
+        params: List[Any] = [job_id]
+        if after_id is not None:
+            query += " AND id > %s"
+            params.append(after_id)
+        if since is not None:
+            query += " AND created > %s"
+            params.append(since)
+        query += " ORDER BY id"
+        if limit:
+            query += " LIMIT %s"
+            params.append(limit)
+        return query, params
+
+    def _stream(self, query: str, params: List[Any]) -> Iterator[Tuple[Any, ...]]:
+        """
+        Yield the rows of a query from a server-side cursor, so they are
+        fetched in batches instead of all at once. The server ends the
+        stream if it waits longer than POSTGRES_STREAM_IDLE_TIMEOUT seconds
+        between batches.
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                # a client that stops reading can't hold the connection forever
+                cursor.execute(
+                    "SET LOCAL idle_in_transaction_session_timeout = %s",
+                    (int(stream_idle_timeout() * 1000),),
+                )
+            with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cursor:
+                cursor.itersize = STREAM_BATCH_SIZE
+                cursor.execute(query, params)
+                yield from cursor
+
+    def get_all_jobs(
+        self,
+        graph_uid: Optional[str] = None,
+        status: Optional[str] = None,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+    ) -> List[JobView]:
+        query, params = self._jobs_query(graph_uid, status, after_id, since, limit)
+        with self.cursor() as cursor:
+            cursor.execute(query, params)
+            return list(map(JobView.hydrate, cursor.fetchall()))
+
+    def iter_all_jobs(
+        self,
+        graph_uid: Optional[str] = None,
+        status: Optional[str] = None,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+    ) -> Iterator[JobView]:
+        query, params = self._jobs_query(graph_uid, status, after_id, since, limit)
+        for row in self._stream(query, params):
+            yield JobView.hydrate(row)
+
+    def get_job_view(self, job_id: int) -> JobView:
+        with self.cursor() as cursor:
+            self.execute_prepared(cursor, "job_view_by_id", (job_id,))
+            row = cursor.fetchone()
+            if not row:
+                raise ValueError(f"Job with id {job_id} not found")
+            return JobView.hydrate(row)
+
+    def get_job_logs(
+        self,
+        job_id: int,
+        after_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        limit: Optional[int] = None,
+    ) -> List[JobLog]:
+        query, params = self._job_logs_query(job_id, after_id, since, limit)
+        with self.cursor() as cursor:
+            cursor.execute(query, params)
+            return row_results_to_class_list(JobLog, cursor.fetchall())
+
+    def iter_job_logs(
+        self,
+        job_id: int,
+        after_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[JobLog]:
+        query, params = self._job_logs_query(job_id, after_id, since, limit)
+        for row in self._stream(query, params):
+            yield JobLog.hydrate(row)
 
     def store_b64_image(self, image: str, flowchart_uid: str):
         image_bytes = base64.b64decode(image)
-        with self.conn.cursor() as cursor:
+        with self.cursor() as cursor:
             query = """
             UPDATE graphs
             SET image = %s
@@ -697,10 +1335,84 @@ class PostgresInterface(DBInterface):
             """
             cursor.execute(query, (image_bytes, flowchart_uid))
 
-            self.conn.commit()
+    def get_flowchart_image(self, flowchart_uid: str) -> Tuple[int, Optional[bytes]]:
+        with self.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT version, CASE WHEN image_version = version THEN image END
+                FROM graphs WHERE uid = %s
+                """,
+                (flowchart_uid,),
+            )
+            row = cursor.fetchone()
+            if not row:
+                raise ValueError(f"Flowchart with uid {flowchart_uid} not found")
+            return row[0], bytes(row[1]) if row[1] is not None else None
+
+    def store_flowchart_image(self, flowchart_uid: str, version: int, image: bytes):
+        with self.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE graphs SET image = %s, image_version = version
+                WHERE uid = %s AND version = %s
+                """,
+                (psycopg2.Binary(image), flowchart_uid, version),
+            )
+
+    def claim_flowchart_render(
+        self, flowchart_uid: str, version: int, timeout: float
+    ) -> bool:
+        with self.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE graphs
+                SET render_version = version, render_queued = current_timestamp
+                WHERE uid = %s AND version = %s
+                AND (
+                    render_version IS DISTINCT FROM version
+                    OR render_queued < current_timestamp - make_interval(secs => %s)
+                )
+                RETURNING version
+                """,
+                (flowchart_uid, version, timeout),
+            )
+            return cursor.fetchone() is not None
+
+    def release_flowchart_render(self, flowchart_uid: str, version: int):
+        with self.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE graphs SET render_version = NULL
+                WHERE uid = %s AND render_version = %s
+                """,
+                (flowchart_uid, version),
+            )
+
+    def get_flowchart_layout(
+        self, flowchart_uid: str, version: int
+    ) -> Optional[Dict[str, List[float]]]:
+        with self.cursor() as cursor:
+            cursor.execute(
+                "SELECT layout FROM graphs WHERE uid = %s AND layout_version = %s",
+                (flowchart_uid, version),
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    def store_flowchart_layout(
+        self, flowchart_uid: str, version: int, layout: Dict[str, List[float]]
+    ):
+        with self.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE graphs SET layout = %s, layout_version = version
+                WHERE uid = %s AND version = %s
+                """,
+                (json.dumps(layout), flowchart_uid, version),
+            )
 
     def insert_job_output(self, job_id: int, output_type: str, output: str):
-        with self.conn.cursor() as cursor:
+        with self.cursor() as cursor:
             cursor.execute(
                 """
                 INSERT INTO job_outputs (job_id, output_type, output)
@@ -708,18 +1420,11 @@ class PostgresInterface(DBInterface):
                 """,
                 (job_id, output_type, output),
             )
-            self.conn.commit()
 
     def get_job_output(self, job_id: int) -> JobResult:
-        with self.conn.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT job_id, output_type, output FROM job_outputs WHERE job_id = %s
-                """,
-                (job_id,),
-            )
+        with self.cursor() as cursor:
+            self.execute_prepared(cursor, "job_output_by_id", (job_id,))
             row = cursor.fetchone()
-            self.conn.commit()
             if not row:
                 raise ValueError(f"Job with id {job_id} not found")
             return JobResult.hydrate(row)
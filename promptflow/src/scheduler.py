@@ -0,0 +1,251 @@
+"""
+Execution plan and work list used by the Flowchart to schedule node execution
+without recursion.
+"""
+from __future__ import annotations
+
+from functools import cached_property
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Iterable, Mapping, Optional
+
+import networkx as nx
+
+from promptflow.src.nodes.start_node import InitNode, StartNode
+from promptflow.src.serializable import Serializable
+
+if TYPE_CHECKING:
+    from promptflow.src.connectors.connector import Connector
+    from promptflow.src.flowchart import Flowchart
+    from promptflow.src.nodes.node_base import NodeBase
+
+
+class ExecutionPlan:
+    """
+    Read-only view of a flowchart's graph, computed once so the engine and
+    exporters don't rescan the node list on every lookup.
+    The Flowchart drops its plan whenever nodes or connectors change, so
+    the lazily computed analytics always describe the current graph.
+    """
+
+    def __init__(self, flowchart: Flowchart):
+        nodes = tuple(flowchart.nodes)
+        self.nodes: tuple[NodeBase, ...] = nodes
+        self.nodes_by_uid: Mapping[str, NodeBase] = MappingProxyType(
+            {node.uid: node for node in nodes}
+        )
+
+        # with several start nodes, prefer the one with the fewest inputs
+        start_nodes = sorted(
+            (node for node in nodes if isinstance(node, StartNode)),
+            key=lambda node: len(node.input_connectors),
+        )
+        self.start_node: Optional[StartNode] = start_nodes[0] if start_nodes else None
+        self.init_node: Optional[InitNode] = next(
+            (node for node in nodes if isinstance(node, InitNode)), None
+        )
+
+        self.output_connectors: Mapping[NodeBase, tuple[Connector, ...]] = (
+            MappingProxyType({node: tuple(node.output_connectors) for node in nodes})
+        )
+        self.successors: Mapping[NodeBase, tuple[NodeBase, ...]] = MappingProxyType(
+            {
+                node: tuple(connector.next for connector in node.output_connectors)
+                for node in nodes
+            }
+        )
+
+        self.graph = flowchart.graph
+        self.connectors: tuple[Connector, ...] = tuple(flowchart.connectors)
+
+    # the analytics below are computed on first use, so building a plan for a
+    # run or an export only pays for what that caller reads
+
+    @cached_property
+    def components(self) -> tuple[tuple[NodeBase, ...], ...]:
+        """
+        Strongly connected components, in topological order of the condensed graph
+        """
+        condensed = nx.condensation(self.graph)
+        members = condensed.graph["mapping"]
+        components: list[list[NodeBase]] = [[] for _ in condensed.nodes]
+        for node in self.nodes:
+            components[members[node]].append(node)
+        return tuple(
+            tuple(components[index]) for index in nx.topological_sort(condensed)
+        )
+
+    @cached_property
+    def component_of(self) -> Mapping[NodeBase, int]:
+        """
+        Index into components of the component each node belongs to
+        """
+        return MappingProxyType(
+            {
+                node: index
+                for index, component in enumerate(self.components)
+                for node in component
+            }
+        )
+
+    @cached_property
+    def topological_order(self) -> tuple[NodeBase, ...]:
+        """
+        Nodes ordered so every node comes after its predecessors, except
+        within a cycle
+        """
+        return tuple(node for component in self.components for node in component)
+
+    @cached_property
+    def cycles(self) -> tuple[tuple[NodeBase, ...], ...]:
+        """
+        Components that contain a cycle, including nodes connected to themselves
+        """
+        return tuple(
+            component
+            for component in self.components
+            if len(component) > 1 or self.graph.has_edge(component[0], component[0])
+        )
+
+    @cached_property
+    def is_cyclic(self) -> bool:
+        """
+        True if any node can be reached again after it has run
+        """
+        return bool(self.cycles)
+
+    @cached_property
+    def distances(self) -> Mapping[NodeBase, int]:
+        """
+        Number of connectors on the shortest path from the start node to each
+        node reachable from it
+        """
+        if self.start_node is None:
+            return MappingProxyType({})
+        distances = {self.start_node: 0}
+        frontier = [self.start_node]
+        while frontier:
+            next_frontier = []
+            for node in frontier:
+                for successor in self.successors[node]:
+                    if successor not in distances:
+                        distances[successor] = distances[node] + 1
+                        next_frontier.append(successor)
+            frontier = next_frontier
+        return MappingProxyType(distances)
+
+    @cached_property
+    def unreachable(self) -> tuple[NodeBase, ...]:
+        """
+        Nodes that can't be reached from the start node
+        """
+        return tuple(node for node in self.nodes if node not in self.distances)
+
+    @cached_property
+    def sorted_connectors(self) -> tuple[Connector, ...]:
+        """
+        Connectors ordered by the distance of their source from the start
+        node. Connectors leaving unreachable nodes come last.
+        """
+        unreachable = len(self.nodes)
+        return tuple(
+            sorted(
+                self.connectors,
+                key=lambda connector: self.distances.get(connector.prev, unreachable),
+            )
+        )
+
+
+class ExecutionQueue(Serializable):
+    """
+    Holds the nodes that are ready to run, plus a stack of frames recording
+    which output connectors of already-run nodes still have to be evaluated.
+
+    The ready set is an insertion-ordered dict, so membership checks are O(1)
+    and nodes come out in the order they were added. Frames are evaluated
+    depth-first, which matches the order the recursive runner used.
+    """
+
+    def __init__(self, nodes: Optional[Iterable[NodeBase]] = None):
+        self.ready: dict[NodeBase, None] = dict.fromkeys(nodes or [])
+        self.frames: list[list[Any]] = []
+
+    def __contains__(self, node: NodeBase) -> bool:
+        return node in self.ready
+
+    def __len__(self) -> int:
+        return len(self.ready)
+
+    def empty(self) -> bool:
+        """
+        True if no nodes are waiting to run
+        """
+        return not self.ready
+
+    def done(self) -> bool:
+        """
+        True if no nodes are waiting and no connectors are left to evaluate
+        """
+        return not self.ready and not self.frames
+
+    def put(self, node: NodeBase) -> bool:
+        """
+        Mark a node as ready to run. Returns False if it was already queued.
+        """
+        if node in self.ready:
+            return False
+        self.ready[node] = None
+        return True
+
+    def requeue(self, node: NodeBase) -> None:
+        """
+        Put a node back at the head of the queue, so it is the next to run
+        """
+        self.ready.pop(node, None)
+        self.ready = {node: None, **self.ready}
+
+    def get(self) -> NodeBase:
+        """
+        Remove and return the oldest ready node
+        """
+        node = next(iter(self.ready))
+        del self.ready[node]
+        return node
+
+    def push_frame(self, node: NodeBase) -> None:
+        """
+        Schedule the output connectors of a node that just finished running
+        """
+        self.frames.append([node, 0])
+
+    def pop_frame(self) -> None:
+        """
+        Stop evaluating the connectors of the innermost frame
+        """
+        self.frames.pop()
+
+    def next_connector(self) -> Optional[Connector]:
+        """
+        Return the next connector to evaluate, dropping exhausted frames.
+        Returns None once every frame has been evaluated.
+        """
+        while self.frames:
+            frame = self.frames[-1]
+            node, index = frame
+            if index < len(node.output_connectors):
+                frame[1] += 1
+                return node.output_connectors[index]
+            self.frames.pop()
+        return None
+
+    def serialize(self) -> dict[str, Any]:
+        return {
+            "ready": [node.uid for node in self.ready],
+            "frames": [[node.uid, index] for node, index in self.frames],
+        }
+
+    @classmethod
+    def deserialize(cls, flowchart: Flowchart, data: dict[str, Any]) -> ExecutionQueue:
+        queue = cls(flowchart.find_node(uid) for uid in data.get("ready", []))
+        for uid, index in data.get("frames", []):
+            queue.frames.append([flowchart.find_node(uid), index])
+        return queue
@@ -5,11 +5,285 @@ State class definition
 from __future__ import annotations
 
 import logging
-from typing import Any
-
-import tiktoken
+from collections.abc import Mapping, MutableMapping, MutableSequence
+from typing import Any, Iterable, Iterator, Optional
 
 from promptflow.src.serializable import Serializable
+from promptflow.src.tokenizer import count_tokens
+
+
+def message_tokens(message: dict[str, str]) -> int:
+    """
+    Tokens in the content of a chat message
+    """
+    return count_tokens(str(message.get("content", "")))
+
+
+class _Link:
+    """
+    One message of a History, linked to the messages before it. Links are
+    never changed once made, so histories forked from each other share the
+    links they have in common. Each link also points to an earlier one
+    (skew-binary jump pointers), so any earlier link can be reached in
+    O(log n) steps.
+    """
+
+    __slots__ = ("message", "prev", "jump", "length", "tokens", "total")
+
+    def __init__(
+        self,
+        message: dict[str, str],
+        prev: Optional[_Link],
+        tokens: Optional[int] = None,
+    ):
+        self.message = message
+        self.prev = prev
+        self.length = prev.length + 1 if prev is not None else 1
+        self.jump = prev
+        if prev is not None and prev.jump is not None:
+            skip = prev.jump.jump
+            if skip is not None and (
+                prev.length - prev.jump.length == prev.jump.length - skip.length
+            ):
+                self.jump = skip
+        # tokens in this message, and in the history up to it, once counted
+        self.tokens = tokens
+        self.total: Optional[int] = None
+
+
+def _link_total(link: Optional[_Link]) -> int:
+    """
+    Tokens in the history ending at link, counting only the messages that
+    haven't been counted yet
+    """
+    pending = []
+    while link is not None and link.total is None:
+        pending.append(link)
+        link = link.prev
+    total = link.total if link is not None else 0
+    for uncounted in reversed(pending):
+        if uncounted.tokens is None:
+            uncounted.tokens = message_tokens(uncounted.message)
+        total += uncounted.tokens
+        uncounted.total = total
+    return total
+
+
+class History(MutableSequence):
+    """
+    Chat messages of a state, kept as a persistent linked list so copies
+    share their messages: copying is O(1) and appending adds one link
+    without copying anything. Each message is counted once, and totals and
+    windows are read from the running counts on the links.
+    Changes other than appending relink the messages after the change.
+    """
+
+    def __init__(self, messages: Iterable[dict[str, str]] = ()):
+        self._head: Optional[_Link] = None
+        # the messages in order, built on first read after a change
+        self._items: Optional[tuple[dict[str, str], ...]] = None
+        if isinstance(messages, History):
+            self._head = messages._head
+            self._items = messages._items
+        else:
+            for message in messages:
+                self._head = _Link(message, self._head)
+
+    def _links(self, start: int = 0) -> list[_Link]:
+        """
+        Links of the messages from start on, oldest first
+        """
+        links = []
+        link = self._head
+        while link is not None and link.length > start:
+            links.append(link)
+            link = link.prev
+        links.reverse()
+        return links
+
+    def _link_at(self, length: int) -> Optional[_Link]:
+        link = self._head
+        while link is not None and link.length > length:
+            link = link.prev
+        return link
+
+    def _relink(self, head: Optional[_Link], links: Iterable[_Link]) -> None:
+        for link in links:
+            head = _Link(link.message, head, link.tokens)
+        self._head = head
+        self._items = None
+
+    def _replace(self, messages: list[dict[str, str]]) -> None:
+        """
+        Make the history hold messages, keeping the links of the messages
+        that didn't change
+        """
+        items = self._list()
+        keep = 0
+        limit = min(len(items), len(messages))
+        while keep < limit and items[keep] is messages[keep]:
+            keep += 1
+        head = self._link_at(keep)
+        for message in messages[keep:]:
+            head = _Link(message, head)
+        self._head = head
+        self._items = None
+
+    def _list(self) -> tuple[dict[str, str], ...]:
+        if self._items is None:
+            messages = []
+            link = self._head
+            while link is not None:
+                messages.append(link.message)
+                link = link.prev
+            messages.reverse()
+            self._items = tuple(messages)
+        return self._items
+
+    def __len__(self) -> int:
+        return self._head.length if self._head is not None else 0
+
+    def __iter__(self) -> Iterator[dict[str, str]]:
+        return iter(self._list())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return History(self._list()[index])
+        return self._list()[index]
+
+    def __setitem__(self, index, value) -> None:
+        messages = list(self._list())
+        messages[index] = value
+        self._replace(messages)
+
+    def __delitem__(self, index) -> None:
+        messages = list(self._list())
+        del messages[index]
+        self._replace(messages)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (History, list, tuple)):
+            return list(self._list()) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"History({list(self._list())!r})"
+
+    def insert(self, index: int, value: dict[str, str]) -> None:
+        messages = list(self._list())
+        messages.insert(index, value)
+        self._replace(messages)
+
+    def append(self, value: dict[str, str]) -> None:
+        self._head = _Link(value, self._head)
+        self._items = None
+
+    def extend(self, values: Iterable[dict[str, str]]) -> None:
+        if isinstance(values, History):
+            # keep the counts the other history already has
+            self._relink(self._head, values._links())
+            return
+        for message in list(values):
+            self.append(message)
+
+    def clear(self) -> None:
+        self._head = None
+        self._items = None
+
+    def reverse(self) -> None:
+        self._replace(list(reversed(self._list())))
+
+    def copy(self) -> History:
+        return History(self)
+
+    @property
+    def token_count(self) -> int:
+        """
+        Tokens in all messages
+        """
+        return _link_total(self._head)
+
+    def window_start(self, max_tokens: int) -> int:
+        """
+        Index of the oldest of the latest messages that fit in max_tokens
+        """
+        # find the latest link the window has to leave out; running totals
+        # only grow, so a jump past links that all fit is always safe
+        threshold = _link_total(self._head) - max_tokens
+        if threshold <= 0:
+            return 0
+        link = self._head
+        while link is not None and _link_total(link) >= threshold:
+            if link.jump is not None and _link_total(link.jump) >= threshold:
+                link = link.jump
+            else:
+                link = link.prev
+        return min(link.length + 1 if link is not None else 1, len(self))
+
+    def tail(self, start: int) -> History:
+        """
+        The messages from start on, with their counts
+        """
+        history = History()
+        history._relink(None, self._links(start))
+        return history
+
+    def window(self, max_tokens: int) -> History:
+        """
+        The latest messages that fit in max_tokens
+        """
+        return self.tail(self.window_start(max_tokens))
+
+
+class Snapshot(MutableMapping):
+    """
+    Snapshot of a state. Copies share one dict until either of them is
+    written to, and the first write copies it, so forking a state doesn't
+    copy the snapshot of every node before it.
+    """
+
+    def __init__(self, values: Optional[Mapping[str, Any]] = None):
+        self._values: dict[str, Any] = dict(values or {})
+        self._shared = False
+
+    def _own(self) -> dict[str, Any]:
+        if self._shared:
+            self._values = self._values.copy()
+            self._shared = False
+        return self._values
+
+    def __getitem__(self, key: str) -> Any:
+        return self._values[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._own()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self._own()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __contains__(self, key) -> bool:
+        return key in self._values
+
+    def __repr__(self) -> str:
+        return f"Snapshot({self._values!r})"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._values.get(key, default)
+
+    def update(self, *args, **kwargs) -> None:
+        self._own().update(*args, **kwargs)
+
+    def copy(self) -> Snapshot:
+        snapshot = Snapshot()
+        snapshot._values = self._values
+        snapshot._shared = self._shared = True
+        return snapshot
 
 
 class State(Serializable):
@@ -19,12 +293,29 @@ class State(Serializable):
     """
 
     def __init__(self, **kwargs):
-        self.snapshot: dict[str, str] = kwargs.get("snapshot", {})
-        self.history: list[dict[str, str]] = kwargs.get("history", [])
+        self.snapshot = kwargs.get("snapshot", {})
+        self.history = kwargs.get("history", [])
         self.result: str = kwargs.get("result", "")
         self.data: Any = kwargs.get("data", {})
         self.logger = logging.getLogger(__name__)
         self.exception: bool = False
+        self._result_tokens: Optional[tuple[str, int]] = None
+
+    @property
+    def snapshot(self) -> Snapshot:
+        return self._snapshot
+
+    @snapshot.setter
+    def snapshot(self, values: Mapping[str, Any]) -> None:
+        self._snapshot = values if isinstance(values, Snapshot) else Snapshot(values)
+
+    @property
+    def history(self) -> History:
+        return self._history
+
+    @history.setter
+    def history(self, messages: Iterable[dict[str, str]]) -> None:
+        self._history = messages if isinstance(messages, History) else History(messages)
 
     def reset(self) -> None:
         """
@@ -45,7 +336,9 @@ class State(Serializable):
 
     def copy(self) -> "State":
         """
-        Create a new State object with a copy of the snapshot and history
+        Create a new State object with a copy of the snapshot and history.
+        The copy shares the snapshot and history with this state until
+        either of them changes, so copying doesn't depend on their size.
         """
         self.logger.debug("State copied")
         return State(
@@ -55,6 +348,31 @@ class State(Serializable):
             data=self.data.copy(),
         )
 
+    def merge(self, branches: list[State]) -> "State":
+        """
+        Fold forked branch states back into this one, in branch order.
+        Snapshot and data keys changed by a later branch win, new history
+        messages are appended branch by branch, and results are joined
+        with newlines.
+        """
+        base_snapshot = self.snapshot.copy()
+        base_data = self.data.copy()
+        base_length = len(self.history)
+        results = []
+        for branch in branches:
+            for key, value in branch.snapshot.items():
+                if key not in base_snapshot or base_snapshot[key] is not value:
+                    self.snapshot[key] = value
+            for key, value in branch.data.items():
+                if key not in base_data or base_data[key] is not value:
+                    self.data[key] = value
+            self.history.extend(branch.history.tail(base_length))
+            self.exception = self.exception or branch.exception
+            results.append(str(branch.result))
+        self.result = "\n".join(results)
+        self.logger.debug("Merged %d branches", len(branches))
+        return self
+
     @classmethod
     def deserialize(cls, data: dict[str, Any]) -> "State":
         return cls(**data)
@@ -63,7 +381,7 @@ class State(Serializable):
         str_snapshot = {k: str(v) for k, v in self.snapshot.items()}
         return {
             "snapshot": str_snapshot,
-            "history": self.history,
+            "history": list(self.history),
             "result": self.result,
             "data": self.data,
         }
@@ -79,9 +397,7 @@ class State(Serializable):
         """
         Get token count of history + result
         """
-        encoding = tiktoken.get_encoding("cl100k_base")  # assume gpt3/4
-        count = 0
-        for item in self.history:
-            count += len(encoding.encode(item["content"]))
-        count += len(encoding.encode(self.result))
-        return count
+        # the result is recounted only after it changes
+        if self._result_tokens is None or self._result_tokens[0] is not self.result:
+            self._result_tokens = (self.result, count_tokens(self.result))
+        return self.history.token_count + self._result_tokens[1]
@@ -1,66 +1,227 @@
-import base64
 import io
 import logging
+import os
 import traceback
+from typing import Optional
 
-import matplotlib.pyplot as plt
 import networkx as nx
+import psycopg2
+from celery.concurrency import get_implementation
+from celery.signals import (
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_shutdown,
+)
+from matplotlib.figure import Figure
 
 from promptflow.src.celery_app import celery_app
-from promptflow.src.flowchart import Flowchart
-from promptflow.src.nodes.node_base import NxNodeShape
+from promptflow.src.connection_pool import close_connection_pools
+from promptflow.src.flowchart import Flowchart, InputRequired
+from promptflow.src.flowchart_cache import get_flowchart_cache
+from promptflow.src.job_loop import close_job_loop, get_job_loop
+from promptflow.src.job_log import JobLogWriter
+from promptflow.src.nodes.node_base import NodeBase, NxNodeShape
 from promptflow.src.postgres_interface import (
     DatabaseConfig,
     DBInterface,
+    JobCheckpoint,
     PostgresInterface,
 )
+from promptflow.src.scheduler import ExecutionQueue
 from promptflow.src.state import State
 
 
-def log_result_generator(interface: DBInterface, job_id: int):
+@worker_init.connect
+def init_worker(sender=None, **kwargs):
+    """
+    Warm up a worker whose pool runs tasks in the worker's own process, such
+    as the threads pool. Prefork children warm up in init_worker_process.
+    """
+    pool_cls = getattr(sender, "pool_cls", None) or celery_app.conf.worker_pool
+    if "prefork" not in get_implementation(pool_cls).__module__:
+        init_worker_process()
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """
+    Open the connection pool when a worker process starts, so the first
+    task doesn't pay for it
+    """
+    try:
+        PostgresInterface(DatabaseConfig.from_env())
+    except psycopg2.Error as e:
+        # tasks open the pool themselves once the database is reachable
+        logging.error(f"Could not open database connection pool: {e}")
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    close_job_loop()
+    close_connection_pools()
+
+
+def get_flowchart(flowchart_uid: str, interface: DBInterface) -> Flowchart:
+    """
+    Build the flowchart for a task, from this worker's cache if possible
+    """
+    cache = get_flowchart_cache()
+    if cache is None:
+        return Flowchart.get_flowchart_by_uid(flowchart_uid, interface)
+    return cache.get(flowchart_uid, interface)
+
+
+def log_result_generator(log_writer: JobLogWriter):
     """
     Callback function to log the result of a flowchart run
     """
 
     def wrapper(s: str):
-        interface.create_job_log(job_id, {"message": s})
+        log_writer.write({"message": s})
+
+    return wrapper
+
+
+def close_log_writer(log_writer: Optional[JobLogWriter]):
+    """
+    Flush the logs of a job that was suspended or failed. Logs that can't be
+    written are reported here, and shouldn't hide the job's own error.
+    """
+    if log_writer is None:
+        return
+    try:
+        log_writer.close()
+    except Exception as e:  # pylint: disable=broad-except
+        logging.error(
+            f"Dropped {log_writer.dropped} logs of job {log_writer.job_id}: {e}"
+        )
+
+
+def checkpoint_generator(
+    interface: DBInterface, job_id: int, phase: str, awaiting_input: bool = False
+):
+    """
+    Callback function to checkpoint a flowchart run after each node
+    """
+
+    def wrapper(node: NodeBase, state: State, queue: ExecutionQueue):
+        interface.save_job_checkpoint(
+            job_id,
+            {
+                "phase": phase,
+                "node": node.uid,
+                "state": state.serialize(),
+                "queue": queue.serialize(),
+                "awaiting_input": awaiting_input,
+            },
+        )
 
     return wrapper
 
 
+def take_checkpoint_input(flowchart: Flowchart, checkpoint: JobCheckpoint) -> None:
+    """
+    Hand the input posted for a suspended job to the node it waits on. Only
+    a checkpoint written on suspension names that node, and the next
+    checkpoint, written once the node has run, drops the input, so a
+    retried task never feeds it to another node.
+    """
+    if checkpoint.awaiting_input and checkpoint.node_input is not None:
+        flowchart.pending_inputs[checkpoint.node] = checkpoint.node_input
+
+
 @celery_app.task(bind=True, name="promptflow.src.app.run_flowchart")
-def run_flowchart(self, flowchart_uid: str, db_config_init: dict) -> dict:
+def run_flowchart(
+    self,
+    flowchart_uid: str,
+    db_config_init: dict,
+    job_id: Optional[int] = None,
+) -> dict:
+    """
+    Run a flowchart as a job. Given the id of an existing job, the job is
+    resumed from its last checkpoint instead of starting over. If the job
+    was suspended waiting for input, the input posted for it is handed to
+    the node it was suspended on.
+    """
     logging.info("Task started: run_flowchart")
     db_config = DatabaseConfig(**db_config_init)
     interface = PostgresInterface(db_config)
+    log_writer: Optional[JobLogWriter] = None
 
     try:
         logging.info("Running flowchart")
-        flowchart: Flowchart = Flowchart.get_flowchart_by_uid(flowchart_uid, interface)
+        flowchart: Flowchart = get_flowchart(flowchart_uid, interface)
         if flowchart is None:
             raise ValueError(f"Flowchart with uid {flowchart_uid} not found")
         if not flowchart.id:
             raise ValueError(
                 f"Flowchart with uid {flowchart_uid} has not been saved to the database"
             )
-        job_id = interface.create_job({"celery_id": self.request.id}, flowchart.id)
-        interface.update_job_status(job_id, "PENDING")
-        init_state = flowchart.initialize(
-            job_id,
-            State(),
-            interface,
-            logging_function=log_result_generator(interface, job_id),
-        )
-        logging.info("Flowchart initialized")
+        flowchart.suspend_on_input = True
+        checkpoint = None
+        if job_id is None:
+            job_id = interface.create_job({"celery_id": self.request.id}, flowchart.id)
+            interface.update_job_status(job_id, "PENDING")
+        else:
+            checkpoint = interface.get_job_checkpoint(job_id)
+        log_writer = JobLogWriter.from_env(interface, job_id)
+
+        state = State()
+        phase = "init"
+        init_queue: Optional[ExecutionQueue] = None
+        run_queue: Optional[ExecutionQueue] = None
+        if checkpoint is not None:
+            logging.info(
+                f"Resuming job {job_id} at node {checkpoint.node} ({checkpoint.phase})"
+            )
+            log_writer.write({"message": f"Resuming from node {checkpoint.node}"})
+            take_checkpoint_input(flowchart, checkpoint)
+            state = State.deserialize(checkpoint.state)
+            queue = ExecutionQueue.deserialize(flowchart, checkpoint.queue)
+            if checkpoint.phase == "init":
+                init_queue = queue
+            else:
+                run_queue = queue
 
-        state = init_state
+        if run_queue is None:
+            state = get_job_loop().run(
+                flowchart.ainitialize(
+                    job_id,
+                    state,
+                    interface,
+                    logging_function=log_result_generator(log_writer),
+                    queue=init_queue,
+                    checkpoint_function=checkpoint_generator(interface, job_id, "init"),
+                )
+            )
+            logging.info("Flowchart initialized")
+
+        phase = "run"
         interface.update_job_status(job_id, "RUNNING")
-        state = flowchart.run(
-            job_id,
-            state,
-            interface,
-            logging_function=log_result_generator(interface, job_id),
+        if run_queue is None or not run_queue.done():
+            state = get_job_loop().run(
+                flowchart.arun(
+                    job_id,
+                    state,
+                    interface,
+                    run_queue,
+                    logging_function=log_result_generator(log_writer),
+                    max_workers=int(os.getenv("PROMPTFLOW_BRANCH_WORKERS", 1)),
+                    checkpoint_function=checkpoint_generator(interface, job_id, "run"),
+                )
+            )
+        log_writer.write(
+            {
+                "message": "Node cache: {hits} hits, {misses} misses".format(
+                    **flowchart.cache_stats.serialize()
+                ),
+                "node_cache": flowchart.cache_stats.serialize(),
+            }
         )
+        # every log is saved before the job is reported as done
+        log_writer.close()
         interface.update_job_status(job_id, "DONE")
         if state is not None:
             interface.insert_job_output(job_id, "JSON", str(state.serialize()))
@@ -69,67 +230,114 @@ def run_flowchart(self, flowchart_uid: str, db_config_init: dict) -> dict:
 
         logging.info("Finished running flowchart")
         logging.info("Task completed: run_flowchart")
-        return {"state": state.serialize() if state is not None else None}
+        return {
+            "state": state.serialize() if state is not None else None,
+            "node_cache": flowchart.cache_stats.serialize(),
+        }
+    except InputRequired as suspended:
+        # park the job until the input is posted, so this worker is free
+        close_log_writer(log_writer)
+        checkpoint_generator(interface, job_id, phase, awaiting_input=True)(
+            suspended.node, state, suspended.queue
+        )
+        interface.update_job_status(job_id, suspended.status)
+        logging.info(f"Job {job_id} suspended until input for {suspended.node.label}")
+        return {"state": state.serialize(), "suspended": suspended.node.uid}
     except Exception as e:
         logging.error(
             f"Task failed: run_flowchart, Error: {str(traceback.format_exc())}"
         )
-        raise self.retry(exc=e)
+        close_log_writer(log_writer)
+        if job_id is None:
+            raise self.retry(exc=e)
+        if self.request.retries >= self.max_retries:
+            interface.update_job_status(job_id, "FAILED")
+        # retry the same job, so it picks up from its last checkpoint
+        raise self.retry(exc=e, kwargs={"job_id": job_id})
 
 
-@celery_app.task(bind=True, name="promptflow.src.app.render_flowchart")
-def render_flowchart(self, flowchart_uid: str, db_config_init: dict):
-    logging.info("Task started: render_flowchart")
-    db_config = DatabaseConfig(**db_config_init)
-    interface = PostgresInterface(db_config)
-    flowchart = Flowchart.get_flowchart_by_uid(flowchart_uid, interface)
-    pos = flowchart.arrange_networkx(
-        lambda *args, **kwargs: nx.layout.spring_layout(*args, **kwargs, seed=1337)
-    )
+def flowchart_layout(
+    flowchart: Flowchart, version: int, interface: DBInterface
+) -> dict[NodeBase, tuple[float, float]]:
+    """
+    Node positions for a version of a flowchart, computed once and stored
+    """
+    layout = interface.get_flowchart_layout(flowchart.uid, version)
+    if layout is None or any(node.uid not in layout for node in flowchart.nodes):
+        pos = flowchart.arrange_networkx(
+            lambda *args, **kwargs: nx.layout.spring_layout(*args, **kwargs, seed=1337)
+        )
+        layout = {node.uid: [float(x), float(y)] for node, (x, y) in pos.items()}
+        interface.store_flowchart_layout(flowchart.uid, version, layout)
+    return {node: tuple(layout[node.uid]) for node in flowchart.nodes}
 
-    fig = plt.figure()
-    plt.box(False)
-    plt.margins(0.2)
-    node_size = max(list(map(lambda x: len(x.label) * 350, flowchart.nodes)))
+
+def draw_flowchart(flowchart: Flowchart, pos: dict) -> bytes:
+    """
+    Draw a flowchart as a PNG. Uses its own Figure rather than pyplot's
+    global state, so nothing is left behind in long-lived workers.
+    """
+    fig = Figure()
+    ax = fig.add_subplot()
+    ax.set_frame_on(False)
+    ax.margins(0.2)
+    node_size = max([len(node.label) * 350 for node in flowchart.nodes], default=0)
     for shape in NxNodeShape:
-        nodes = filter(lambda x: x.nx_shape == shape, flowchart.nodes)
+        nodes = [node for node in flowchart.nodes if node.nx_shape == shape]
+        if not nodes:
+            continue
         nx.draw_networkx_nodes(
             flowchart.graph.subgraph(nodes),
             pos=pos,
-            nx_shape=shape.value,
-            node_color=list(map(lambda x: x.color, nodes)),
+            node_shape=shape.value,
+            node_color=[node.color for node in nodes],
             node_size=node_size,
+            ax=ax,
         )
     nx.draw_networkx_edges(
         flowchart.graph,
         pos=pos,
         edgelist=flowchart.graph.edges,
         node_size=node_size,
+        ax=ax,
     )
     nx.draw_networkx_edge_labels(
         flowchart.graph,
         pos=pos,
-        edge_labels={
-            e: c.label for e, c in zip(flowchart.graph.edges, flowchart.connectors)
-        },
+        edge_labels={(c.prev, c.next): c.label for c in flowchart.connectors},
         rotate=False,
         bbox=dict(
             boxstyle="round", pad=0.2, facecolor="white", edgecolor="none", alpha=1
         ),
+        ax=ax,
     )
-
     nx.draw_networkx_labels(
         flowchart.graph,
         pos=pos,
         labels={node: node.label for node in flowchart.nodes},
         font_size=10,
+        ax=ax,
     )
 
-    plt.tight_layout()
-
+    fig.tight_layout()
     png_image = io.BytesIO()
-    plt.savefig(png_image, format="png", dpi=300, bbox_inches="tight")
-    png_image.seek(0)
+    fig.savefig(png_image, format="png", dpi=300, bbox_inches="tight")
+    return png_image.getvalue()
+
 
-    # convert bytes to base64 string
-    return base64.b64encode(png_image.read())
+@celery_app.task(bind=True, name="promptflow.src.app.render_flowchart")
+def render_flowchart(self, flowchart_uid: str, db_config_init: dict) -> int:
+    """
+    Render the current version of a flowchart and store the image with
+    the version it shows. Returns that version.
+    """
+    logging.info("Task started: render_flowchart")
+    db_config = DatabaseConfig(**db_config_init)
+    interface = PostgresInterface(db_config)
+    document = interface.get_flowchart_document(flowchart_uid)
+    flowchart = interface.build_flowchart_from_document(document)
+    pos = flowchart_layout(flowchart, document.version, interface)
+    png_image = draw_flowchart(flowchart, pos)
+    interface.store_flowchart_image(flowchart_uid, document.version, png_image)
+    logging.info("Task completed: render_flowchart")
+    return document.version
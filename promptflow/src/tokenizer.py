@@ -0,0 +1,43 @@
+"""
+Tokenizers shared by everything that counts tokens, so an encoding is looked
+up once per model rather than on every count.
+
+tiktoken downloads encoding files on first use. Run this module while
+building an image, with TIKTOKEN_CACHE_DIR set, to keep them in the image so
+workers can count tokens offline.
+"""
+import functools
+from typing import Optional
+
+import tiktoken
+
+# the GPT-3.5/4 encoding, also used to approximate models tiktoken doesn't know
+DEFAULT_ENCODING = "cl100k_base"
+# every encoding used by the supported models (text-davinci-003 uses p50k_base)
+ENCODINGS = [DEFAULT_ENCODING, "p50k_base"]
+
+
+@functools.lru_cache(maxsize=None)
+def encoding_for_model(model: Optional[str] = None) -> tiktoken.Encoding:
+    """
+    Return the tokenizer for a model. Models tiktoken has no encoding for,
+    such as Claude or PaLM, get the default encoding.
+    """
+    if model is not None:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            pass
+    return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Number of tokens in text for the given model
+    """
+    return len(encoding_for_model(model).encode(text))
+
+
+if __name__ == "__main__":
+    for name in ENCODINGS:
+        tiktoken.get_encoding(name)
@@ -0,0 +1,175 @@
+"""
+Fixtures for building flowcharts in memory, and for the database interface
+and the API with stand-ins for Postgres
+"""
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+import pytest
+
+from promptflow.src import postgres_interface
+from promptflow.src.connectors.connector import Connector
+from promptflow.src.flowchart import Flowchart
+from promptflow.src.nodes.node_base import NodeBase
+from promptflow.src.state import State
+
+
+class AppendNode(NodeBase):
+    """
+    Appends its label to the result and records that it ran
+    """
+
+    def run_subclass(self, before_result: Any, state: State) -> str:
+        state.snapshot.setdefault("ran", "")
+        state.snapshot["ran"] += self.label
+        return f"{state.result}{self.label}"
+
+
+class CountNode(NodeBase):
+    """
+    Adds one to the result
+    """
+
+    def run_subclass(self, before_result: Any, state: State) -> str:
+        return str(int(state.result or 0) + 1)
+
+
+@pytest.fixture
+def flowchart() -> Flowchart:
+    flowchart = Flowchart(None, "test")  # type: ignore
+    flowchart.node_cache = None
+    return flowchart
+
+
+@pytest.fixture
+def add_node(flowchart):
+    """
+    Add a node of the given class, using the label as its uid
+    """
+
+    def add(cls: type[NodeBase], label: str, **kwargs) -> NodeBase:
+        node = cls(flowchart, label, uid=label, node_type_id=label, **kwargs)
+        return flowchart.add_node(node)
+
+    return add
+
+
+@pytest.fixture
+def connect(flowchart):
+    """
+    Connect two nodes, with an optional condition given as source code
+    """
+
+    def add(prev: NodeBase, next: NodeBase, condition: Optional[str] = None):
+        connector = Connector(prev, next, condition, uid=f"{prev.uid}->{next.uid}")
+        return flowchart.add_connector(connector)
+
+    return add
+
+
+class StubCursor:
+    """
+    Records the statements run on it, and answers fetches from a script
+    of results, or raises the next scripted error
+    """
+
+    def __init__(self, connection: "StubConnection"):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql: str, params=None) -> None:
+        self.connection.statements.append((" ".join(sql.split()), params))
+        if self.connection.errors:
+            error = self.connection.errors.pop(0)
+            if error is not None:
+                raise error
+
+    def callproc(self, name: str, params=None) -> None:
+        self.execute(name, params)
+
+    def fetchone(self):
+        return self.connection.results.pop(0) if self.connection.results else None
+
+    def fetchall(self):
+        return self.connection.results.pop(0) if self.connection.results else []
+
+
+class StubConnection:
+    """
+    Connection handing out StubCursors. results are returned by fetches
+    and errors raised by executes, in order; None lets an execute pass.
+    """
+
+    def __init__(self):
+        self.statements: list = []
+        self.results: list = []
+        self.errors: list = []
+        self.prepared: set[str] = set()
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, *args, **kwargs) -> StubCursor:
+        return StubCursor(self)
+
+    def commit(self) -> None:
+        self.commits += 1
+
+    def rollback(self) -> None:
+        self.rollbacks += 1
+
+
+class StubPool:
+    """
+    Connection pool with a single StubConnection
+    """
+
+    maxconn = 2
+    schema_initialized = True
+
+    def __init__(self):
+        self.conn = StubConnection()
+        self.node_type_ids: dict[str, int] = {}
+
+    @contextmanager
+    def connection(self) -> Iterator[StubConnection]:
+        try:
+            yield self.conn
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+
+@pytest.fixture
+def stub_pool(monkeypatch) -> StubPool:
+    """
+    Make new database interfaces use a StubPool instead of Postgres
+    """
+    pool = StubPool()
+    monkeypatch.setattr(postgres_interface, "get_connection_pool", lambda _: pool)
+    return pool
+
+
+@pytest.fixture
+def db(stub_pool) -> postgres_interface.PostgresInterface:
+    """
+    A PostgresInterface whose statements run on stub_pool.conn
+    """
+    config = postgres_interface.DatabaseConfig.from_env()
+    return postgres_interface.PostgresInterface(config)
+
+
+@pytest.fixture
+def api(stub_pool):
+    """
+    The API module, imported without a database. Tests swap its interface
+    and tasks for fakes with monkeypatch.
+    """
+    from promptflow.src import app  # pylint: disable=import-outside-toplevel
+
+    return app
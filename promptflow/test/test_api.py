@@ -0,0 +1,316 @@
+"""
+Test API endpoints against a fake database interface and fake tasks
+"""
+import asyncio
+import datetime
+from types import SimpleNamespace
+from typing import Iterator, Optional
+
+import pytest
+from fastapi.testclient import TestClient
+
+from promptflow.src.flowchart import Flowchart
+from promptflow.src.flowchart_cache import ExportCache
+from promptflow.src.postgres_interface import JobView
+
+
+class FakeInterface:
+    """
+    Answers the calls the endpoints under test make
+    """
+
+    def __init__(self):
+        self.jobs: dict[int, str] = {}
+        self.open_streams = 0
+        self.versions: dict[str, int] = {}
+        self.documents_loaded = 0
+        self.images: dict[str, tuple[int, bytes]] = {}
+        self.render_claims: dict[str, int] = {}
+
+    def get_job_view(self, job_id: int) -> JobView:
+        if job_id not in self.jobs:
+            raise ValueError("Job not found")
+        now = datetime.datetime.now()
+        return JobView(
+            job_id=job_id,
+            job_status=self.jobs[job_id],
+            created=now,
+            updated=now,
+            metadata={},
+            graph_id=1,
+            graph_uid="graph",
+        )
+
+    def get_flowchart_version(self, uid: str) -> int:
+        if uid not in self.versions:
+            raise ValueError("Flowchart not found")
+        return self.versions[uid]
+
+    def get_flowchart_document(self, uid: str) -> SimpleNamespace:
+        self.documents_loaded += 1
+        return SimpleNamespace(uid=uid, version=self.get_flowchart_version(uid))
+
+    def build_flowchart_from_document(self, document) -> Flowchart:
+        return Flowchart(self, document.uid, f"v{document.version}")  # type: ignore
+
+    def get_flowchart_image(self, uid: str) -> tuple[int, Optional[bytes]]:
+        version = self.get_flowchart_version(uid)
+        image_version, image = self.images.get(uid, (None, None))
+        return version, image if image_version == version else None
+
+    def claim_flowchart_render(self, uid: str, version: int, timeout: float) -> bool:
+        if self.render_claims.get(uid) == version:
+            return False
+        self.render_claims[uid] = version
+        return True
+
+    def release_flowchart_render(self, uid: str, version: int) -> None:
+        if self.render_claims.get(uid) == version:
+            del self.render_claims[uid]
+
+    def iter_all_jobs(self, *args) -> Iterator[JobView]:
+        self.open_streams += 1
+        try:
+            for job_id in sorted(self.jobs, reverse=True):
+                yield self.get_job_view(job_id)
+        finally:
+            self.open_streams -= 1
+
+    def claim_job(self, job_id: int, statuses: tuple[str, ...]) -> bool:
+        if self.jobs.get(job_id) not in statuses:
+            return False
+        self.jobs[job_id] = "PENDING"
+        return True
+
+
+class FakeTask:
+    """
+    Records what would have been queued
+    """
+
+    def __init__(self):
+        self.calls: list = []
+
+    def apply_async(self, args, kwargs=None, task_id=None):
+        self.calls.append((args, kwargs))
+        return SimpleNamespace(id=task_id or f"task-{len(self.calls)}")
+
+
+@pytest.fixture
+def fake_interface(api, monkeypatch) -> FakeInterface:
+    interface = FakeInterface()
+    interface.config = SimpleNamespace(dict=lambda: {})
+    monkeypatch.setattr(api, "interface", interface)
+    return interface
+
+
+@pytest.fixture
+def client(api) -> TestClient:
+    return TestClient(api.app)
+
+
+@pytest.mark.parametrize("status", ["FAILED", "INPUT_REQUIRED", "FILE_INPUT_REQUIRED"])
+def test_resume_job(api, monkeypatch, fake_interface, client, status):
+    task = FakeTask()
+    monkeypatch.setattr(api, "run_flowchart", task)
+    fake_interface.jobs[1] = status
+    response = client.post("/jobs/1/resume")
+    assert response.status_code == 200
+    assert task.calls == [(("graph", {}), {"job_id": 1})]
+    assert fake_interface.jobs[1] == "PENDING"
+
+
+@pytest.mark.parametrize("status", ["RUNNING", "PENDING", "DONE"])
+def test_resume_job_rejected(api, monkeypatch, fake_interface, client, status):
+    task = FakeTask()
+    monkeypatch.setattr(api, "run_flowchart", task)
+    fake_interface.jobs[1] = status
+    response = client.post("/jobs/1/resume")
+    assert response.status_code == 409
+    assert task.calls == []
+
+
+def test_resume_twice_queues_once(api, monkeypatch, fake_interface, client):
+    task = FakeTask()
+    monkeypatch.setattr(api, "run_flowchart", task)
+    fake_interface.jobs[1] = "FAILED"
+    assert client.post("/jobs/1/resume").status_code == 200
+    assert client.post("/jobs/1/resume").status_code == 409
+    assert len(task.calls) == 1
+
+
+def test_resume_unknown_job(fake_interface, client):
+    assert client.post("/jobs/2/resume").status_code == 404
+
+
+@pytest.fixture
+def limiters(api, monkeypatch):
+    monkeypatch.setattr(api, "_db_limiter", None)
+    monkeypatch.setattr(api, "_stream_limiter", None)
+
+
+def test_stream_jobs(fake_interface, client, limiters):
+    fake_interface.jobs.update({1: "DONE", 2: "RUNNING"})
+    response = client.get("/jobs", headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert [JobView.parse_raw(line).job_id for line in lines] == [2, 1]
+    assert fake_interface.open_streams == 0
+
+
+def test_stream_closed_when_client_leaves(api, fake_interface, limiters):
+    fake_interface.jobs.update({1: "DONE", 2: "RUNNING"})
+
+    async def read_one():
+        rows = api.stream_db(fake_interface.iter_all_jobs())
+        assert (await rows.__anext__()).job_id == 2
+        assert fake_interface.open_streams == 1
+        assert api._db_limiter.borrowed_tokens == 1
+        await rows.aclose()
+
+    asyncio.run(read_one())
+    assert fake_interface.open_streams == 0
+    assert api._db_limiter.borrowed_tokens == 0
+    assert api._stream_limiter.borrowed_tokens == 0
+
+
+def test_streams_limited(api, monkeypatch, fake_interface, limiters):
+    monkeypatch.setenv("POSTGRES_STREAM_MAX", "1")
+    fake_interface.jobs[1] = "DONE"
+
+    async def read_two():
+        first = api.stream_db(fake_interface.iter_all_jobs())
+        second = api.stream_db(fake_interface.iter_all_jobs())
+        await first.__anext__()
+        waiting = asyncio.ensure_future(second.__anext__())
+        await asyncio.sleep(0.1)
+        # the second stream only starts once the first has ended
+        assert not waiting.done()
+        await first.aclose()
+        assert (await waiting).job_id == 1
+        await second.aclose()
+
+    asyncio.run(read_two())
+    assert fake_interface.open_streams == 0
+
+
+@pytest.fixture
+def export_cache(api, monkeypatch) -> ExportCache:
+    cache = ExportCache()
+    monkeypatch.setattr(api, "export_cache", cache)
+    return cache
+
+
+def test_export_etag(fake_interface, export_cache, client):
+    fake_interface.versions["graph"] = 3
+    response = client.get("/flowcharts/graph/dot")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"3"'
+    assert response.text.startswith('digraph "v3" {')
+    assert export_cache.get("graph", "dot", 3) == response.content
+    # the client's copy is still current
+    for tag in ['"3"', 'W/"1", "3"', "*"]:
+        response = client.get("/flowcharts/graph/dot", headers={"If-None-Match": tag})
+        assert response.status_code == 304
+        assert response.content == b""
+    assert fake_interface.documents_loaded == 1
+
+
+def test_export_cached(fake_interface, export_cache, client):
+    fake_interface.versions["graph"] = 3
+    export_cache.put("graph", "dot", 3, b"cached")
+    response = client.get("/flowcharts/graph/dot", headers={"If-None-Match": '"2"'})
+    assert response.status_code == 200
+    assert response.content == b"cached"
+    assert fake_interface.documents_loaded == 0
+
+
+def test_export_new_version(fake_interface, export_cache, client):
+    fake_interface.versions["graph"] = 3
+    client.get("/flowcharts/graph/dot")
+    fake_interface.versions["graph"] = 4
+    response = client.get("/flowcharts/graph/dot", headers={"If-None-Match": '"3"'})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"4"'
+    assert response.text.startswith('digraph "v4" {')
+    assert export_cache.get("graph", "dot", 3) is None
+    assert fake_interface.documents_loaded == 2
+
+
+def test_export_not_found(fake_interface, export_cache, client):
+    assert client.get("/flowcharts/missing/dot").status_code == 404
+
+
+class FakeResult:
+    """
+    Celery result of a task, failed if its id is in failures
+    """
+
+    failures: dict[str, str] = {}
+
+    def __init__(self, task_id: str, app=None):
+        self.task_id = task_id
+
+    def failed(self) -> bool:
+        return self.task_id in self.failures
+
+    @property
+    def result(self) -> Exception:
+        return RuntimeError(self.failures[self.task_id])
+
+    def forget(self) -> None:
+        del self.failures[self.task_id]
+
+
+@pytest.fixture
+def render_task(api, monkeypatch) -> FakeTask:
+    task = FakeTask()
+    monkeypatch.setattr(api, "render_flowchart", task)
+    monkeypatch.setattr(api, "AsyncResult", FakeResult)
+    monkeypatch.setattr(FakeResult, "failures", {})
+    return task
+
+
+def test_render_png(fake_interface, render_task, client):
+    fake_interface.versions["graph"] = 2
+    for _ in range(2):
+        response = client.get("/flowcharts/graph/png")
+        assert response.status_code == 202
+        assert response.headers["Location"] == "/flowcharts/graph/png"
+        assert response.headers["Retry-After"] == "1"
+        assert response.json()["version"] == 2
+    # polling doesn't queue the render again
+    assert render_task.calls == [(("graph", {}), None)]
+
+    fake_interface.images["graph"] = (2, b"png")
+    response = client.get("/flowcharts/graph/png")
+    assert response.status_code == 200
+    assert response.content == b"png"
+    assert response.headers["ETag"] == '"2"'
+    response = client.get("/flowcharts/graph/png", headers={"If-None-Match": '"2"'})
+    assert response.status_code == 304
+
+
+def test_render_png_new_version(fake_interface, render_task, client):
+    fake_interface.versions["graph"] = 2
+    fake_interface.images["graph"] = (2, b"png")
+    fake_interface.versions["graph"] = 3
+    assert client.get("/flowcharts/graph/png").status_code == 202
+    assert len(render_task.calls) == 1
+
+
+def test_render_png_failed(fake_interface, render_task, client):
+    fake_interface.versions["graph"] = 2
+    client.get("/flowcharts/graph/png")
+    FakeResult.failures["render-graph-2"] = "out of memory"
+    response = client.get("/flowcharts/graph/png")
+    assert response.status_code == 500
+    assert "out of memory" in response.json()["message"]
+    # the failure is reported once, then the render is queued again
+    assert client.get("/flowcharts/graph/png").status_code == 202
+    assert len(render_task.calls) == 2
+
+
+def test_render_png_not_found(fake_interface, render_task, client):
+    assert client.get("/flowcharts/missing/png").status_code == 404
+    assert render_task.calls == []
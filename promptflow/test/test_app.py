@@ -1,3 +1,5 @@
+import json
+
 import pytest
 from fastapi.testclient import TestClient
 
@@ -178,6 +180,71 @@ def test_get_flowchart_by_uid(create_test_flowchart):
     assert str(response.json()["id"]) == create_test_flowchart
 
 
+@pytest.mark.parametrize("create_test_flowchart", ["advanced"], indirect=True)
+def test_patch_flowchart(create_test_flowchart):
+    response = client.patch(
+        f"/flowcharts/{create_test_flowchart}",
+        json={
+            "nodes": [
+                {
+                    "uid": "3",
+                    "label": "Output",
+                    "node_type": "LoggingNode",
+                    "metadata": {},
+                }
+            ],
+            "branches": [
+                {"uid": "2", "conditional": "", "label": "Log", "prev": "2", "next": "3"}
+            ],
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["version"] > 1
+
+    flowchart = client.get(f"/flowcharts/{create_test_flowchart}").json()
+    assert "3" in [node["uid"] for node in flowchart["nodes"]]
+
+
+def test_patch_flowchart_not_found():
+    response = client.patch("/flowcharts/999", json={"deleted_nodes": ["1"]})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("create_test_flowchart", ["simple"], indirect=True)
+def test_get_flowchart_not_modified(create_test_flowchart):
+    for path in ["", "/flowchartjs", "/mermaid", "/graphml", "/dot"]:
+        response = client.get(f"/flowcharts/{create_test_flowchart}{path}")
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+
+        response = client.get(
+            f"/flowcharts/{create_test_flowchart}{path}",
+            headers={"If-None-Match": etag},
+        )
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+
+
+@pytest.mark.parametrize("create_test_flowchart", ["simple"], indirect=True)
+def test_render_flowchart_png(create_test_flowchart):
+    response = client.get(f"/flowcharts/{create_test_flowchart}/png")
+    assert response.status_code in [200, 202]
+    if response.status_code == 202:
+        assert response.headers["Location"].endswith("/png")
+    else:
+        assert response.headers["Content-Type"] == "image/png"
+
+
+@pytest.mark.parametrize("create_test_flowchart", ["chat_gpt"], indirect=True)
+def test_get_flowchart_graphml(create_test_flowchart):
+    response = client.get(f"/flowcharts/{create_test_flowchart}/graphml")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/graphml+xml"
+    assert "<graph " in response.text
+    assert response.text.count("<node ") == 5
+    assert response.text.count("<edge ") == 4
+
+
 def test_get_flowchart_not_found():
     # Simulate a GET request to the /flowcharts/{flowchart_id} endpoint with an invalid ID
     response = client.get("/flowcharts/999")
@@ -226,6 +293,9 @@ def test_cost_flowchart(create_test_flowchart):
     response = client.get(f"/flowcharts/{create_test_flowchart}/cost")
     assert response.status_code == 200
     assert "cost" in response.json()
+    estimate = response.json()
+    assert estimate["min_cost"] <= estimate["expected_cost"] <= estimate["max_cost"]
+    assert estimate["nodes"][0]["probability"] == 1.0
 
 
 @pytest.mark.parametrize(
@@ -236,6 +306,25 @@ def test_save_as(create_test_flowchart):
     assert response.status_code in [200, 404]
 
 
+@pytest.mark.parametrize("create_test_flowchart", ["chat_gpt"], indirect=True)
+def test_export_import_flowcharts(create_test_flowchart):
+    response = client.post("/flowcharts/export", json={"uids": [create_test_flowchart]})
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/zip"
+
+    response = client.post(
+        "/flowcharts/import",
+        files={"file": ("flowcharts.zip", response.content, "application/zip")},
+    )
+    assert response.status_code == 200
+    assert response.json()["flowchart_ids"] == [create_test_flowchart]
+
+
+def test_export_flowcharts_not_found():
+    response = client.post("/flowcharts/export", json={"uids": ["999"]})
+    assert response.status_code == 404
+
+
 # def test_load_from(create_test_flowchart):
 #     file_to_upload = {"file": open(create_test_flowchart, "rb")}
 #     response = client.post("/flowcharts/load_from", files=file_to_upload)
@@ -347,3 +436,18 @@ def test_get_job_logs():
     response = client.get("/jobs/1/logs")
     assert response.status_code == 200
     assert "logs" in response.json()
+
+
+def test_get_job_logs_ndjson():
+    response = client.get(
+        "/jobs/1/logs", headers={"Accept": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    logs = [json.loads(line) for line in response.text.splitlines()]
+    assert all(log["job_id"] == 1 for log in logs)
+
+
+def test_resume_job_not_found():
+    response = client.post("/jobs/999/resume")
+    assert response.status_code == 404
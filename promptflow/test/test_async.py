@@ -0,0 +1,130 @@
+"""
+Test running flowcharts concurrently on one event loop
+"""
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from promptflow.src import tasks
+from promptflow.src.connectors.connector import Connector
+from promptflow.src.flowchart import Flowchart
+from promptflow.src.job_loop import JobLoop
+from promptflow.src.nodes.node_base import NodeBase
+from promptflow.src.nodes.start_node import StartNode
+from promptflow.src.state import State
+
+
+class Overlap:
+    """
+    Counts how many coroutines are inside it at once
+    """
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+
+    async def wait(self, seconds: float) -> None:
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(seconds)
+        self.running -= 1
+
+
+class SleepNode(NodeBase):
+    """
+    Waits without blocking the event loop
+    """
+
+    overlap: Overlap
+
+    def run_subclass(self, before_result: Any, state: State) -> str:
+        time.sleep(0.2)
+        return self.label
+
+    async def arun_subclass(self, before_result: Any, state: State) -> str:
+        await self.overlap.wait(0.2)
+        return self.label
+
+
+def build_flowchart(uid: str, overlap: Overlap) -> Flowchart:
+    flowchart = Flowchart(None, uid)  # type: ignore
+    flowchart.node_cache = None
+    start = StartNode(flowchart, "start", uid="start", node_type_id=1)
+    sleep = SleepNode(flowchart, "sleep", uid="sleep", node_type_id=2)
+    sleep.overlap = overlap
+    flowchart.add_node(start)
+    flowchart.add_node(sleep)
+    flowchart.add_connector(Connector(start, sleep, uid="start->sleep"))
+    return flowchart
+
+
+def run_job(job_loop: JobLoop, flowchart: Flowchart, results: list) -> None:
+    results.append(job_loop.run(flowchart.arun(0, None, None)).result)
+
+
+def test_arun_jobs_overlap():
+    overlap = Overlap()
+    flowcharts = [build_flowchart(str(i), overlap) for i in range(5)]
+
+    async def run_all():
+        return await asyncio.gather(
+            *[flowchart.arun(i, None, None) for i, flowchart in enumerate(flowcharts)]
+        )
+
+    states = asyncio.run(run_all())
+    assert [state.result for state in states] == ["sleep"] * 5
+    assert overlap.peak == 5
+
+
+def test_job_loop_runs_jobs_from_threads_at_once():
+    overlap = Overlap()
+    job_loop = JobLoop(max_jobs=4)
+    results = []
+    try:
+        threads = [
+            threading.Thread(
+                target=run_job,
+                args=(job_loop, build_flowchart(str(i), overlap), results),
+            )
+            for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        job_loop.close()
+    assert results == ["sleep"] * 4
+    assert overlap.peak == 4
+
+
+def test_job_loop_limits_jobs():
+    overlap = Overlap()
+    job_loop = JobLoop(max_jobs=2)
+    try:
+        threads = [
+            threading.Thread(target=job_loop.run, args=(overlap.wait(0.1),))
+            for _ in range(6)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        job_loop.close()
+    assert overlap.peak == 2
+
+
+@pytest.mark.parametrize(
+    "pool, warmed", [("prefork", False), ("threads", True), ("solo", True)]
+)
+def test_worker_warm_up_by_pool(monkeypatch, pool, warmed):
+    calls = []
+    monkeypatch.setattr(tasks, "init_worker_process", lambda: calls.append(pool))
+    tasks.init_worker(sender=SimpleNamespace(pool_cls=pool))
+    # prefork children warm up from worker_process_init instead
+    assert bool(calls) == warmed
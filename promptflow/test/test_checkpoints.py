@@ -0,0 +1,118 @@
+"""
+Test node retries, job checkpoints and resuming from them
+"""
+import asyncio
+import datetime
+from typing import Any
+
+import pytest
+
+from promptflow.src.nodes.node_base import NodeBase, RetryPolicy
+from promptflow.src.nodes.start_node import StartNode
+from promptflow.src.postgres_interface import JobCheckpoint
+from promptflow.src.scheduler import ExecutionQueue
+from promptflow.src.state import State
+from promptflow.src.tasks import take_checkpoint_input
+from promptflow.test.conftest import AppendNode
+
+
+class FlakyNode(NodeBase):
+    """
+    Fails a number of times before it succeeds
+    """
+
+    retry_policy = RetryPolicy(max_attempts=3, backoff=0)
+    failures = 0
+
+    def run_subclass(self, before_result: Any, state: State) -> str:
+        self.attempts = getattr(self, "attempts", 0) + 1
+        if self.attempts <= self.failures:
+            raise ConnectionError(f"attempt {self.attempts} failed")
+        return "ok"
+
+
+class Crash(Exception):
+    """
+    Stands in for a worker dying between two nodes
+    """
+
+
+def test_retry_delay():
+    policy = RetryPolicy(max_attempts=4, backoff=0.5, backoff_factor=3)
+    assert [policy.delay(attempt) for attempt in [1, 2, 3]] == [0.5, 1.5, 4.5]
+
+
+@pytest.mark.parametrize("failures, result", [(2, "ok"), (3, "Error in node")])
+def test_retry_until_max_attempts(add_node, failures, result):
+    node = add_node(FlakyNode, "flaky")
+    node.failures = failures
+    state = State()
+    node.run_node(None, state)
+    assert node.attempts == 3
+    assert state.result.startswith(result)
+    assert state.exception == (failures >= 3)
+
+
+def test_async_retry(add_node):
+    node = add_node(FlakyNode, "flaky")
+    node.failures = 2
+    state = State()
+    asyncio.run(node.arun_node(None, state))
+    assert node.attempts == 3
+    assert state.result == "ok"
+
+
+def test_resume_from_checkpoint(flowchart, add_node, connect):
+    start = add_node(StartNode, "start")
+    nodes = [add_node(AppendNode, label) for label in "abcd"]
+    for prev, next in zip([start, *nodes], nodes):
+        connect(prev, next)
+    checkpoints = []
+
+    def checkpoint(node, state, queue):
+        checkpoints.append(
+            {"node": node.uid, "state": state.serialize(), "queue": queue.serialize()}
+        )
+        if node.uid == "b":
+            raise Crash()
+
+    with pytest.raises(Crash):
+        flowchart.run(0, None, None, checkpoint_function=checkpoint)
+    last = checkpoints[-1]
+    assert last["node"] == "b"
+    assert last["state"]["snapshot"]["ran"] == "ab"
+
+    state = flowchart.run(
+        0,
+        State.deserialize(last["state"]),
+        None,
+        ExecutionQueue.deserialize(flowchart, last["queue"]),
+    )
+    # only the nodes after the checkpoint run again
+    assert state.snapshot["ran"] == "abcd"
+    assert state.result == "abcd"
+
+
+def make_checkpoint(awaiting_input: bool, node_input=None) -> JobCheckpoint:
+    return JobCheckpoint(
+        job_id=1,
+        phase="run",
+        node="input",
+        state={},
+        queue={},
+        created=datetime.datetime.now(),
+        awaiting_input=awaiting_input,
+        node_input=node_input,
+    )
+
+
+def test_checkpoint_input_for_waiting_node(flowchart):
+    take_checkpoint_input(flowchart, make_checkpoint(True, "hello"))
+    assert flowchart.pending_inputs == {"input": "hello"}
+
+
+def test_checkpoint_input_ignored_after_node_ran(flowchart):
+    # a checkpoint written after a node ran names that node, not a waiting one
+    take_checkpoint_input(flowchart, make_checkpoint(False, "hello"))
+    take_checkpoint_input(flowchart, make_checkpoint(True))
+    assert flowchart.pending_inputs == {}
@@ -0,0 +1,64 @@
+"""
+Test compiling and evaluating connector conditions
+"""
+import pytest
+
+from promptflow.src.connectors.connector import (
+    ConditionError,
+    compile_condition,
+    load_condition,
+)
+from promptflow.src.state import State
+from promptflow.test.conftest import AppendNode
+
+COUNTER_CONDITION = """counter = 0
+def main(state):
+    global counter
+    counter += 1
+    return counter == 1
+"""
+
+
+def test_condition_compiled_once():
+    compile_condition.cache_clear()
+    text = "def main(state):\n\treturn state['a'] == '1'\n"
+    assert load_condition(text)(State(snapshot={"a": "1"}))
+    assert not load_condition(text)(State(snapshot={"a": "2"}))
+    info = compile_condition.cache_info()
+    assert info.misses == 1 and info.hits == 1
+
+
+def test_condition_globals_not_shared():
+    # each evaluation starts from a fresh namespace
+    assert load_condition(COUNTER_CONDITION)(State())
+    assert load_condition(COUNTER_CONDITION)(State())
+
+
+def test_condition_globals_available():
+    text = "def main(state):\n\treturn bool(datetime and nx and os and time)\n"
+    assert load_condition(text)(State())
+
+
+def test_condition_without_main():
+    with pytest.raises(NameError):
+        load_condition("x = 1\n")
+
+
+def test_connector_evaluate(add_node, connect):
+    a, b, c = (add_node(AppendNode, label) for label in "abc")
+    default = connect(a, b)
+    failing = connect(a, c, "def main(state):\n\treturn missing\n")
+    assert default.unconditional
+    assert default.evaluate(State())
+    with pytest.raises(ConditionError) as error:
+        failing.evaluate(State())
+    assert "a -> c" in str(error.value)
+
+
+def test_conditions_isolated_between_connectors(add_node, connect):
+    a, b, c = (add_node(AppendNode, label) for label in "abc")
+    first = connect(a, b, COUNTER_CONDITION)
+    second = connect(a, c, COUNTER_CONDITION)
+    assert first.evaluate(State())
+    assert second.evaluate(State())
+    assert first.evaluate(State())
@@ -0,0 +1,107 @@
+"""
+Test estimating the cost of a flowchart along the paths a run can take
+"""
+import pytest
+
+from promptflow.src.connectors.connector import DEFAULT_COND_TEMPLATE
+from promptflow.src.cost import estimate_cost
+from promptflow.src.nodes.start_node import StartNode
+from promptflow.src.state import State
+from promptflow.test.conftest import AppendNode
+
+MAYBE = 'def main(state):\n\treturn state.result != ""\n'
+
+
+class PricedNode(AppendNode):
+    """
+    Costs a fixed price
+    """
+
+    price = 0.0
+
+    def cost(self, state: State) -> float:
+        super().cost(state)
+        return self.price
+
+
+class BrokenPriceNode(AppendNode):
+    """
+    Can't estimate its cost
+    """
+
+    def cost(self, state: State) -> float:
+        raise KeyError("model")
+
+
+@pytest.fixture
+def priced(add_node):
+    def add(label: str, price: float) -> PricedNode:
+        node = add_node(PricedNode, label)
+        node.price = price
+        return node
+
+    return add
+
+
+def test_branches_and_loop(flowchart, add_node, connect, priced):
+    start = add_node(StartNode, "start")
+    a, b, c, d = priced("a", 1), priced("b", 2), priced("c", 4), priced("d", 8)
+    connect(start, a)
+    connect(a, b, MAYBE)
+    connect(a, c, MAYBE)
+    connect(b, d)
+    connect(c, d)
+    connect(d, a, MAYBE)
+    estimate = estimate_cost(flowchart)
+    probability = {node.uid: node.probability for node in estimate.nodes}
+    assert probability == {"start": 1, "a": 1, "b": 0.5, "c": 0.5, "d": 0.75}
+    assert [node.uid for node in estimate.nodes if node.always_runs] == ["start", "a"]
+    assert estimate.cyclic
+    # the loop back to a is counted once, and only a is on every run
+    assert estimate.min_cost == 1
+    assert estimate.expected_cost == pytest.approx(1 + 0.5 * 2 + 0.5 * 4 + 0.75 * 8)
+    assert estimate.max_cost == 15
+
+
+def test_unconditional_branches_always_run(flowchart, add_node, connect, priced):
+    start = add_node(StartNode, "start")
+    a, b = priced("a", 1), priced("b", 2)
+    lonely = priced("lonely", 100)
+    connect(start, a)
+    # the template a new connector starts with always passes
+    connect(start, b, DEFAULT_COND_TEMPLATE)
+    connect(lonely, a)
+    estimate = estimate_cost(flowchart)
+    assert estimate.min_cost == estimate.expected_cost == estimate.max_cost == 3
+    assert not estimate.cyclic
+    assert estimate.unreachable == ["lonely"]
+
+
+def test_nested_conditions(flowchart, add_node, connect, priced):
+    start = add_node(StartNode, "start")
+    a, b = priced("a", 2), priced("b", 4)
+    connect(start, a, MAYBE)
+    connect(a, b, MAYBE)
+    estimate = estimate_cost(flowchart)
+    assert estimate.min_cost == 0
+    assert estimate.expected_cost == pytest.approx(0.5 * 2 + 0.25 * 4)
+    assert estimate.max_cost == 6
+
+
+def test_cost_error_recorded(flowchart, add_node, connect, priced):
+    start = add_node(StartNode, "start")
+    broken = add_node(BrokenPriceNode, "broken")
+    a = priced("a", 1)
+    connect(start, broken)
+    connect(broken, a)
+    estimate = estimate_cost(flowchart)
+    assert estimate.max_cost == 1
+    [error] = [node for node in estimate.nodes if node.error]
+    assert error.uid == "broken"
+    assert error.cost == 0
+
+
+def test_no_start_node(flowchart, priced):
+    priced("a", 1)
+    with pytest.raises(ValueError):
+        estimate_cost(flowchart)
@@ -0,0 +1,55 @@
+"""
+Test that the text exports of a flowchart escape what they contain
+"""
+import networkx as nx
+import pytest
+
+from promptflow.src.exporters import chunked
+from promptflow.src.text_data import TextData
+from promptflow.test.conftest import AppendNode
+
+LABEL = 'say "hi" & <bye>\\now'
+CONDITION = "def main(state):\n\treturn True\n"
+
+
+@pytest.fixture
+def exported(flowchart, add_node, connect):
+    """
+    Two nodes with awkward uids and labels, joined by a labelled branch
+    """
+    first = add_node(AppendNode, "s&1 <a>")
+    second = add_node(AppendNode, 'node "2"')
+    first.label = LABEL
+    connect(first, second, TextData(LABEL, CONDITION, flowchart))
+    return flowchart
+
+
+def test_chunked():
+    assert list(chunked(["ab", "cd", "e"], size=3)) == ["abcd", "e"]
+    assert list(chunked([], size=3)) == []
+
+
+def test_mermaid_ids(exported):
+    lines = exported.to_mermaid().splitlines()
+    assert lines[1] == '\ts_1__a_["say #quot;hi#quot; & <bye>\\now"]'
+    assert lines[3].startswith("\ts_1__a_-->")
+    assert lines[3].endswith("|node__2_")
+
+
+def test_graphml_round_trip(exported):
+    graph = nx.parse_graphml(exported.to_graph_ml())
+    assert set(graph.nodes) == {"s&1 <a>", 'node "2"'}
+    assert graph.nodes["s&1 <a>"]["label"] == LABEL
+    assert graph.nodes["s&1 <a>"]["node_type"] == "AppendNode"
+    assert graph.edges["s&1 <a>", 'node "2"']["label"] == LABEL
+
+
+def test_dot_quoting(exported):
+    dot = exported.to_dot()
+    assert '\t"s&1 <a>" [label="say \\"hi\\" & <bye>\\\\now",' in dot
+    assert '\t"s&1 <a>" -> "node \\"2\\"" [label=' in dot
+
+
+def test_dot_newlines(exported):
+    exported.nodes[0].label = "one\r\ntwo"
+    assert '[label="one\\ntwo",' in exported.to_dot()
@@ -0,0 +1,76 @@
+"""
+Test reading flowchart archives and copying out their embedding files
+"""
+import io
+import json
+import os
+import zipfile
+
+import pytest
+
+from promptflow.src import flowchart_archive
+from promptflow.src.flowchart_archive import (
+    FlowchartArchiveError,
+    embeddings_dir,
+    read_flowchart_archive,
+)
+
+
+def embeddings_flowchart(uid: str, filename: str) -> dict:
+    node = {"node_type": "EmbeddingsIngestNode", "filename": filename}
+    return {"uid": uid, "label": uid, "nodes": [node], "branches": []}
+
+
+def build_archive(files: dict[str, str]) -> io.BytesIO:
+    file = io.BytesIO()
+    with zipfile.ZipFile(file, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    file.seek(0)
+    return file
+
+
+def test_embeddings_dir_absolute(monkeypatch, tmp_path):
+    monkeypatch.delenv("EMBEDDINGS_DIR", raising=False)
+    assert embeddings_dir() == str(flowchart_archive.PROJECT_DIR / "embeddings")
+    monkeypatch.setenv("EMBEDDINGS_DIR", str(tmp_path))
+    assert embeddings_dir() == str(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("EMBEDDINGS_DIR", "data/embeddings")
+    assert os.path.isabs(embeddings_dir())
+    assert not embeddings_dir().startswith(str(tmp_path))
+
+
+def test_embedding_files_kept_per_flowchart(tmp_path):
+    # two exports with a same-named index, each holding different vectors
+    first = build_archive(
+        {
+            "flowcharts/0/flowchart.json": json.dumps(
+                embeddings_flowchart("a", "embeddings/0-index.bin")
+            ),
+            "embeddings/0-index.bin": "first",
+        }
+    )
+    second = build_archive(
+        {
+            "flowcharts/0/flowchart.json": json.dumps(
+                embeddings_flowchart("../b", "embeddings/0-index.bin")
+            ),
+            "embeddings/0-index.bin": "second",
+        }
+    )
+    [a] = read_flowchart_archive(first, str(tmp_path))
+    [b] = read_flowchart_archive(second, str(tmp_path))
+    a_path = a["nodes"][0]["filename"]
+    b_path = b["nodes"][0]["filename"]
+    assert os.path.dirname(a_path) == str(tmp_path / "a")
+    assert os.path.dirname(b_path) == str(tmp_path / "___b")
+    with open(a_path, encoding="utf-8") as f:
+        assert f.read() == "first"
+    with open(b_path, encoding="utf-8") as f:
+        assert f.read() == "second"
+
+
+def test_not_an_archive(tmp_path):
+    with pytest.raises(FlowchartArchiveError):
+        read_flowchart_archive(io.BytesIO(b"not a zip"), str(tmp_path))
@@ -0,0 +1,127 @@
+"""
+Test the per-worker flowchart cache
+"""
+from types import SimpleNamespace
+
+from promptflow.src.flowchart_cache import ExportCache, FlowchartCache
+
+
+class ListeningCache(FlowchartCache):
+    """
+    Behaves as if change broadcasts were being received
+    """
+
+    listening = True
+
+
+class FakeInterface:
+    """
+    Serves flowchart documents, and can announce a change while one loads
+    """
+
+    def __init__(self, cache: FlowchartCache):
+        self.cache = cache
+        self.version = 1
+        self.loads = 0
+        self.change_during_load = False
+
+    def get_flowchart_version(self, uid: str) -> int:
+        return self.version
+
+    def get_flowchart_document(self, uid: str) -> SimpleNamespace:
+        self.loads += 1
+        document = SimpleNamespace(uid=uid, version=self.version)
+        if self.change_during_load:
+            # the flowchart is saved after it was read, before it is cached
+            self.change_during_load = False
+            self.version += 1
+            self.cache.invalidate(uid)
+        return document
+
+    def build_flowchart_from_document(self, document: SimpleNamespace):
+        return document
+
+
+def test_listening_cache_hit():
+    cache = ListeningCache()
+    interface = FakeInterface(cache)
+    assert cache.get("a", interface).version == 1
+    interface.version = 2
+    # trusted until a broadcast evicts it
+    assert cache.get("a", interface).version == 1
+    cache.invalidate("a")
+    assert cache.get("a", interface).version == 2
+    assert interface.loads == 2
+
+
+def test_invalidation_during_load_not_lost():
+    cache = ListeningCache()
+    interface = FakeInterface(cache)
+    interface.change_during_load = True
+    assert cache.get("a", interface).version == 1
+    assert cache.get("a", interface).version == 2
+    assert cache.get("a", interface).version == 2
+    assert interface.loads == 2
+
+
+def test_invalidate_all_during_load_not_lost():
+    cache = ListeningCache()
+    interface = FakeInterface(cache)
+    original = interface.get_flowchart_document
+
+    def load_then_invalidate_all(uid):
+        document = original(uid)
+        interface.version += 1
+        cache.invalidate()
+        return document
+
+    interface.get_flowchart_document = load_then_invalidate_all
+    assert cache.get("a", interface).version == 1
+    interface.get_flowchart_document = original
+    assert cache.get("a", interface).version == 2
+
+
+def test_version_checked_when_not_listening():
+    cache = FlowchartCache()
+    interface = FakeInterface(cache)
+    assert cache.get("a", interface).version == 1
+    assert cache.get("a", interface).version == 1
+    interface.version = 2
+    assert cache.get("a", interface).version == 2
+    assert interface.loads == 2
+
+
+def test_evicts_least_recently_used():
+    cache = ListeningCache(maxsize=2)
+    interface = FakeInterface(cache)
+    for uid in ["a", "b", "a", "c"]:
+        cache.get(uid, interface)
+    assert list(cache._entries) == ["a", "c"]
+
+
+def test_export_cache_by_version():
+    cache = ExportCache()
+    cache.put("graph", "dot", 1, b"one")
+    assert cache.get("graph", "dot", 1) == b"one"
+    assert cache.get("graph", "mermaid", 1) is None
+    # a newer version replaces the export of the old one
+    cache.put("graph", "dot", 2, b"two")
+    assert cache.get("graph", "dot", 1) is None
+    assert cache.get("graph", "dot", 2) == b"two"
+
+
+def test_export_cache_evicts_least_recent():
+    cache = ExportCache(maxsize=2)
+    cache.put("a", "dot", 1, b"a")
+    cache.put("b", "dot", 1, b"b")
+    cache.get("a", "dot", 1)
+    cache.put("c", "dot", 1, b"c")
+    assert cache.get("b", "dot", 1) is None
+    assert cache.get("a", "dot", 1) == b"a"
+    assert cache.get("c", "dot", 1) == b"c"
+
+
+def test_export_cache_disabled():
+    cache = ExportCache(maxsize=0)
+    cache.put("a", "dot", 1, b"a")
+    assert cache.get("a", "dot", 1) is None
@@ -0,0 +1,79 @@
+"""
+Test suspending a run for user input and resuming it once input is posted
+"""
+import asyncio
+
+import pytest
+
+from promptflow.src.flowchart import InputRequired, input_status
+from promptflow.src.nodes.input_node import FileInput, UserInputNode
+from promptflow.src.nodes.start_node import StartNode
+from promptflow.src.state import State
+from promptflow.test.conftest import AppendNode
+
+
+@pytest.fixture
+def input_flowchart(flowchart, add_node, connect):
+    """
+    start -> a -> input -> b, suspending when input is needed
+    """
+    start = add_node(StartNode, "start")
+    a = add_node(AppendNode, "a")
+    user_input = add_node(UserInputNode, "input")
+    b = add_node(AppendNode, "b")
+    connect(start, a)
+    connect(a, user_input)
+    connect(user_input, b)
+    flowchart.suspend_on_input = True
+    return flowchart
+
+
+@pytest.mark.parametrize(
+    "before_result, status",
+    [({"input": ""}, "INPUT_REQUIRED"), ({"filename": ""}, "FILE_INPUT_REQUIRED")],
+)
+def test_input_status(before_result, status):
+    assert input_status(before_result) == status
+
+
+def test_input_status_unknown():
+    with pytest.raises(ValueError):
+        input_status({"other": ""})
+
+
+def test_file_input_status(flowchart, add_node, connect):
+    start = add_node(StartNode, "start")
+    connect(start, add_node(FileInput, "file"))
+    flowchart.suspend_on_input = True
+    with pytest.raises(InputRequired) as suspended:
+        flowchart.run(0, State(), None)
+    assert suspended.value.status == "FILE_INPUT_REQUIRED"
+
+
+def test_suspend_and_resume(input_flowchart):
+    state = State()
+    with pytest.raises(InputRequired) as suspended:
+        input_flowchart.run(0, state, None)
+    assert suspended.value.node.uid == "input"
+    assert suspended.value.status == "INPUT_REQUIRED"
+    assert state.snapshot["ran"] == "a"
+    # the waiting node is back at the head of the queue
+    queue = suspended.value.queue
+    assert queue.get() is suspended.value.node
+    queue.requeue(suspended.value.node)
+
+    input_flowchart.pending_inputs["input"] = "hello "
+    state = input_flowchart.run(0, state, None, queue)
+    assert state.result == "hello b"
+    assert state.snapshot["ran"] == "ab"
+    assert input_flowchart.pending_inputs == {}
+
+
+def test_async_suspend_and_resume(input_flowchart):
+    state = State()
+    with pytest.raises(InputRequired) as suspended:
+        asyncio.run(input_flowchart.arun(0, state, None))
+    input_flowchart.pending_inputs["input"] = "hello "
+    state = asyncio.run(input_flowchart.arun(0, state, None, suspended.value.queue))
+    assert state.result == "hello b"
+    assert state.snapshot["ran"] == "ab"
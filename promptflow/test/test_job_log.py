@@ -0,0 +1,117 @@
+"""
+Test writing job logs in batches from a background thread
+"""
+import logging
+import threading
+import time
+
+import pytest
+
+from promptflow.src.job_log import JobLogWriter
+from promptflow.src.tasks import close_log_writer
+
+
+class FakeInterface:
+    """
+    Keeps the batches of logs written, and can hold writes back or fail them
+    """
+
+    def __init__(self):
+        self.batches: list[list[dict]] = []
+        self.release = threading.Event()
+        self.release.set()
+        self.failures = 0
+
+    def create_job_logs(self, job_id: int, logs: list[dict]) -> None:
+        self.release.wait(timeout=5)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database down")
+        self.batches.append(list(logs))
+
+
+def logs(count: int, start: int = 0) -> list[dict]:
+    return [{"message": str(i)} for i in range(start, start + count)]
+
+
+def test_batches_by_size():
+    interface = FakeInterface()
+    writer = JobLogWriter(interface, 1, batch_size=3, flush_interval=10)
+    for log in logs(7):
+        writer.write(log)
+    writer.close()
+    # the last, partial batch is written by close
+    assert interface.batches == [logs(3), logs(3, 3), logs(1, 6)]
+
+
+def test_batches_by_interval():
+    interface = FakeInterface()
+    writer = JobLogWriter(interface, 1, batch_size=100, flush_interval=0.05)
+    for log in logs(2):
+        writer.write(log)
+    time.sleep(0.3)
+    assert interface.batches == [logs(2)]
+    writer.close()
+    assert interface.batches == [logs(2)]
+
+
+def test_write_blocks_when_buffer_full():
+    interface = FakeInterface()
+    interface.release.clear()
+    writer = JobLogWriter(
+        interface, 1, batch_size=1, flush_interval=0.01, max_pending=2
+    )
+    for log in logs(3):
+        # the first is taken by the writer thread, which is held back
+        writer.write(log)
+    blocked = threading.Thread(target=writer.write, args=(logs(1, 3)[0],))
+    blocked.start()
+    blocked.join(timeout=0.2)
+    assert blocked.is_alive()
+    interface.release.set()
+    blocked.join(timeout=5)
+    assert not blocked.is_alive()
+    writer.close()
+    assert [log for batch in interface.batches for log in batch] == logs(4)
+
+
+def test_write_after_close():
+    writer = JobLogWriter(FakeInterface(), 1)
+    writer.close()
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.write({"message": "late"})
+
+
+def test_retries_before_giving_up():
+    interface = FakeInterface()
+    interface.failures = 1
+    writer = JobLogWriter(interface, 1, flush_interval=0.01, max_attempts=2)
+    writer.write({"message": "0"})
+    writer.close()
+    assert interface.batches == [logs(1)]
+
+
+def test_failed_write_drops_the_rest():
+    interface = FakeInterface()
+    interface.failures = 2
+    writer = JobLogWriter(
+        interface, 1, batch_size=1, flush_interval=0.01, max_attempts=2
+    )
+    for log in logs(3):
+        writer.write(log)
+    with pytest.raises(ConnectionError):
+        writer.close()
+    # later logs aren't written after a gap, they are dropped too
+    assert interface.batches == []
+    assert writer.dropped == 3
+
+
+def test_close_log_writer_reports_dropped(caplog):
+    interface = FakeInterface()
+    interface.failures = 1
+    writer = JobLogWriter(interface, 7, flush_interval=0.01, max_attempts=1)
+    writer.write({"message": "0"})
+    with caplog.at_level(logging.ERROR):
+        close_log_writer(writer)
+    assert "Dropped 1 logs of job 7" in caplog.text
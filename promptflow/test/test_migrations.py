@@ -0,0 +1,152 @@
+"""
+Test ordering and applying schema migrations, without a database
+"""
+from pathlib import Path
+
+import pytest
+
+from promptflow.src.migrations import (
+    MIGRATION_LOCK_ID,
+    MIGRATIONS_DIR,
+    list_migrations,
+    migrate,
+)
+
+
+class FakeCursor:
+    """
+    Records statements, and answers the schema_migrations queries
+    """
+
+    def __init__(self, conn: "FakeConnection"):
+        self.conn = conn
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql: str, params=None) -> None:
+        sql = " ".join(sql.split())
+        self.conn.statements.append((sql, params))
+        if sql.startswith("SELECT to_regclass"):
+            self.result = (self.conn.version is not None,)
+        elif sql.startswith("SELECT COALESCE"):
+            self.result = (self.conn.version,)
+        elif sql == self.conn.fail_on:
+            raise RuntimeError("migration failed")
+        elif sql.startswith("SELECT pg_advisory_unlock") and self.conn.fail_unlock:
+            raise ConnectionError("connection closed")
+        elif sql.startswith("INSERT INTO schema_migrations"):
+            self.conn.pending = params[0]
+
+    def fetchone(self):
+        return self.result
+
+
+class FakeConnection:
+    """
+    Connection whose schema is at a given migration version
+    """
+
+    def __init__(self, version=None, fail_on=None):
+        self.version = version
+        self.pending = None
+        self.fail_on = fail_on
+        self.fail_unlock = False
+        self.statements: list = []
+        self.rollbacks = 0
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+    def commit(self) -> None:
+        if self.pending is not None:
+            self.version = self.pending
+            self.pending = None
+
+    def rollback(self) -> None:
+        self.pending = None
+        self.rollbacks += 1
+
+    def executed(self, prefix: str) -> list:
+        return [sql for sql, _ in self.statements if sql.startswith(prefix)]
+
+
+def write_migrations(directory: Path, *names: str) -> None:
+    for i, name in enumerate(names):
+        (directory / name).write_text(f"CREATE TABLE t{i} (id integer)")
+
+
+def test_list_migrations_ordered(tmp_path):
+    write_migrations(tmp_path, "0010_c.sql", "0002_b.sql", "0001_a.sql")
+    migrations = list_migrations(tmp_path)
+    assert [(m.version, m.name) for m in migrations] == [
+        (1, "a"),
+        (2, "b"),
+        (10, "c"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "names", [["0001_a.sql", "b.sql"], ["0001_a.sql", "0001_b.sql"]]
+)
+def test_list_migrations_rejects(tmp_path, names):
+    write_migrations(tmp_path, *names)
+    with pytest.raises(ValueError):
+        list_migrations(tmp_path)
+
+
+def test_shipped_migrations_are_contiguous():
+    versions = [migration.version for migration in list_migrations(MIGRATIONS_DIR)]
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_migrate_new_database(tmp_path):
+    write_migrations(tmp_path, "0001_a.sql", "0002_b.sql")
+    conn = FakeConnection()
+    applied = migrate(conn, tmp_path)
+    assert [migration.version for migration in applied] == [1, 2]
+    assert conn.version == 2
+    assert conn.executed("SELECT pg_advisory_lock") == ["SELECT pg_advisory_lock(%s)"]
+    assert conn.statements[-1] == (
+        "SELECT pg_advisory_unlock(%s)",
+        (MIGRATION_LOCK_ID,),
+    )
+
+
+def test_migrate_only_newer(tmp_path):
+    write_migrations(tmp_path, "0001_a.sql", "0002_b.sql")
+    conn = FakeConnection(version=1)
+    applied = migrate(conn, tmp_path)
+    assert [migration.version for migration in applied] == [2]
+    assert conn.executed("CREATE TABLE t0") == []
+    assert conn.executed("CREATE TABLE t1") == ["CREATE TABLE t1 (id integer)"]
+
+
+def test_migrate_current_takes_no_lock(tmp_path):
+    write_migrations(tmp_path, "0001_a.sql")
+    conn = FakeConnection(version=1)
+    assert migrate(conn, tmp_path) == []
+    assert conn.executed("SELECT pg_advisory_lock") == []
+
+
+def test_failed_migration_rolled_back(tmp_path):
+    write_migrations(tmp_path, "0001_a.sql", "0002_b.sql")
+    conn = FakeConnection(fail_on="CREATE TABLE t1 (id integer)")
+    with pytest.raises(RuntimeError):
+        migrate(conn, tmp_path)
+    # the first migration stays applied, and the lock is released
+    assert conn.version == 1
+    assert conn.rollbacks == 1
+    assert conn.statements[-1][0] == "SELECT pg_advisory_unlock(%s)"
+
+
+def test_unlock_failure_keeps_migration_error(tmp_path):
+    write_migrations(tmp_path, "0001_a.sql")
+    conn = FakeConnection(fail_on="CREATE TABLE t0 (id integer)")
+    conn.fail_unlock = True
+    with pytest.raises(RuntimeError, match="migration failed"):
+        migrate(conn, tmp_path)
@@ -0,0 +1,119 @@
+"""
+Test caching the outputs of deterministic nodes
+"""
+from typing import Any, Optional
+
+import pytest
+
+from promptflow.src import node_cache
+from promptflow.src.flowchart import Flowchart
+from promptflow.src.node_cache import LRUNodeCache, node_cache_key
+from promptflow.src.nodes.node_base import NodeBase
+from promptflow.src.nodes.start_node import StartNode
+from promptflow.src.state import State
+from promptflow.test.conftest import AppendNode
+
+
+class LookupNode(NodeBase):
+    """
+    Deterministic node that reads one snapshot key, and counts its runs
+    """
+
+    cacheable = True
+    runs = 0
+
+    def run_subclass(self, before_result: Any, state: State) -> dict:
+        LookupNode.runs += 1
+        return {"value": state["key"], "items": [1, 2]}
+
+    def cache_inputs(self, state: State) -> Optional[dict[str, Any]]:
+        return {"snapshot": {"key": state["key"]}}
+
+
+class ObjectNode(LookupNode):
+    """
+    Claims to read something that isn't JSON
+    """
+
+    def cache_inputs(self, state: State) -> Optional[dict[str, Any]]:
+        return {"data": object()}
+
+
+def test_key_stable(add_node):
+    node = add_node(LookupNode, "lookup")
+    first = State(snapshot={"key": "a", "other": "1"})
+    second = State(snapshot={"other": "2", "key": "a"})
+    assert node_cache_key(node, first) == node_cache_key(node, second)
+    second.snapshot["key"] = "b"
+    assert node_cache_key(node, first) != node_cache_key(node, second)
+    second.snapshot["key"] = "a"
+    second.result = "changed"
+    assert node_cache_key(node, first) != node_cache_key(node, second)
+
+
+def test_nodes_not_cached_by_default(flowchart, add_node):
+    flowchart.node_cache = LRUNodeCache()
+    node = add_node(AppendNode, "a", cache=True)
+    assert node_cache_key(node, State()) is None
+    assert flowchart.cache_key(node, State()) is None
+
+
+def test_lru_returns_copies():
+    cache = LRUNodeCache()
+    output = {"items": [1, 2]}
+    cache.set("key", output)
+    output["items"].append(3)
+    cached = cache.get("key")
+    cached["items"].append(4)
+    assert cache.get("key") == {"items": [1, 2]}
+
+
+def test_lru_evicts_oldest():
+    cache = LRUNodeCache(maxsize=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_run_uses_cache(flowchart, add_node, connect):
+    flowchart.node_cache = LRUNodeCache()
+    start = add_node(StartNode, "start")
+    lookup = add_node(LookupNode, "lookup")
+    connect(start, lookup)
+    LookupNode.runs = 0
+    for _ in range(2):
+        state = flowchart.run(0, State(snapshot={"key": "a"}), None)
+        assert state.result == {"value": "a", "items": [1, 2]}
+        state.result["items"].append(3)
+    assert LookupNode.runs == 1
+    assert flowchart.cache_stats.serialize() == {"hits": 1, "misses": 1}
+
+
+def test_unkeyable_node_runs_uncached(flowchart, add_node, connect):
+    flowchart.node_cache = LRUNodeCache()
+    start = add_node(StartNode, "start")
+    node = add_node(ObjectNode, "object")
+    connect(start, node)
+    LookupNode.runs = 0
+    state = flowchart.run(0, State(snapshot={"key": "a"}), None)
+    assert not state.exception
+    assert state.result["value"] == "a"
+    assert LookupNode.runs == 1
+    assert flowchart.cache_stats.serialize() == {"hits": 0, "misses": 0}
+
+
+def test_cache_resolved_on_first_cacheable_node(monkeypatch, add_node):
+    monkeypatch.setenv("NODE_CACHE", "redis")
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.setattr(node_cache, "_default_cache", None)
+    # building a flowchart doesn't need a working cache setting
+    flowchart = Flowchart(None, "lazy")  # type: ignore
+    node = LookupNode(flowchart, "lookup", uid="lookup", node_type_id="lookup")
+    plain = AppendNode(flowchart, "plain", uid="plain", node_type_id="plain")
+    assert flowchart.cache_key(plain, State()) is None
+    with pytest.raises(ValueError):
+        flowchart.cache_key(node, State(snapshot={"key": "a"}))
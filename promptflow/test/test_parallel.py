@@ -0,0 +1,143 @@
+"""
+Test parallel branches, the JoinNode barrier and merging branch states
+"""
+import asyncio
+import threading
+import time
+from typing import Any
+
+from promptflow.src.nodes.join_node import JoinNode
+from promptflow.src.nodes.node_base import NodeBase
+from promptflow.src.nodes.start_node import StartNode
+from promptflow.src.state import State
+from promptflow.test.conftest import AppendNode
+
+
+class BarrierNode(NodeBase):
+    """
+    Waits until every branch has reached the barrier, so it only finishes
+    if the branches run at the same time
+    """
+
+    barrier: threading.Barrier
+
+    def run_subclass(self, before_result: Any, state: State) -> str:
+        self.barrier.wait(timeout=5)
+        state.snapshot[f"{self.label}_done"] = "yes"
+        return self.label
+
+
+class BusyNode(NodeBase):
+    """
+    Takes a while, and records how many nodes were busy at once
+    """
+
+    lock = threading.Lock()
+    busy = 0
+    peak = 0
+
+    def run_subclass(self, before_result: Any, state: State) -> str:
+        with BusyNode.lock:
+            BusyNode.busy += 1
+            BusyNode.peak = max(BusyNode.peak, BusyNode.busy)
+        time.sleep(0.02)
+        with BusyNode.lock:
+            BusyNode.busy -= 1
+        return self.label
+
+
+def test_merge_branches():
+    state = State(snapshot={"a": "1", "b": "2"}, history=[{"content": "base"}])
+    first, second = state.copy(), state.copy()
+    first.snapshot["a"] = "first"
+    first.history.append({"content": "one"})
+    first.result = "x"
+    second.snapshot["a"] = "second"
+    second.snapshot["c"] = "3"
+    second.history.append({"content": "two"})
+    second.result = "y"
+    state.merge([first, second])
+    assert state.snapshot == {"a": "second", "b": "2", "c": "3"}
+    assert [message["content"] for message in state.history] == [
+        "base",
+        "one",
+        "two",
+    ]
+    assert state.result == "x\ny"
+
+
+def test_merge_keeps_unchanged_keys():
+    state = State(snapshot={"a": "1"})
+    first, second = state.copy(), state.copy()
+    first.snapshot["a"] = "changed"
+    state.merge([first, second])
+    # the second branch never wrote a, so it doesn't undo the first branch
+    assert state.snapshot["a"] == "changed"
+
+
+def test_merge_exception():
+    state = State()
+    first, second = state.copy(), state.copy()
+    second.exception = True
+    state.merge([first, second])
+    assert state.exception
+
+
+def build_fork(add_node, connect):
+    start = add_node(StartNode, "start")
+    barrier = threading.Barrier(2)
+    branches = [add_node(BarrierNode, label) for label in ["left", "right"]]
+    join = add_node(JoinNode, "join")
+    end = add_node(AppendNode, "end")
+    for branch in branches:
+        branch.barrier = barrier
+        connect(start, branch)
+        connect(branch, join)
+    connect(join, end)
+    return start.flowchart
+
+
+def test_fork_and_join(add_node, connect):
+    flowchart = build_fork(add_node, connect)
+    state = flowchart.run(0, None, None, max_workers=2)
+    assert not state.exception
+    assert state.snapshot["left_done"] == state.snapshot["right_done"] == "yes"
+    # the join node runs once, after both branches
+    assert state.snapshot["ran"] == "end"
+    assert state.result == "left\nrightend"
+
+
+def test_afork_and_join(add_node, connect):
+    flowchart = build_fork(add_node, connect)
+    state = asyncio.run(flowchart.arun(0, None, None, max_workers=2))
+    assert not state.exception
+    assert state.snapshot["left_done"] == state.snapshot["right_done"] == "yes"
+    assert state.result == "left\nrightend"
+
+
+def test_sequential_without_workers(add_node, connect):
+    start = add_node(StartNode, "start")
+    a, b = (add_node(AppendNode, label) for label in "ab")
+    connect(start, a)
+    connect(start, b)
+    state = start.flowchart.run(0, None, None)
+    assert state.snapshot["ran"] == "ab"
+    assert state.result == "ab"
+
+
+def test_nested_forks_share_workers(add_node, connect):
+    start = add_node(StartNode, "start")
+    leaves = []
+    for i in range(3):
+        branch = add_node(BusyNode, f"branch{i}")
+        connect(start, branch)
+        for j in range(3):
+            leaf = add_node(BusyNode, f"leaf{i}{j}")
+            connect(branch, leaf)
+            leaves.append(leaf)
+    BusyNode.busy = BusyNode.peak = 0
+    state = start.flowchart.run(0, None, None, max_workers=3)
+    assert not state.exception
+    assert all(state.snapshot[leaf.label] == leaf.label for leaf in leaves)
+    # nine leaves at the second level still run at most three at a time
+    assert BusyNode.peak <= 3
@@ -0,0 +1,148 @@
+"""
+Test the SQL side of the database interface with a stub connection
+"""
+import json
+
+import psycopg2.errors
+import pytest
+from pydantic import ValidationError  # pylint: disable=no-name-in-module
+
+from promptflow.src import postgres_interface
+from promptflow.src.flowchart import FlowchartPatch
+from promptflow.src.postgres_interface import (
+    RESUMABLE_STATUSES,
+    FlowchartVersionConflict,
+)
+
+
+def test_claim_job(db, stub_pool):
+    conn = stub_pool.conn
+    conn.results = [(1,)]
+    assert db.claim_job(1, RESUMABLE_STATUSES)
+    update, params = conn.statements[0]
+    assert update.startswith("UPDATE jobs SET current_status = 'PENDING'")
+    assert "current_status = ANY(%s)" in update
+    assert params == (1, list(RESUMABLE_STATUSES))
+    # the status change is recorded in the job's history too
+    assert conn.statements[1][0].startswith("INSERT INTO job_status")
+
+
+def test_claim_job_in_other_status(db, stub_pool):
+    assert not db.claim_job(1, RESUMABLE_STATUSES)
+    assert len(stub_pool.conn.statements) == 1
+
+
+def test_claim_job_input(db, stub_pool):
+    conn = stub_pool.conn
+    conn.results = [(1,), (1,)]
+    assert db.claim_job_input(1, "hello")
+    assert conn.statements[-1][1] == ("hello", 1)
+    assert conn.rollbacks == 0
+
+
+def test_claim_job_input_not_suspended(db, stub_pool):
+    # the job is waiting for input inside a parallel branch
+    conn = stub_pool.conn
+    conn.results = [(1,), None]
+    assert not db.claim_job_input(1, "hello")
+    assert conn.rollbacks == 1
+
+
+def test_flowchart_patch_defaults():
+    patch = FlowchartPatch()
+    assert patch.version is None
+    assert patch.nodes == [] and patch.deleted_nodes == []
+    assert patch.branches == [] and patch.deleted_branches == []
+    # defaults aren't shared between patches
+    patch.nodes.append({"uid": "a"})
+    assert FlowchartPatch().nodes == []
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"version": "latest"},
+        {"nodes": {"uid": "a"}},
+        {"nodes": ["a"]},
+        {"deleted_nodes": "a"},
+        {"branches": [1]},
+    ],
+)
+def test_flowchart_patch_invalid(data):
+    with pytest.raises(ValidationError):
+        FlowchartPatch.parse_obj(data)
+
+
+@pytest.fixture
+def published(monkeypatch) -> list[str]:
+    uids: list[str] = []
+    monkeypatch.setattr(postgres_interface, "publish_flowchart_change", uids.append)
+    return uids
+
+
+def test_patch_flowchart(db, stub_pool, published):
+    conn = stub_pool.conn
+    stub_pool.node_type_ids["InputNode"] = 1
+    conn.results = [(4,)]
+    patch = FlowchartPatch(
+        version=3, nodes=[{"uid": "a", "node_type": "InputNode"}], deleted_nodes=["b"]
+    )
+    assert db.patch_flowchart("graph", patch) == 4
+    sql, params = conn.statements[0]
+    assert sql == "SELECT patch_graph(%s)"
+    data = json.loads(params[0])
+    assert data["uid"] == "graph" and data["version"] == 3
+    # an unset label is left alone rather than cleared
+    assert "label" not in data
+    assert published == ["graph"]
+
+
+def test_patch_flowchart_conflict(db, stub_pool, published):
+    conn = stub_pool.conn
+    conn.errors = [psycopg2.errors.SerializationFailure("graph is at version 5")]
+    with pytest.raises(FlowchartVersionConflict):
+        db.patch_flowchart("graph", FlowchartPatch(version=3))
+    assert conn.rollbacks == 1
+    assert published == []
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        psycopg2.errors.NoDataFound("graph not found"),
+        psycopg2.errors.ForeignKeyViolation("no node c"),
+        psycopg2.errors.UniqueViolation("duplicate node"),
+    ],
+)
+def test_patch_flowchart_invalid(db, stub_pool, published, error):
+    stub_pool.conn.errors = [error]
+    with pytest.raises(ValueError) as info:
+        db.patch_flowchart("graph", FlowchartPatch())
+    assert not isinstance(info.value, FlowchartVersionConflict)
+    assert published == []
+
+
+def test_patch_flowchart_unknown_node_type(db, stub_pool, published):
+    stub_pool.conn.results = [[("InputNode", 1)]]
+    patch = FlowchartPatch(nodes=[{"uid": "a", "node_type": "NoSuchNode"}])
+    with pytest.raises(ValueError):
+        db.patch_flowchart("graph", patch)
+    # the patch is rejected before it is sent
+    assert len(stub_pool.conn.statements) == 1
+
+
+def test_patch_flowchart_other_errors_raise(db, stub_pool, published):
+    stub_pool.conn.errors = [psycopg2.OperationalError("connection lost")]
+    with pytest.raises(psycopg2.OperationalError):
+        db.patch_flowchart("graph", FlowchartPatch())
+
+
+def test_claim_flowchart_render(db, stub_pool):
+    conn = stub_pool.conn
+    conn.results = [(2,), None]
+    assert db.claim_flowchart_render("graph", 2, 300)
+    # another process already queued it
+    assert not db.claim_flowchart_render("graph", 2, 300)
+    sql, params = conn.statements[0]
+    assert "render_version IS DISTINCT FROM version" in sql
+    assert params == ("graph", 2, 300)
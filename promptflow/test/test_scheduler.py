@@ -0,0 +1,141 @@
+"""
+Test the execution plan, the execution queue and the iterative scheduler
+"""
+import pytest
+
+from promptflow.src.nodes.start_node import StartNode
+from promptflow.src.scheduler import ExecutionQueue
+from promptflow.test.conftest import AppendNode, CountNode
+
+
+def test_queue_order_and_dedup(add_node):
+    a, b, c = (add_node(AppendNode, label) for label in "abc")
+    queue = ExecutionQueue([a, b])
+    assert queue.put(c)
+    assert not queue.put(a)
+    assert len(queue) == 3
+    assert [queue.get(), queue.get(), queue.get()] == [a, b, c]
+    assert queue.empty()
+
+
+def test_queue_requeue(add_node):
+    a, b, c = (add_node(AppendNode, label) for label in "abc")
+    queue = ExecutionQueue([a, b])
+    queue.requeue(c)
+    queue.requeue(b)
+    assert [queue.get(), queue.get(), queue.get()] == [b, c, a]
+
+
+def test_queue_frames(add_node, connect):
+    a, b, c = (add_node(AppendNode, label) for label in "abc")
+    ab = connect(a, b)
+    ac = connect(a, c)
+    queue = ExecutionQueue()
+    queue.push_frame(a)
+    assert not queue.done()
+    assert queue.next_connector() is ab
+    assert queue.next_connector() is ac
+    assert queue.next_connector() is None
+    assert queue.done()
+
+
+def test_queue_serialize(flowchart, add_node, connect):
+    a, b, c = (add_node(AppendNode, label) for label in "abc")
+    connect(a, b)
+    connect(a, c)
+    queue = ExecutionQueue([c])
+    queue.push_frame(a)
+    queue.next_connector()
+    restored = ExecutionQueue.deserialize(flowchart, queue.serialize())
+    assert restored.serialize() == {"ready": ["c"], "frames": [["a", 1]]}
+    assert restored.get() is c
+    assert restored.next_connector() is a.output_connectors[1]
+
+
+def test_run_linear(add_node, connect):
+    start = add_node(StartNode, "start")
+    a = add_node(AppendNode, "a")
+    b = add_node(AppendNode, "b")
+    connect(start, a)
+    connect(a, b)
+    state = start.flowchart.run(0, None, None)
+    assert state.result == "ab"
+    assert state.snapshot["ran"] == "ab"
+
+
+def test_run_depth_first(add_node, connect):
+    start = add_node(StartNode, "start")
+    a, b, c, d = (add_node(AppendNode, label) for label in "abcd")
+    connect(start, a)
+    connect(a, b)
+    connect(b, c)
+    connect(a, d)
+    state = start.flowchart.run(0, None, None)
+    # every output connector of a node is evaluated, deepest branch first
+    assert state.snapshot["ran"] == "abcd"
+
+
+def test_run_long_loop_without_recursion(add_node, connect):
+    start = add_node(StartNode, "start")
+    count = add_node(CountNode, "count")
+    end = add_node(AppendNode, "end")
+    connect(start, count)
+    connect(count, count, "def main(state):\n\treturn int(state.result) < 3000\n")
+    connect(count, end, "def main(state):\n\treturn int(state.result) >= 3000\n")
+    state = start.flowchart.run(0, None, None)
+    assert state.result == "3000end"
+
+
+def test_condition_error_skips_remaining_connectors(add_node, connect):
+    start = add_node(StartNode, "start")
+    a, b = (add_node(AppendNode, label) for label in "ab")
+    connect(start, a, "def main(state):\n\treturn 1 / 0\n")
+    connect(start, b)
+    logs = []
+    state = start.flowchart.run(0, None, None, logging_function=logs.append)
+    assert "ran" not in state.snapshot
+    assert any("division by zero" in log for log in logs)
+
+
+def test_plan_graph(flowchart, add_node, connect):
+    start = add_node(StartNode, "start")
+    a, b, c, lonely = (add_node(AppendNode, label) for label in ["a", "b", "c", "z"])
+    start_a = connect(start, a)
+    a_b = connect(a, b)
+    b_a = connect(b, a)
+    b_c = connect(b, c)
+    lonely_c = connect(lonely, c)
+    plan = flowchart.plan
+    assert plan.start_node is start
+    assert plan.nodes_by_uid["b"] is b
+    assert plan.successors[b] == (a, c)
+    assert plan.output_connectors[a] == (a_b,)
+    assert dict(plan.distances) == {start: 0, a: 1, b: 2, c: 3}
+    assert plan.unreachable == (lonely,)
+    assert plan.is_cyclic
+    assert [set(cycle) for cycle in plan.cycles] == [{a, b}]
+    order = plan.topological_order
+    assert order.index(start) < order.index(a) < order.index(c)
+    assert order.index(lonely) < order.index(c)
+    assert plan.sorted_connectors == (start_a, a_b, b_a, b_c, lonely_c)
+
+
+def test_plan_rebuilt_after_change(flowchart, add_node, connect):
+    start = add_node(StartNode, "start")
+    a = add_node(AppendNode, "a")
+    plan = flowchart.plan
+    assert flowchart.plan is plan
+    assert not plan.is_cyclic
+    connect(start, a)
+    assert flowchart.plan is not plan
+    assert flowchart.plan.distances[a] == 1
+    connect(a, a)
+    assert flowchart.plan.is_cyclic
+
+
+def test_plan_without_start_node(flowchart, add_node):
+    add_node(AppendNode, "a")
+    assert flowchart.plan.start_node is None
+    assert not flowchart.plan.distances
+    with pytest.raises(ValueError):
+        flowchart.start_node
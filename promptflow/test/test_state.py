@@ -0,0 +1,169 @@
+"""
+Test counting history tokens and sharing state between forks
+"""
+import pytest
+
+from promptflow.src import state as state_module
+from promptflow.src.nodes.history_node import WindowedHistoryNode
+from promptflow.src.state import History, Snapshot, State
+
+
+class WordCounter:
+    """
+    Counts words instead of tokens, and how many texts it was asked about
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text: str) -> int:
+        self.calls += 1
+        return len(text.split())
+
+
+@pytest.fixture
+def counter(monkeypatch) -> WordCounter:
+    counter = WordCounter()
+    monkeypatch.setattr(state_module, "count_tokens", counter)
+    return counter
+
+
+def message(words: int) -> dict[str, str]:
+    return {"role": "user", "content": " ".join(["word"] * words)}
+
+
+def test_messages_counted_once(counter):
+    history = History([message(1), message(2)])
+    assert history.token_count == 3
+    history.append(message(3))
+    assert history.token_count == 6
+    assert history.token_count == 6
+    assert counter.calls == 3
+
+
+def test_state_recounts_result_after_change(counter):
+    state = State(history=[message(2)], result="one two three")
+    assert state.token_count == 5
+    assert state.token_count == 5
+    assert counter.calls == 2
+    state.result = "one"
+    assert state.token_count == 3
+    assert counter.calls == 3
+
+
+@pytest.mark.parametrize(
+    "max_tokens, start", [(100, 0), (6, 0), (5, 1), (4, 2), (3, 2), (2, 3), (0, 3)]
+)
+def test_window_start(counter, max_tokens, start):
+    history = History([message(1), message(2), message(3)])
+    assert history.window_start(max_tokens) == start
+    assert list(history.window(max_tokens)) == list(history)[start:]
+
+
+def test_window_start_long_history(counter):
+    sizes = [(i * 7) % 5 for i in range(500)]
+    history = History([message(size) for size in sizes])
+    for max_tokens in range(0, sum(sizes) + 2, 13):
+        start = len(sizes)
+        while start > 0 and sum(sizes[start - 1 :]) <= max_tokens:
+            start -= 1
+        assert history.window_start(max_tokens) == start
+
+
+def test_window_keeps_counts(counter):
+    history = History([message(1), message(2), message(3)])
+    history.token_count
+    window = history.window(5)
+    assert window.token_count == 5
+    assert counter.calls == 3
+
+
+def test_mutations_update_totals(counter):
+    history = History([message(1), message(2), message(3)])
+    assert history.token_count == 6
+    history[0] = message(10)
+    assert history.token_count == 15
+    del history[1]
+    assert history.token_count == 13
+    history.insert(0, message(4))
+    assert history.token_count == 17
+    history.clear()
+    assert history.token_count == 0
+
+
+def test_forks_isolated(counter):
+    history = History([message(1), message(2)])
+    fork = history.copy()
+    fork.append(message(3))
+    history.append(message(4))
+    assert list(fork) == [message(1), message(2), message(3)]
+    assert list(history) == [message(1), message(2), message(4)]
+    assert (history.token_count, fork.token_count) == (7, 6)
+    # the shared messages were counted once between the forks
+    assert counter.calls == 4
+    fork[0] = message(5)
+    assert history[0] == message(1)
+    assert (history.token_count, fork.token_count) == (7, 10)
+
+
+def test_merge_keeps_counts(counter):
+    base = State(history=[message(1)])
+    base.token_count
+    branches = [base.copy(), base.copy()]
+    branches[0].history.append(message(2))
+    branches[1].history.append(message(3))
+    assert [branch.history.token_count for branch in branches] == [3, 4]
+    calls = counter.calls
+    base.merge(branches)
+    assert list(base.history) == [message(1), message(2), message(3)]
+    assert base.history.token_count == 6
+    assert counter.calls == calls
+
+
+def test_windowed_history_node(counter, add_node):
+    node = add_node(WindowedHistoryNode, "window", window=5)
+    history = [{"role": "user", "content": "a b"}, {"role": "user", "content": "c"}]
+    state = State(history=[message(4), *history])
+    assert node.run_subclass(None, state) == "user: a b\nuser: c"
+    assert list(state.history) == history
+
+
+def test_snapshot_copy_on_write():
+    items = [1]
+    snapshot = Snapshot({"a": 1, "items": items})
+    copy = snapshot.copy()
+    assert copy._values is snapshot._values
+    copy["b"] = 2
+    assert "b" not in snapshot
+    snapshot["a"] = 3
+    del snapshot["items"]
+    assert dict(copy) == {"a": 1, "items": [1], "b": 2}
+    assert dict(snapshot) == {"a": 3}
+    # only the keys are copied, never the values
+    assert copy["items"] is items
+
+
+def test_snapshot_update_copies():
+    snapshot = Snapshot({"a": 1})
+    copy = snapshot.copy()
+    copy.update(a=2)
+    assert snapshot["a"] == 1
+    assert copy["a"] == 2
+    assert snapshot.get("missing", "default") == "default"
+
+
+def test_state_forks_isolated():
+    base = State(snapshot={"a": "1"}, history=[message(1)], data={"d": 1})
+    fork = base.copy()
+    fork.snapshot["a"] = "2"
+    fork.history.append(message(2))
+    fork.data["d"] = 2
+    assert base["a"] == "1"
+    assert len(base.history) == 1
+    assert base.data == {"d": 1}
+    assert fork.serialize() == {
+        "snapshot": {"a": "2"},
+        "history": [message(1), message(2)],
+        "result": "",
+        "data": {"d": 2},
+    }